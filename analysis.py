@@ -0,0 +1,760 @@
+import contextlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import cached_property
+
+import numpy as np
+
+from metrics import StageTimer
+from startup import lazy_import
+
+# A librosa (com numba e scipy) só é importada no primeiro uso.
+librosa = lazy_import('librosa')
+soundfile = lazy_import('soundfile')
+
+logger = logging.getLogger(__name__)
+
+# Incrementar sempre que o resultado da análise mudar para invalidar caches.
+ANALYSIS_VERSION = 2
+
+SAMPLE_RATE = 22050
+ANALYSIS_DURATION = 60
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MFCC = 40
+CQT_BINS_PER_OCTAVE = 36
+CQT_OCTAVES = 7
+
+NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F',
+         'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+
+# Perfis de decodificação: taxa de amostragem, janela analisada e resampler.
+# O perfil 'fast' decodifica na taxa nativa e reduz a taxa por decimação
+# polifásica quando a razão é inteira (44100 -> 11025), ou com o soxr rápido.
+PROFILES = {
+    'accurate': {'sr': SAMPLE_RATE, 'duration': ANALYSIS_DURATION,
+                 'res_type': 'soxr_hq', 'native_decode': False},
+    'fast': {'sr': 11025, 'duration': 30,
+             'res_type': 'soxr_qq', 'native_decode': True},
+}
+DEFAULT_PROFILE = 'accurate'
+
+# Posição da janela analisada: início do arquivo, após o silêncio inicial
+# ou no trecho mais alto da faixa.
+WINDOW_START = 'start'
+WINDOW_SKIP_SILENCE = 'skip_silence'
+WINDOW_LOUDEST = 'loudest'
+WINDOWS = (WINDOW_START, WINDOW_SKIP_SILENCE, WINDOW_LOUDEST)
+
+SILENCE_DBFS = -50.0
+SILENCE_SCAN_BLOCK = 5.0
+SILENCE_SCAN_LIMIT = 60.0
+LOUDNESS_PROBES = 16
+LOUDNESS_PROBE_SECONDS = 1.0
+
+# Duração de cada bloco (e segmento da linha do tempo) no modo streaming.
+STREAM_SEGMENT_SECONDS = 30
+
+# Compasso assumido ao agrupar as batidas (4/4).
+BEATS_PER_BAR = 4
+
+
+def get_profile(name):
+    if name not in PROFILES:
+        raise ValueError(f'Perfil de análise desconhecido: {name}')
+    return PROFILES[name]
+
+
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def _level_dbfs(y):
+    if not y.size:
+        return -np.inf
+    return float(librosa.amplitude_to_db(np.sqrt(np.mean(y ** 2)), ref=1.0))
+
+
+def find_window_offset(source, duration, window):
+    """
+    Escolhe o início da janela de análise sem decodificar o arquivo inteiro:
+    lê blocos curtos do começo até encontrar som (skip_silence) ou amostra
+    trechos de 1 s espalhados pela faixa e escolhe o mais alto (loudest).
+    """
+    if window == WINDOW_START:
+        return 0.0
+    if window not in WINDOWS:
+        raise ValueError(f'Janela de análise desconhecida: {window}')
+
+    _rewind(source)
+    total = librosa.get_duration(path=source)
+    if total <= duration:
+        return 0.0
+    last_start = total - duration
+
+    if window == WINDOW_SKIP_SILENCE:
+        offset = 0.0
+        while offset < min(total, SILENCE_SCAN_LIMIT):
+            _rewind(source)
+            y, sr = librosa.load(source, sr=None, offset=offset, duration=SILENCE_SCAN_BLOCK)
+            if not y.size:
+                break
+            rms = librosa.feature.rms(y=y, frame_length=N_FFT, hop_length=HOP_LENGTH)[0]
+            audible = np.flatnonzero(librosa.amplitude_to_db(rms, ref=1.0) > SILENCE_DBFS)
+            if audible.size:
+                offset += librosa.frames_to_time(audible[0], sr=sr, hop_length=HOP_LENGTH)
+                return float(min(offset, last_start))
+            offset += SILENCE_SCAN_BLOCK
+        return 0.0
+
+    starts = np.linspace(0.0, total - LOUDNESS_PROBE_SECONDS, LOUDNESS_PROBES)
+    levels = []
+    for start in starts:
+        _rewind(source)
+        y, _ = librosa.load(source, sr=None, offset=float(start), duration=LOUDNESS_PROBE_SECONDS)
+        levels.append(_level_dbfs(y))
+    levels = np.array(levels)
+
+    best_start, best_score = 0.0, -np.inf
+    for start in starts[starts <= last_start]:
+        inside = levels[(starts >= start) & (starts < start + duration)]
+        score = np.mean(inside) if inside.size else -np.inf
+        if score > best_score:
+            best_start, best_score = float(start), score
+    return best_start
+
+
+def load_audio(source, profile=DEFAULT_PROFILE, window=WINDOW_START):
+    """
+    Carrega o áudio (mono) que será analisado, conforme o perfil e a janela.
+    Retorna (sinal, taxa, início da janela em segundos na faixa).
+    """
+    settings = get_profile(profile)
+    duration = settings['duration']
+    offset = find_window_offset(source, duration, window)
+    _rewind(source)
+
+    if not settings['native_decode']:
+        y, sr = librosa.load(source, sr=settings['sr'], offset=offset, duration=duration,
+                             res_type=settings['res_type'])
+        return y, sr, offset
+
+    y, native_sr = librosa.load(source, sr=None, offset=offset, duration=duration)
+    target_sr = settings['sr']
+    if native_sr != target_sr:
+        res_type = 'polyphase' if native_sr % target_sr == 0 else settings['res_type']
+        y = librosa.resample(y, orig_sr=native_sr, target_sr=target_sr, res_type=res_type)
+    return y, target_sr, offset
+
+
+def load_audio_bytes(data, suffix='', profile=DEFAULT_PROFILE, window=WINDOW_START):
+    """
+    Decodifica o áudio direto de um buffer em memória. Quando o decodificador
+    exige um caminho real (por exemplo, o fallback do audioread), grava um
+    arquivo temporário com nome único e o remove em seguida.
+    """
+    get_profile(profile)
+    if window not in WINDOWS:
+        raise ValueError(f'Janela de análise desconhecida: {window}')
+
+    try:
+        return load_audio(io.BytesIO(data), profile=profile, window=window)
+    except Exception as e:
+        logger.debug(f'Decodificação em memória indisponível ({e}); usando arquivo temporário.')
+
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(data)
+    try:
+        return load_audio(tmp.name, profile=profile, window=window)
+    finally:
+        os.remove(tmp.name)
+
+
+# Perfis de Krumhansl-Kessler para C maior e C menor.
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _key_templates():
+    """
+    Monta a matriz 24x12 com os perfis maiores e menores rotacionados para
+    cada tônica, centralizados e normalizados para correlação por produto
+    escalar.
+    """
+    templates = np.array(
+        [np.roll(MAJOR_PROFILE, tonic) for tonic in range(12)] +
+        [np.roll(MINOR_PROFILE, tonic) for tonic in range(12)]
+    )
+    templates -= templates.mean(axis=1, keepdims=True)
+    templates /= np.linalg.norm(templates, axis=1, keepdims=True)
+    return templates
+
+
+KEY_TEMPLATES = _key_templates()
+KEY_NAMES = [f'{note} Major' for note in NOTES] + [f'{note} Minor' for note in NOTES]
+KEY_CANDIDATES = 3
+
+
+def relative_key_index(index):
+    """
+    Índice (em KEY_NAMES) da tonalidade relativa menor/maior.
+    """
+    if index < 12:
+        return 12 + (index + 9) % 12
+    return (index - 12 + 3) % 12
+
+
+def key_scores(chroma):
+    """
+    Correlação de Pearson de um ou vários vetores de croma (12 ou N x 12)
+    com as 24 tonalidades, calculada em uma única multiplicação de matrizes.
+    Retorna uma matriz N x 24.
+    """
+    chroma = np.atleast_2d(np.asarray(chroma, dtype=float))
+    centered = chroma - chroma.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centered, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (centered / norms) @ KEY_TEMPLATES.T
+
+
+def estimate_keys(chroma, candidates=KEY_CANDIDATES):
+    """
+    Estima a tonalidade de um lote de vetores de croma. Para cada vetor
+    retorna a tonalidade, a relativa, a confiança (correlação da melhor
+    tonalidade) e as alternativas ordenadas por correlação.
+    """
+    scores = key_scores(chroma)
+    ranking = np.argsort(-scores, axis=1)[:, :candidates]
+    estimates = []
+    for row, ranked in zip(scores, ranking):
+        best = int(ranked[0])
+        estimates.append({
+            'key': KEY_NAMES[best],
+            'alt_key': KEY_NAMES[relative_key_index(best)],
+            'confidence': round(float(row[best]), 4),
+            'candidates': [{'key': KEY_NAMES[i], 'score': round(float(row[i]), 4)}
+                           for i in ranked],
+        })
+    return estimates
+
+
+def estimate_key(chroma_mean, candidates=KEY_CANDIDATES):
+    return estimate_keys(chroma_mean, candidates)[0]
+
+
+def key_from_chroma(chroma_mean):
+    """
+    Converte o vetor médio de croma na tonalidade e na tonalidade relativa.
+    """
+    estimate = estimate_key(chroma_mean)
+    return estimate['key'], estimate['alt_key']
+
+
+def genre_from_mfcc(mfccs_mean, genre_model):
+    """
+    Classifica o gênero a partir do vetor médio de MFCCs.
+    """
+    try:
+        if not genre_model:
+            return 'Unknown'
+        genre_prediction = genre_model.predict([mfccs_mean])
+        return genre_prediction[0]
+    except Exception:
+        logger.exception('Erro durante a detecção de gênero.')
+        return 'Unknown'
+
+
+def genres_from_mfccs(mfccs_means, genre_model):
+    """
+    Classifica o gênero de vários vetores médios de MFCC numa única chamada
+    ao modelo.
+    """
+    try:
+        if not genre_model:
+            return ['Unknown'] * len(mfccs_means)
+        if hasattr(genre_model, 'predict_batch'):
+            return genre_model.predict_batch(mfccs_means)
+        return [str(genre) for genre in genre_model.predict(np.vstack(mfccs_means))]
+    except Exception:
+        logger.exception('Erro durante a detecção de gênero em lote.')
+        return ['Unknown'] * len(mfccs_means)
+
+
+def feature_vectors(chroma_mean, mfcc_mean):
+    """
+    Vetores médios de croma e de MFCC, devolvidos junto com a análise em
+    'vectors' para o armazenamento de características (não vão na resposta).
+    """
+    return {
+        'chroma_mean': [float(v) for v in chroma_mean],
+        'mfcc_mean': [float(v) for v in mfcc_mean],
+    }
+
+
+class FeatureExtractor(object):
+    """
+    Calcula os intermediários de um sinal (espectrograma, envelope de onset e
+    CQT) uma única vez e deriva deles todas as características da análise.
+    """
+
+    def __init__(self, y, sr):
+        self.y = y
+        self.sr = sr
+
+    @cached_property
+    def spectrogram(self):
+        """Magnitude da STFT, compartilhada por RMS, mel, onset e MFCC."""
+        return np.abs(librosa.stft(self.y, n_fft=N_FFT, hop_length=HOP_LENGTH))
+
+    @cached_property
+    def mel_db(self):
+        """Espectrograma mel em dB, base do envelope de onset e dos MFCCs."""
+        mel = librosa.feature.melspectrogram(S=self.spectrogram ** 2, sr=self.sr)
+        return librosa.power_to_db(mel)
+
+    @cached_property
+    def onset_env(self):
+        return librosa.onset.onset_strength(S=self.mel_db, sr=self.sr)
+
+    @cached_property
+    def cqt(self):
+        return np.abs(librosa.cqt(
+            self.y, sr=self.sr, hop_length=HOP_LENGTH,
+            n_bins=CQT_OCTAVES * CQT_BINS_PER_OCTAVE,
+            bins_per_octave=CQT_BINS_PER_OCTAVE
+        ))
+
+    @cached_property
+    def chroma(self):
+        return librosa.feature.chroma_cqt(
+            C=self.cqt, sr=self.sr, hop_length=HOP_LENGTH,
+            bins_per_octave=CQT_BINS_PER_OCTAVE
+        )
+
+    @cached_property
+    def chroma_mean(self):
+        return np.mean(self.chroma, axis=1)
+
+    @cached_property
+    def mfcc(self):
+        return librosa.feature.mfcc(S=self.mel_db, n_mfcc=N_MFCC)
+
+    @cached_property
+    def mfcc_mean(self):
+        return np.mean(self.mfcc.T, axis=0)
+
+    @cached_property
+    def rms(self):
+        return librosa.feature.rms(S=self.spectrogram, frame_length=N_FFT,
+                                   hop_length=HOP_LENGTH)[0]
+
+    @cached_property
+    def beats(self):
+        """Retorna (tempo, frames das batidas) a partir do envelope de onset."""
+        return librosa.beat.beat_track(
+            onset_envelope=self.onset_env, sr=self.sr, hop_length=HOP_LENGTH
+        )
+
+    def bpm(self):
+        tempo, _ = self.beats
+        return float(np.atleast_1d(tempo)[0])
+
+    @cached_property
+    def key_estimate(self):
+        return estimate_key(self.chroma_mean)
+
+    def key(self):
+        return self.key_estimate['key'], self.key_estimate['alt_key']
+
+    def energy(self):
+        return float(np.mean(self.rms))
+
+    def danceability(self):
+        return float(np.mean(self.onset_env))
+
+    def genre(self, genre_model):
+        return genre_from_mfcc(self.mfcc_mean, genre_model)
+
+
+def beat_sync(features, start=0.0):
+    """
+    Croma, RMS e força de onset médios entre batidas consecutivas (o trecho
+    antes da primeira batida é o primeiro intervalo). Retorna um dicionário
+    de arrays: 'times' (início de cada intervalo em segundos, somado a
+    `start`), 'chroma' (intervalos x 12), 'rms' e 'onset'.
+    """
+    _, beats = features.beats
+    n_frames = min(features.chroma.shape[1], features.rms.size, features.onset_env.size)
+    boundaries = librosa.util.fix_frames(np.asarray(beats, dtype=int), x_min=0, x_max=n_frames)
+    return {
+        'times': librosa.frames_to_time(boundaries[:-1], sr=features.sr, hop_length=HOP_LENGTH) + start,
+        'chroma': librosa.util.sync(features.chroma[:, :n_frames], boundaries).T,
+        'rms': librosa.util.sync(features.rms[:n_frames], boundaries),
+        'onset': librosa.util.sync(features.onset_env[:n_frames], boundaries),
+    }
+
+
+def merge_beat_sync(parts):
+    """
+    Concatena os resultados de beat_sync de blocos consecutivos.
+    """
+    return {name: np.concatenate([part[name] for part in parts]) for name in ('times', 'chroma', 'rms', 'onset')}
+
+
+def bars_from_beats(beats, beats_per_bar=BEATS_PER_BAR):
+    """
+    Agrupa as características por batida (beat_sync) em compassos de
+    `beats_per_bar` batidas: médias de croma, RMS e onset, e o início da
+    primeira batida de cada compasso.
+    """
+    count = len(beats['times'])
+    starts = np.arange(0, count, beats_per_bar)
+    if not count:
+        return {name: value[:0] for name, value in beats.items()}
+    sizes = np.diff(np.append(starts, count))
+
+    def mean(values):
+        return np.add.reduceat(values, starts, axis=0) / sizes.reshape((-1,) + (1,) * (values.ndim - 1))
+
+    return {
+        'times': beats['times'][starts],
+        'chroma': mean(beats['chroma']),
+        'rms': mean(beats['rms']),
+        'onset': mean(beats['onset']),
+    }
+
+
+def analyze_signal(y, sr, genre_model=None, on_feature=None, timer=None, start=0.0):
+    """
+    Executa a análise completa de um sinal já carregado e retorna um
+    dicionário com tipos nativos do Python. Se `on_feature` for informado,
+    ele é chamado com (nome, valor) assim que cada característica fica pronta;
+    com `timer` (StageTimer), a duração de cada estágio é registrada. `start`
+    é a posição do sinal na faixa (início da janela), somada aos tempos das
+    batidas.
+    """
+    timer = timer or StageTimer()
+    features = FeatureExtractor(y, sr)
+    result = {}
+
+    def emit(name, value):
+        result[name] = value
+        if on_feature:
+            on_feature(name, value)
+
+    with timer.stage('stft'):
+        features.spectrogram
+    with timer.stage('onset'):
+        features.onset_env
+    with timer.stage('beat_track'):
+        bpm = features.bpm()
+    emit('bpm', bpm)
+
+    with timer.stage('chroma_cqt'):
+        features.chroma
+    with timer.stage('key'):
+        estimate = features.key_estimate
+    emit('key', estimate['key'])
+    emit('alt_key', estimate['alt_key'])
+    emit('key_confidence', estimate['confidence'])
+    emit('key_candidates', estimate['candidates'])
+
+    with timer.stage('rms'):
+        energy = features.energy()
+    emit('energy', energy)
+    emit('danceability', features.danceability())
+
+    with timer.stage('mfcc'):
+        features.mfcc_mean
+    with timer.stage('genre_model'):
+        genre = str(features.genre(genre_model))
+    emit('genre', genre)
+    result['vectors'] = feature_vectors(features.chroma_mean, features.mfcc_mean)
+    with timer.stage('beat_sync'):
+        result['beat_sync'] = beat_sync(features, start)
+    return result
+
+
+def extract_features(y, sr, on_feature=None, timer=None, start=0.0):
+    """
+    Parte por faixa da análise: calcula BPM, energia e dançabilidade e deixa
+    os vetores médios de croma e de MFCC para finish_features, que conclui
+    a tonalidade e o gênero de várias faixas de uma vez (micro-batching).
+    """
+    timer = timer or StageTimer()
+    features = FeatureExtractor(y, sr)
+    result = {}
+
+    def emit(name, value):
+        result[name] = value
+        if on_feature:
+            on_feature(name, value)
+
+    with timer.stage('stft'):
+        features.spectrogram
+    with timer.stage('onset'):
+        features.onset_env
+    with timer.stage('beat_track'):
+        bpm = features.bpm()
+    emit('bpm', bpm)
+
+    with timer.stage('chroma_cqt'):
+        result['chroma_mean'] = features.chroma_mean.tolist()
+
+    with timer.stage('rms'):
+        energy = features.energy()
+    emit('energy', energy)
+    emit('danceability', features.danceability())
+
+    with timer.stage('mfcc'):
+        result['mfcc_mean'] = features.mfcc_mean.tolist()
+    with timer.stage('beat_sync'):
+        result['beat_sync'] = beat_sync(features, start)
+    return result
+
+
+def finish_features(partials, genre_model=None):
+    """
+    Conclui um lote de resultados de extract_features: a croma de todas as
+    faixas é empilhada e normalizada de uma vez e correlacionada com as 24
+    tonalidades numa única multiplicação, e o modelo de gênero recebe todos
+    os vetores de MFCC numa única chamada. Retorna os resultados na ordem
+    recebida, no mesmo formato de analyze_signal.
+    """
+    if not partials:
+        return []
+    estimates = estimate_keys(np.vstack([p['chroma_mean'] for p in partials]))
+    genres = genres_from_mfccs([p['mfcc_mean'] for p in partials], genre_model)
+    results = []
+    for partial, estimate, genre in zip(partials, estimates, genres):
+        result = {name: value for name, value in partial.items()
+                  if name not in ('chroma_mean', 'mfcc_mean')}
+        result.update({
+            'key': estimate['key'],
+            'alt_key': estimate['alt_key'],
+            'key_confidence': estimate['confidence'],
+            'key_candidates': estimate['candidates'],
+            'genre': str(genre),
+            'vectors': feature_vectors(partial['chroma_mean'], partial['mfcc_mean']),
+        })
+        results.append(result)
+    return results
+
+
+WARM_UP_SECONDS = 2.0
+
+
+def warm_up_kernels(genre_model=None):
+    """
+    Executa a análise completa sobre um sinal sintético curto em cada perfil,
+    forçando a compilação JIT (numba) dos kernels da librosa antes da
+    primeira requisição real.
+    """
+    for settings in PROFILES.values():
+        sr = settings['sr']
+        t = np.arange(int(WARM_UP_SECONDS * sr)) / sr
+        # Acorde de dó maior com cliques a 120 BPM, em float32 como no load.
+        y = sum(np.sin(2 * np.pi * f * t) for f in (261.63, 329.63, 392.0)) / 3
+        y[(t * 2 % 1) < 0.01] += 1.0
+        analyze_signal(y.astype(np.float32), sr, genre_model)
+
+
+class StreamAccumulator(object):
+    """
+    Acumula somas e contagens de frames das características de cada bloco,
+    para que as médias globais sejam obtidas sem guardar o sinal inteiro.
+    """
+
+    def __init__(self):
+        self.chroma_sum = np.zeros(12)
+        self.chroma_frames = 0
+        self.mfcc_sum = np.zeros(N_MFCC)
+        self.mfcc_frames = 0
+        self.rms_sum = 0.0
+        self.rms_frames = 0
+        self.onset_sum = 0.0
+        self.onset_frames = 0
+
+    def add(self, features):
+        self.chroma_sum += features.chroma.sum(axis=1)
+        self.chroma_frames += features.chroma.shape[1]
+        self.mfcc_sum += features.mfcc.sum(axis=1)
+        self.mfcc_frames += features.mfcc.shape[1]
+        self.rms_sum += float(features.rms.sum())
+        self.rms_frames += features.rms.size
+        self.onset_sum += float(features.onset_env.sum())
+        self.onset_frames += features.onset_env.size
+
+    @property
+    def chroma_mean(self):
+        return self.chroma_sum / max(self.chroma_frames, 1)
+
+    @property
+    def mfcc_mean(self):
+        return self.mfcc_sum / max(self.mfcc_frames, 1)
+
+    @property
+    def energy(self):
+        return self.rms_sum / max(self.rms_frames, 1)
+
+    @property
+    def danceability(self):
+        return self.onset_sum / max(self.onset_frames, 1)
+
+
+# Estágios calculados para cada bloco no modo streaming (estágio, atributo).
+STREAM_STAGES = [
+    ('stft', 'spectrogram'),
+    ('onset', 'onset_env'),
+    ('beat_track', 'beats'),
+    ('chroma_cqt', 'chroma'),
+    ('key', 'key_estimate'),
+    ('rms', 'rms'),
+    ('mfcc', 'mfcc'),
+]
+
+
+def weighted_median(values, weights):
+    order = np.argsort(values)
+    values = np.asarray(values)[order]
+    cumulative = np.cumsum(np.asarray(weights)[order])
+    return float(values[np.searchsorted(cumulative, cumulative[-1] / 2.0)])
+
+
+def _ffmpeg_blocks(source, sr, block_samples):
+    """
+    Decodifica a fonte com o ffmpeg (mono, float32, na taxa `sr`) por um
+    pipe e gera blocos de `block_samples` amostras, para os formatos que o
+    soundfile não lê (webm/opus, m4a). Objetos de arquivo são gravados
+    antes num arquivo temporário, já que o contêiner mp4 exige busca.
+    """
+    if hasattr(source, 'read'):
+        _rewind(source)
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            shutil.copyfileobj(source, tmp)
+        try:
+            yield from _ffmpeg_blocks(tmp.name, sr, block_samples)
+        finally:
+            os.remove(tmp.name)
+        return
+    if not shutil.which('ffmpeg'):
+        raise ValueError('Formato de áudio não suportado na análise da faixa completa sem o ffmpeg.')
+
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            ['ffmpeg', '-loglevel', 'error', '-i', source, '-f', 'f32le', '-ac', '1', '-ar', str(sr), 'pipe:1'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr
+        )
+        try:
+            while True:
+                data = process.stdout.read(4 * block_samples)
+                if not data:
+                    break
+                yield np.frombuffer(data, dtype='<f4')
+            if process.wait() != 0:
+                stderr.seek(0)
+                message = stderr.read().decode('utf-8', errors='replace').strip()
+                raise RuntimeError(f'Erro do ffmpeg ao decodificar o áudio: {message}')
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+
+
+def analyze_stream(source, genre_model=None, profile=DEFAULT_PROFILE,
+                   segment_seconds=STREAM_SEGMENT_SECONDS, on_feature=None, timer=None):
+    """
+    Analisa a faixa inteira bloco a bloco com librosa.stream, mantendo o uso
+    de memória constante independentemente da duração. Cada bloco corresponde
+    a um segmento da linha do tempo (BPM, tonalidade e energia ao longo da
+    faixa); as médias globais vêm dos acumuladores. A fonte é um caminho ou
+    objeto de arquivo; o que o soundfile não lê é decodificado pelo ffmpeg.
+    """
+    settings = get_profile(profile)
+    sr = settings['sr']
+    _rewind(source)
+    try:
+        # Mesma leitura do librosa.stream (só soundfile, sem o audioread).
+        native_sr = soundfile.info(source).samplerate
+    except Exception as e:
+        logger.debug(f'Formato não lido pelo soundfile ({e}); decodificando com o ffmpeg.')
+        native_sr = sr
+        blocks = _ffmpeg_blocks(source, sr, int(segment_seconds * sr))
+    else:
+        block_samples = int(segment_seconds * native_sr)
+        _rewind(source)
+        blocks = librosa.stream(source, block_length=1, frame_length=block_samples,
+                                hop_length=block_samples, mono=True)
+
+    result = {}
+
+    def emit(name, value):
+        result[name] = value
+        if on_feature:
+            on_feature(name, value)
+
+    timer = timer or StageTimer()
+    totals = StreamAccumulator()
+    timeline = []
+    beat_parts = []
+    start = 0.0
+    # Fecha o gerador (e o ffmpeg) também quando a análise de um bloco falha.
+    with contextlib.closing(blocks):
+        while True:
+            with timer.stage('decode'):
+                block = next(blocks, None)
+                if block is None:
+                    break
+                block_duration = len(block) / native_sr
+                y = block
+                if native_sr != sr:
+                    y = librosa.resample(block, orig_sr=native_sr, target_sr=sr,
+                                         res_type=settings['res_type'])
+            if len(y) >= N_FFT:
+                features = FeatureExtractor(y, sr)
+                for stage, name in STREAM_STAGES:
+                    with timer.stage(stage):
+                        getattr(features, name)
+                totals.add(features)
+                with timer.stage('beat_sync'):
+                    beat_parts.append(beat_sync(features, start))
+                key, _ = features.key()
+                segment = {
+                    'start': round(start, 2),
+                    'end': round(start + block_duration, 2),
+                    'bpm': round(features.bpm(), 2),
+                    'key': key,
+                    'energy': round(features.energy(), 4),
+                }
+                timeline.append(segment)
+                emit('segment', segment)
+            start += block_duration
+
+    if not timeline:
+        raise ValueError('Áudio curto demais para análise.')
+
+    emit('duration', round(start, 2))
+    emit('bpm', weighted_median([s['bpm'] for s in timeline],
+                                [s['end'] - s['start'] for s in timeline]))
+    estimate = estimate_key(totals.chroma_mean)
+    emit('key', estimate['key'])
+    emit('alt_key', estimate['alt_key'])
+    emit('key_confidence', estimate['confidence'])
+    emit('key_candidates', estimate['candidates'])
+    emit('energy', totals.energy)
+    emit('danceability', totals.danceability)
+    with timer.stage('genre_model'):
+        genre = str(genre_from_mfcc(totals.mfcc_mean, genre_model))
+    emit('genre', genre)
+    result.pop('segment', None)
+    result['timeline'] = timeline
+    result['vectors'] = feature_vectors(totals.chroma_mean, totals.mfcc_mean)
+    result['beat_sync'] = merge_beat_sync(beat_parts)
+    return result
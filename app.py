@@ -1,22 +1,95 @@
 import os
-from flask import Flask, render_template, request, jsonify, send_from_directory
-import librosa
+from flask import (Flask, render_template, request, jsonify, send_file, send_from_directory, Response,
+                   stream_with_context, g, has_request_context)
 import numpy as np
 import logging
-import yt_dlp
 import re
 import unicodedata
-import joblib  
+import threading
+import concurrent.futures
+import json
+import uuid
+import time
+
+from analysis import (FeatureExtractor, ANALYSIS_VERSION, DEFAULT_PROFILE, KEY_NAMES, PROFILES, WINDOW_START,
+                      WINDOWS)
+from cache import AnalysisCache, hash_bytes, hash_stream
+from workers import (AnalysisPool, JobAbandoned, PoolFullError, analyze_bytes, analyze_file,
+                     analyze_full_bytes, analyze_full_file, fingerprint_bytes)
+from jobs import JobStore, DONE
+from batching import BatchingPool
+from downloads import DownloadCache, DownloadFailed, download_key
+from fingerprint import FingerprintIndex
+from feature_store import FeatureStore, feature_vector
+from harmonic import DEFAULT_LIMIT, DEFAULT_TOLERANCE, HarmonicIndex, camelot
+from beat_timeline import RESOLUTIONS, TimelineStore, decode as decode_timeline, shift as shift_beats
+from batch import ResultWriter, iter_audio_files, load_completed, output_format, run_batch
+from metrics import MetricsRegistry, StageTimer, AUDIO_DURATION_BUCKETS
+from genre import GenreModel, model_version
+from startup import Readiness, ensure_loaded, lazy_import, warm_up
+
+# Módulos pesados importados só no primeiro uso (ou no aquecimento).
+yt_dlp = lazy_import('yt_dlp')
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # Limite de 100MB
+app.config['CACHE_PATH'] = os.path.join('cache', 'analysis.sqlite')
+app.config['CACHE_MEMORY_ENTRIES'] = 256
+app.config['CACHE_DISK_ENTRIES'] = 10000
+app.config['CACHE_MAX_AGE'] = 30 * 24 * 3600  # 30 dias
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+app.config['ANALYSIS_QUEUE_DEPTH'] = int(os.environ.get('ANALYSIS_QUEUE_DEPTH', 2 * app.config['ANALYSIS_WORKERS']))
+app.config['ANALYSIS_TIMEOUT'] = float(os.environ.get('ANALYSIS_TIMEOUT', 120))
+app.config['ANALYSIS_FULL_TIMEOUT'] = float(os.environ.get('ANALYSIS_FULL_TIMEOUT', 900))
+app.config['ANALYSIS_RETRY_AFTER'] = int(os.environ.get('ANALYSIS_RETRY_AFTER', 5))
+# Decodifica os envios direto da memória em vez de salvá-los em UPLOAD_FOLDER.
+app.config['ANALYZE_IN_MEMORY'] = os.environ.get('ANALYZE_IN_MEMORY', '1') == '1'
+app.config['JOB_TTL'] = 3600  # Jobs concluídos ficam disponíveis por 1 hora
+app.config['BATCH_ROOT'] = os.environ.get('BATCH_ROOT', 'library')
+app.config['RESULTS_FOLDER'] = 'results'
+# Tamanho máximo dos áudios baixados do YouTube mantidos em UPLOAD_FOLDER.
+app.config['DOWNLOAD_CACHE_MAX_BYTES'] = int(os.environ.get('DOWNLOAD_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# Tempo (s) em que um áudio devolvido pelo cache não pode ser despejado: cobre
+# a espera na fila e a análise da faixa completa que ainda vão abri-lo.
+app.config['DOWNLOAD_CACHE_MIN_AGE'] = float(os.environ.get('DOWNLOAD_CACHE_MIN_AGE',
+                                                            app.config['ANALYSIS_FULL_TIMEOUT']))
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Envia o cabeçalho X-Timing em todas as respostas (também pode ser pedido
+# por requisição com ?timing=1 ou com o cabeçalho X-Timing: 1).
+app.config['TIMING_HEADER'] = os.environ.get('TIMING_HEADER', '0') == '1'
+# Aquecimento na inicialização: 'background' (thread, /ready responde 503 até
+# terminar), 'blocking' (antes de aceitar requisições) ou 'off' (tudo sob demanda).
+app.config['WARMUP'] = os.environ.get('WARMUP', 'background')
+# Compila os kernels numba da librosa com um sinal sintético em cada processo.
+app.config['WARMUP_JIT'] = os.environ.get('WARMUP_JIT', '1') == '1'
+# Micro-batching: a tonalidade e o gênero de análises concluídas dentro de
+# MICRO_BATCH_WAIT_MS (até MICRO_BATCH_SIZE por lote) são calculados juntos.
+# Janelas maiores formam lotes maiores (vazão) e acrescentam latência.
+app.config['MICRO_BATCH'] = os.environ.get('MICRO_BATCH', '0') == '1'
+app.config['MICRO_BATCH_SIZE'] = int(os.environ.get('MICRO_BATCH_SIZE', 16))
+app.config['MICRO_BATCH_WAIT_MS'] = float(os.environ.get('MICRO_BATCH_WAIT_MS', 10))
+# Índice de impressões digitais: outra codificação de um áudio já analisado
+# (MP3 128k/320k, download do YouTube) reaproveita o resultado.
+app.config['FINGERPRINT_ENABLED'] = os.environ.get('FINGERPRINT_ENABLED', '1') == '1'
+app.config['FINGERPRINT_PATH'] = os.path.join('cache', 'fingerprints.sqlite')
+# Vetores de características das faixas analisadas, para a busca por
+# faixas parecidas (/similar/tracks).
+app.config['FEATURES_ENABLED'] = os.environ.get('FEATURES_ENABLED', '1') == '1'
+app.config['FEATURES_PATH'] = os.path.join('cache', 'features')
+# Índice por tonalidade (roda de Camelot) e BPM para /harmonic.
+app.config['HARMONIC_ENABLED'] = os.environ.get('HARMONIC_ENABLED', '1') == '1'
+app.config['HARMONIC_PATH'] = os.path.join('cache', 'harmonic.sqlite')
+# Linha do tempo por batida e por compasso (croma, RMS e onset) para /timeline.
+app.config['BEAT_TIMELINE_ENABLED'] = os.environ.get('BEAT_TIMELINE_ENABLED', '1') == '1'
+app.config['BEAT_TIMELINE_PATH'] = os.path.join('cache', 'timelines')
 
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['RESULTS_FOLDER'], exist_ok=True)
 
 class YTDLPLogger(object):
     def debug(self, msg):
@@ -34,6 +107,13 @@ class YTDLPLogger(object):
     def critical(self, msg):
         logger.critical(msg)
 
+download_cache = DownloadCache(
+    app.config['UPLOAD_FOLDER'],
+    max_bytes=app.config['DOWNLOAD_CACHE_MAX_BYTES'],
+    min_age=app.config['DOWNLOAD_CACHE_MIN_AGE'],
+    ydl_options={'logger': YTDLPLogger(), 'quiet': True, 'no_warnings': True}
+)
+
 def sanitize_filename(name):
     """
     Sanitiza o nome do arquivo removendo caracteres inválidos.
@@ -46,41 +126,32 @@ def detect_key(y, sr):
     """
     Detecta a tonalidade e escala da música usando a biblioteca librosa.
     """
-    chromagram = librosa.feature.chroma_cqt(y=y, sr=sr)
-    chroma_mean = np.mean(chromagram, axis=1)
-    notes = ['C', 'C#', 'D', 'D#', 'E', 'F',
-             'F#', 'G', 'G#', 'A', 'A#', 'B']
-    max_note = chroma_mean.argmax()
-    key = notes[max_note]
-
-    if max_note in [0, 5, 7]:  # C, F, G
-        scale = 'Major'
-    else:
-        scale = 'Minor'
-
-    key_full = f'{key} {scale}'
-
-    alt_note = (max_note + 9) % 12  # Relativo menor/maior
-    alt_scale = 'Minor' if scale == 'Major' else 'Major'
-    alt_key_full = f'{notes[alt_note]} {alt_scale}'
-
-    return key_full, alt_key_full
+    return FeatureExtractor(y, sr).key()
 
 def detect_genre(y, sr):
     """
     Detecta o gênero musical usando um modelo pré-treinado.
     """
-    try:
-        if not genre_model:
-            return 'Unknown'
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=40)
-        mfccs_mean = np.mean(mfccs.T, axis=0)
-        
-        genre_prediction = genre_model.predict([mfccs_mean])
-        return genre_prediction[0]
-    except Exception as e:
-        logger.exception('Erro durante a detecção de gênero.')
-        return 'Unknown'
+    return FeatureExtractor(y, sr).genre(get_genre_model())
+
+def unique_upload_path(filename):
+    """
+    Gera um caminho único na pasta de uploads, evitando que envios
+    simultâneos com o mesmo nome sobrescrevam um ao outro.
+    """
+    return os.path.join(app.config['UPLOAD_FOLDER'], f'{uuid.uuid4().hex}_{filename}')
+
+def remove_upload(filepath):
+    """
+    Remove um arquivo temporário da pasta de uploads, se ainda existir.
+    """
+    if filepath is None:
+        return
+    if os.path.exists(filepath):
+        os.remove(filepath)
+        logger.debug(f'Arquivo removido: {filepath}')
+    else:
+        logger.warning(f'Arquivo não encontrado para remoção: {filepath}')
 
 def convert_to_serializable(obj):
     """
@@ -93,12 +164,330 @@ def convert_to_serializable(obj):
     return obj
 
 MODEL_PATH = 'genre_classifier.pkl'  
-if os.path.exists(MODEL_PATH):
-    genre_model = joblib.load(MODEL_PATH)
-    logger.debug('Modelo de gênero carregado com sucesso.')
-else:
-    genre_model = None
-    logger.warning('Modelo de gênero não encontrado. Gênero será definido como "Unknown".')
+genre_model = None
+genre_model_lock = threading.Lock()
+
+def get_genre_model():
+    """
+    Carrega o modelo de gênero no primeiro uso, e não na importação do app;
+    depois disso, recarrega-o quando o arquivo é substituído.
+    """
+    global genre_model
+    with genre_model_lock:
+        if genre_model is None:
+            genre_model = GenreModel(MODEL_PATH)
+    genre_model.maybe_reload()
+    return genre_model
+
+def get_model_version():
+    """
+    Identifica a versão do modelo de gênero pelo tamanho e data de modificação.
+    """
+    return model_version(MODEL_PATH)
+
+analysis_cache = AnalysisCache(
+    app.config['CACHE_PATH'],
+    max_memory_entries=app.config['CACHE_MEMORY_ENTRIES'],
+    max_disk_entries=app.config['CACHE_DISK_ENTRIES'],
+    max_age=app.config['CACHE_MAX_AGE']
+)
+
+fingerprint_index = (FingerprintIndex(app.config['FINGERPRINT_PATH'])
+                     if app.config['FINGERPRINT_ENABLED'] else None)
+
+feature_store = FeatureStore(app.config['FEATURES_PATH']) if app.config['FEATURES_ENABLED'] else None
+
+harmonic_index = HarmonicIndex(app.config['HARMONIC_PATH']) if app.config['HARMONIC_ENABLED'] else None
+
+timeline_store = (TimelineStore(app.config['BEAT_TIMELINE_PATH'])
+                  if app.config['BEAT_TIMELINE_ENABLED'] else None)
+
+jobs = JobStore(ttl=app.config['JOB_TTL'])
+# Arquivos de resultado com um lote em andamento: um job por arquivo, para
+# que as linhas de dois jobs não se intercalem.
+batch_outputs = set()
+batch_outputs_lock = threading.Lock()
+
+metrics = MetricsRegistry(enabled=app.config['METRICS_ENABLED'])
+requests_total = metrics.counter(
+    'unspokenfreq_requests_total', 'Requisições HTTP por rota e status.', ['endpoint', 'status'])
+request_seconds = metrics.histogram(
+    'unspokenfreq_request_duration_seconds', 'Duração das requisições HTTP.', labelnames=['endpoint'])
+stage_seconds = metrics.histogram(
+    'unspokenfreq_stage_duration_seconds', 'Duração de cada estágio da análise e do download.',
+    labelnames=['stage'])
+cache_lookups_total = metrics.counter(
+    'unspokenfreq_cache_lookups_total', 'Consultas ao cache de análise.', ['result'])
+download_lookups_total = metrics.counter(
+    'unspokenfreq_download_cache_lookups_total',
+    'Consultas ao cache de downloads (hit, miss ou shared).', ['result'])
+errors_total = metrics.counter(
+    'unspokenfreq_errors_total', 'Erros por rota e tipo.', ['endpoint', 'kind'])
+audio_duration_seconds = metrics.histogram(
+    'unspokenfreq_audio_duration_seconds', 'Duração do áudio analisado.', AUDIO_DURATION_BUCKETS)
+fingerprint_lookups_total = metrics.counter(
+    'unspokenfreq_fingerprint_lookups_total',
+    'Consultas ao índice de impressões digitais (hit reaproveita a análise).', ['result'])
+micro_batch_size = metrics.histogram(
+    'unspokenfreq_micro_batch_size', 'Análises concluídas por lote no micro-batching.',
+    (1, 2, 4, 8, 16, 32, 64))
+
+def record_stuck_job(stuck):
+    errors_total.inc(endpoint='analysis_pool', kind='stuck')
+
+def record_micro_batch(size, seconds):
+    micro_batch_size.observe(size)
+    stage_seconds.observe(seconds, stage='micro_batch')
+
+def record_analysis_metrics(analysis, elapsed=None):
+    """
+    Registra os tempos por estágio devolvidos pelo processo de trabalho e a
+    duração do áudio; `elapsed` (tempo total do job) permite medir o tempo
+    gasto na fila e na comunicação com o pool.
+    """
+    timings = analysis.pop('timings', {})
+    audio_duration = analysis.pop('audio_duration', None)
+    if elapsed is not None:
+        timings['pool_overhead'] = max(elapsed - sum(timings.values()), 0.0)
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=stage)
+    if audio_duration is not None:
+        audio_duration_seconds.observe(audio_duration)
+    # Jobs assíncronos terminam fora do contexto da requisição.
+    if has_request_context() and 'timer' in g:
+        g.timer.timings.update(timings)
+
+def remember_fingerprint(analysis, cache_key, label=''):
+    """
+    Indexa a impressão digital devolvida pelo processo de trabalho junto com
+    o resultado da análise, para que outras codificações do mesmo áudio o
+    reaproveitem. A faixa é identificada pelo hash do conteúdo (a parte da
+    chave do cache antes dos parâmetros).
+    """
+    fingerprint = analysis.pop('fingerprint', None)
+    if 'fingerprint_match' in analysis:
+        fingerprint_lookups_total.inc(result='hit')
+        return
+    if fingerprint is None or fingerprint_index is None or not cache_key:
+        return
+    fingerprint_lookups_total.inc(result='miss')
+    content_key, _, params = cache_key.partition('?')
+    try:
+        track = fingerprint_index.add(content_key, fingerprint['hashes'], fingerprint['offsets'], label)
+        fingerprint_index.set_result(track, params, analysis)
+    except Exception:
+        logger.exception('Erro ao gravar no índice de impressões digitais.')
+
+def track_id(analysis, cache_key):
+    """
+    Id da faixa nos índices: o hash do conteúdo, ou o da gravação já
+    indexada quando a análise foi reaproveitada pela impressão digital.
+    """
+    if 'fingerprint_match' in analysis:
+        return analysis['fingerprint_match']['key']
+    return cache_key.partition('?')[0] if cache_key else None
+
+def timeline_track(cache_key):
+    """
+    Id da linha do tempo da gravação: o hash do próprio conteúdo, mesmo
+    quando a análise foi reaproveitada de outra gravação.
+    """
+    return cache_key.partition('?')[0] if cache_key else None
+
+def remember_features(analysis, cache_key, label=''):
+    """
+    Grava o vetor de características da faixa no armazenamento usado por
+    /similar/tracks. Análises reaproveitadas pela impressão digital não
+    trazem o vetor: a gravação original já está no armazenamento.
+    """
+    vector = feature_vector(analysis)
+    analysis.pop('vectors', None)
+    if vector is None or feature_store is None or not cache_key:
+        return
+    try:
+        feature_store.add(track_id(analysis, cache_key), vector, analysis['bpm'], analysis['key'], label)
+    except Exception:
+        logger.exception('Erro ao gravar no armazenamento de características.')
+
+def remember_harmony(analysis, cache_key, label=''):
+    """
+    Indexa a tonalidade e o BPM da faixa para as consultas de /harmonic.
+    """
+    if harmonic_index is None or not cache_key or 'fingerprint_match' in analysis:
+        return
+    try:
+        harmonic_index.add(track_id(analysis, cache_key), analysis['key'], analysis['bpm'], label)
+    except Exception:
+        logger.exception('Erro ao gravar no índice harmônico.')
+
+def remember_timeline(analysis, cache_key):
+    """
+    Grava a linha do tempo por batida e por compasso servida por /timeline,
+    sempre com o id da própria gravação (timeline_track): numa análise
+    reaproveitada pela impressão digital, é a linha do tempo da gravação
+    original deslocada pelo offset da correspondência, já que outra
+    introdução desloca todas as batidas.
+    """
+    beats = analysis.pop('beat_sync', None)
+    if timeline_store is None or not cache_key:
+        return
+    match = analysis.get('fingerprint_match')
+    try:
+        if beats is None and match is not None:
+            original = timeline_store.load(match['key'])
+            beats = shift_beats(original, match.get('offset', 0.0)) if original is not None else None
+        if beats is not None:
+            timeline_store.save(timeline_track(cache_key), beats)
+    except Exception:
+        logger.exception('Erro ao gravar a linha do tempo por batida.')
+
+def index_analysis(analysis, cache_key, label=''):
+    """
+    Grava a análise concluída nos índices (características, tonalidade e
+    BPM, linha do tempo por batida, impressão digital), removendo dela os
+    campos internos.
+    """
+    remember_features(analysis, cache_key, label)
+    remember_harmony(analysis, cache_key, label)
+    remember_timeline(analysis, cache_key)
+    remember_fingerprint(analysis, cache_key, label)
+
+def timing_requested():
+    return (app.config['TIMING_HEADER'] or request.args.get('timing') == '1'
+            or request.headers.get('X-Timing') == '1')
+
+@app.before_request
+def start_request_timer():
+    g.timer = StageTimer()
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_start' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.endpoint or 'unknown'
+    request_seconds.observe(elapsed, endpoint=endpoint)
+    requests_total.inc(endpoint=endpoint, status=response.status_code)
+    if timing_requested():
+        parts = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in g.timer.timings.items()]
+        parts.append(f'total;dur={elapsed * 1000:.1f}')
+        response.headers['X-Timing'] = ', '.join(parts)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Rota com as métricas no formato texto do Prometheus.
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+analysis_pool = None
+analysis_pool_lock = threading.Lock()
+
+def get_analysis_pool():
+    """
+    Cria o pool de análise no primeiro uso, evitando fork durante a importação.
+    """
+    global analysis_pool
+    with analysis_pool_lock:
+        if analysis_pool is None:
+            analysis_pool = AnalysisPool(
+                MODEL_PATH,
+                workers=app.config['ANALYSIS_WORKERS'],
+                max_queue=app.config['ANALYSIS_QUEUE_DEPTH'],
+                timeout=app.config['ANALYSIS_TIMEOUT'],
+                warm_up=app.config['WARMUP_JIT'],
+                fingerprint_path=app.config['FINGERPRINT_PATH'] if app.config['FINGERPRINT_ENABLED'] else None,
+                on_stuck=record_stuck_job
+            )
+            if app.config['MICRO_BATCH']:
+                analysis_pool = BatchingPool(
+                    analysis_pool,
+                    get_genre_model,
+                    max_batch=app.config['MICRO_BATCH_SIZE'],
+                    max_wait=app.config['MICRO_BATCH_WAIT_MS'] / 1000.0,
+                    on_batch=record_micro_batch
+                )
+        return analysis_pool
+
+readiness = Readiness()
+
+def start_warm_up():
+    """
+    Importa os módulos adiados e cria o pool de análise (cujos processos
+    carregam o modelo e compilam os kernels), conforme o modo WARMUP.
+    """
+    mode = app.config['WARMUP']
+    if mode == 'off':
+        return
+    steps = [
+        ('imports', lambda: ensure_loaded('yt_dlp')),
+        ('analysis_pool', get_analysis_pool),
+    ]
+    if app.config['MICRO_BATCH']:
+        # No micro-batching o gênero é classificado no processo principal.
+        steps.append(('genre_model', get_genre_model))
+    warm_up(readiness, steps, background=mode != 'blocking')
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Rota de prontidão: 200 quando o aquecimento terminou, 503 enquanto isso.
+    """
+    state = readiness.to_dict()
+    return jsonify(state), 200 if state['ready'] else 503
+
+def format_analysis(analysis, track=None, timeline=None):
+    """
+    Monta a resposta JSON da análise, incluindo o prompt para o Suno.ai;
+    `track` é o id da faixa usado nas buscas por faixas parecidas e
+    `timeline` o id da linha do tempo da gravação em /timeline (informado
+    à parte quando difere de `track`).
+    """
+    key = analysis['key']
+    alt_key = analysis['alt_key']
+    bpm = round(analysis['bpm'], 2)
+    energy = round(analysis['energy'], 4)
+    danceability = round(analysis['danceability'], 4)
+    genre = analysis['genre']
+    happiness = 'High' if 'Major' in key else 'Low'
+
+    prompt = (
+        f"key of {key}, BPM of {bpm}. "
+        f"energy {energy}, danceability {danceability}, Genre: {genre}"
+    )
+
+    result = {
+        'Key': key,
+        'Alt Key': alt_key,
+        'BPM': bpm,
+        'Energy': energy,
+        'Danceability': danceability,
+        'Happiness': happiness,
+        'Genre': genre,
+        'Prompt': prompt
+    }
+    if 'key_confidence' in analysis:
+        result['Key Confidence'] = analysis['key_confidence']
+        result['Key Candidates'] = analysis['key_candidates']
+    if 'timeline' in analysis:
+        result['Duration'] = analysis['duration']
+        result['Timeline'] = analysis['timeline']
+    if track:
+        result['Track'] = track
+    if timeline and timeline != track:
+        result['Timeline Track'] = timeline
+    if 'fingerprint_match' in analysis:
+        match = analysis['fingerprint_match']
+        result['Fingerprint Match'] = {
+            'Track': match['key'],
+            'Label': match['label'],
+            'Score': match['score'],
+            'Coverage': match['coverage'],
+            'Offset': match.get('offset', 0.0),
+        }
+    return result
 
 @app.route('/')
 def index():
@@ -107,6 +496,64 @@ def index():
     """
     return render_template('index.html')
 
+def analysis_response(job_fn, job_args, cache_key, filepath=None, timeout=None, label='', extra=None):
+    """
+    Executa a análise no pool (ou a enfileira como job, no modo assíncrono)
+    e monta a resposta, gravando o resultado no cache. `filepath` é o
+    arquivo temporário a remover ao final; `extra` são campos adicionais
+    incluídos na resposta.
+    """
+    try:
+        if wants_async():
+            return job_accepted(submit_analysis_job(job_fn, job_args, cache_key, filepath, timeout,
+                                                    extra=extra, label=label))
+
+        start = time.perf_counter()
+        analysis = get_analysis_pool().run(job_fn, *job_args, timeout=timeout)
+        record_analysis_metrics(analysis, time.perf_counter() - start)
+        index_analysis(analysis, cache_key, (extra or {}).get('Title') or label)
+        logger.debug(f'Arquivo analisado: {label}')
+
+        result = format_analysis(analysis, track_id(analysis, cache_key), timeline_track(cache_key))
+        logger.debug(f'BPM detectado: {result["BPM"]}')
+        logger.debug(f'Tonalidade detectada: {result["Key"]}')
+        logger.debug(f'Tonalidade alternativa detectada: {result["Alt Key"]}')
+        logger.debug(f'Energia: {result["Energy"]}')
+        logger.debug(f'Dançabilidade: {result["Danceability"]}')
+        logger.debug(f'Gênero detectado: {result["Genre"]}')
+        logger.debug(f'Happiness: {result["Happiness"]}')
+        logger.debug(f'Prompt gerado para Suno.ai: {result["Prompt"]}')
+
+        remove_upload(filepath)
+
+        if cache_key:
+            try:
+                analysis_cache.set(cache_key, result)
+            except Exception:
+                logger.exception('Erro ao gravar no cache de análise.')
+
+        return jsonify({**result, 'Cached': False, **(extra or {})})
+
+    except PoolFullError:
+        logger.warning('Fila de análise cheia; requisição recusada.')
+        errors_total.inc(endpoint='analyze', kind='pool_full')
+        remove_upload(filepath)
+        response = jsonify({'error': 'Servidor ocupado. Tente novamente em instantes.'})
+        response.headers['Retry-After'] = str(app.config['ANALYSIS_RETRY_AFTER'])
+        return response, 503
+
+    except concurrent.futures.TimeoutError:
+        logger.error(f'Tempo limite excedido na análise de {label}.')
+        errors_total.inc(endpoint='analyze', kind='timeout')
+        remove_upload(filepath)
+        return jsonify({'error': 'Tempo limite excedido durante a análise do áudio.'}), 504
+
+    except Exception as e:
+        logger.exception('Erro durante a análise do áudio.')
+        errors_total.inc(endpoint='analyze', kind='analysis')
+        remove_upload(filepath)
+        return jsonify({'error': f'Erro durante a análise do áudio: {str(e)}'}), 500
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
     """
@@ -122,71 +569,360 @@ def analyze():
         logger.error('Nenhum arquivo selecionado.')
         return jsonify({'error': 'Nenhum arquivo selecionado.'}), 400
 
+    try:
+        profile, window, full = analysis_options()
+    except ValueError as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), 400
+
     if file:
+        try:
+            with g.timer.stage('read'):
+                data = file.read()
+        except Exception as e:
+            logger.exception('Erro ao ler o arquivo enviado.')
+            errors_total.inc(endpoint='analyze', kind='read')
+            return jsonify({'error': f'Erro ao ler o arquivo: {str(e)}'}), 500
+
+        try:
+            with g.timer.stage('cache_lookup'):
+                cache_key = analysis_cache.make_key(
+                    hash_bytes(data),
+                    profile=profile,
+                    window='full' if full else window,
+                    model=get_model_version(),
+                    version=ANALYSIS_VERSION
+                )
+                cached = analysis_cache.get(cache_key)
+        except Exception:
+            logger.exception('Erro ao consultar o cache de análise.')
+            errors_total.inc(endpoint='analyze', kind='cache')
+            cache_key, cached = None, None
+
+        cache_lookups_total.inc(result='hit' if cached is not None else 'miss')
+        if cached is not None:
+            logger.debug(f'Resultado encontrado no cache: {cache_key}')
+            if wants_async():
+                job = jobs.create('analyze')
+                job.finish({**cached, 'Cached': True})
+                return job_accepted(job)
+            return jsonify({**cached, 'Cached': True})
+
         filename = sanitize_filename(file.filename)  
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepath = None
         try:
-            file.save(filepath)
-            logger.debug(f'Arquivo salvo em: {filepath}')
+            timeout = app.config['ANALYSIS_FULL_TIMEOUT' if full else 'ANALYSIS_TIMEOUT']
+            if app.config['ANALYZE_IN_MEMORY']:
+                if full:
+                    job_fn, job_args = analyze_full_bytes, (data, profile)
+                else:
+                    job_fn = analyze_bytes
+                    job_args = (data, os.path.splitext(filename)[1], profile, window)
+                logger.debug(f'Analisando {filename} direto da memória ({len(data)} bytes).')
+            else:
+                filepath = unique_upload_path(filename)
+                with open(filepath, 'wb') as f:
+                    f.write(data)
+                logger.debug(f'Arquivo salvo em: {filepath}')
+                if full:
+                    job_fn, job_args = analyze_full_file, (filepath, profile)
+                else:
+                    job_fn, job_args = analyze_file, (filepath, profile, window)
 
-            try:
-                y, sr = librosa.load(filepath, duration=60)
-                logger.debug(f'Arquivo carregado: {filepath}')
+            return analysis_response(job_fn, job_args, cache_key, filepath, timeout, filename)
 
-                bpm, _ = librosa.beat.beat_track(y=y, sr=sr)
-                bpm = round(float(bpm), 2)
-                logger.debug(f'BPM detectado: {bpm}')
+        except Exception as e:
+            logger.exception('Erro ao salvar o arquivo.')
+            errors_total.inc(endpoint='analyze', kind='save')
+            return jsonify({'error': f'Erro ao salvar o arquivo: {str(e)}'}), 500
 
-                key, alt_key = detect_key(y, sr)
-                logger.debug(f'Tonalidade detectada: {key}')
-                logger.debug(f'Tonalidade alternativa detectada: {alt_key}')
+def resolve_batch_path(path):
+    """
+    Resolve um caminho do servidor dentro de BATCH_ROOT, recusando caminhos
+    que escapem do diretório permitido.
+    """
+    root = os.path.realpath(app.config['BATCH_ROOT'])
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root:
+        raise ValueError(f'Caminho fora do diretório permitido: {path}')
+    return full_path
 
-                energy = round(float(np.mean(librosa.feature.rms(y=y))), 4)
-                logger.debug(f'Energia: {energy}')
+def claim_batch_output(output_path):
+    """
+    Reserva o arquivo de resultado de um lote; retorna False se outro job
+    ainda grava nele.
+    """
+    with batch_outputs_lock:
+        if output_path in batch_outputs:
+            return False
+        batch_outputs.add(output_path)
+        return True
 
-                onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-                danceability = round(float(np.mean(onset_env)), 4)
-                logger.debug(f'Dançabilidade: {danceability}')
+def release_batch_output(output_path):
+    with batch_outputs_lock:
+        batch_outputs.discard(output_path)
 
-                genre = detect_genre(y, sr)
-                logger.debug(f'Gênero detectado: {genre}')
+def batch_output_path(output):
+    if output_format(output) == 'jsonl' and not output.lower().endswith('.jsonl'):
+        output = f'{output}.jsonl'
+    return os.path.join(app.config['RESULTS_FOLDER'], output)
 
-                happiness = 'High' if 'Major' in key else 'Low'
-                logger.debug(f'Happiness: {happiness}')
+def run_batch_job(job, items, output_path, uploaded, profile, window):
+    """
+    Executa um job de análise em lote no pool, gravando os resultados de
+    forma incremental, indexando cada faixa e publicando o progresso. O
+    arquivo de resultado, reservado pela rota, é liberado ao final.
+    """
+    pool = get_analysis_pool()
+    job.start()
 
-                prompt = (
-                    f"key of {key}, BPM of {bpm}. "
-                    f"energy {energy}, danceability {danceability}, Genre: {genre}"
-                )
-                logger.debug(f'Prompt gerado para Suno.ai: {prompt}')
+    def progress(completed, total, row):
+        job.publish('progress', {'completed': completed, 'total': total, 'path': row['path']})
 
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    logger.debug(f'Arquivo removido: {filepath}')
-                else:
-                    logger.warning(f'Arquivo não encontrado para remoção: {filepath}')
-
-                return jsonify({
-                    'Key': key,
-                    'Alt Key': alt_key,
-                    'BPM': bpm,
-                    'Energy': energy,
-                    'Danceability': danceability,
-                    'Happiness': happiness,
-                    'Genre': genre,
-                    'Prompt': prompt
-                })
-
-            except Exception as e:
-                logger.exception('Erro durante a análise do áudio.')
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    logger.debug(f'Arquivo removido após erro: {filepath}')
-                return jsonify({'error': f'Erro durante a análise do áudio: {str(e)}'}), 500
+    def index(path, label, analysis):
+        # Mesma chave de /analyze (hash do conteúdo), para que as faixas do
+        # lote entrem nos mesmos índices com o mesmo id.
+        try:
+            with open(path, 'rb') as f:
+                content_key = hash_stream(f)
+            cache_key = analysis_cache.make_key(content_key, profile=profile, window=window,
+                                                model=get_model_version(), version=ANALYSIS_VERSION)
+        except Exception:
+            logger.exception(f'Erro ao indexar {label} no job {job.id}.')
+            return
+        index_analysis(analysis, cache_key, label)
 
+    try:
+        with ResultWriter(output_path) as writer:
+            completed, errors = run_batch(
+                items,
+                lambda path: pool.submit(analyze_file, path, profile, window, block=True),
+                writer,
+                progress=progress,
+                window=pool.workers,
+                on_result=index
+            )
+        job.finish({
+            'filename': os.path.basename(output_path),
+            'download_url': f'/jobs/{job.id}/file',
+            'completed': completed,
+            'errors': errors
+        })
+    except Exception as e:
+        logger.exception(f'Erro no job de análise em lote {job.id}.')
+        job.fail(f'Erro durante a análise em lote: {str(e)}')
+    finally:
+        release_batch_output(output_path)
+        for path in uploaded:
+            remove_upload(path)
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Rota para analisar vários arquivos de uma vez: enviados pelo formulário
+    (music_files) ou caminhos do servidor em JSON (paths/directory).
+    Retorna um job; execuções repetidas com o mesmo 'output' retomam do
+    ponto em que pararam, e 409 enquanto outro job grava nesse 'output'.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        profile, window, _ = analysis_options()
+    except ValueError as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), 400
+
+    output = sanitize_filename(data.get('output') or request.form.get('output') or '')
+    items = []
+    uploaded = []
+
+    try:
+        for path in data.get('paths', []):
+            full_path = resolve_batch_path(path)
+            items.append((full_path, path))
+        if data.get('directory'):
+            directory = resolve_batch_path(data['directory'])
+            root = os.path.realpath(app.config['BATCH_ROOT'])
+            items.extend((p, os.path.relpath(p, root)) for p in iter_audio_files(directory))
+    except ValueError as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), 400
+
+    for file in request.files.getlist('music_files'):
+        if not file or file.filename == '':
+            continue
+        filepath = unique_upload_path(sanitize_filename(file.filename))
+        file.save(filepath)
+        uploaded.append(filepath)
+        items.append((filepath, file.filename))
+
+    if not items:
+        logger.error('Nenhum arquivo enviado para análise em lote.')
+        return jsonify({'error': 'Nenhum arquivo enviado.'}), 400
+
+    output_path = batch_output_path(output) if output else None
+    if output_path and not claim_batch_output(output_path):
+        for path in uploaded:
+            remove_upload(path)
+        logger.error(f'Já existe um lote em andamento gravando em {output}.')
+        return jsonify({'error': 'Já existe um lote em andamento com esta saída.'}), 409
+
+    job = jobs.create('batch')
+    if not output_path:
+        output_path = batch_output_path(f'batch-{job.id}.jsonl')
+        claim_batch_output(output_path)
+
+    done = load_completed(output_path)
+    pending = [(path, label) for path, label in items if label not in done]
+    logger.debug(f'Lote {job.id}: {len(pending)} arquivo(s) pendente(s), {len(items) - len(pending)} já analisado(s).')
+
+    threading.Thread(target=run_batch_job, args=(job, pending, output_path, uploaded, profile, window),
+                     daemon=True).start()
+    return job_accepted(job)
+
+def download_youtube_mp3(youtube_url, progress_hook=None):
+    """
+    Retorna o MP3 de um vídeo do YouTube na pasta de uploads, baixando-o só
+    se ainda não estiver no cache. Retorna a entrada do cache ('filename',
+    'title', ...).
+    """
+    entry, status = download_cache.get(youtube_url, 'mp3', progress_hook)
+    download_lookups_total.inc(result=status)
+    logger.debug(f'Download de {youtube_url} ({status}): {entry["filename"]}')
+    return entry
+
+def send_download(entry):
+    """
+    Envia um áudio do cache de downloads com o título do vídeo como nome.
+    """
+    return send_from_directory(directory=app.config['UPLOAD_FOLDER'],
+                               path=entry['filename'],
+                               as_attachment=True,
+                               download_name=f"{sanitize_filename(entry['title'])}.mp3",
+                               mimetype='audio/mpeg')
+
+def wants_async():
+    """
+    Indica se o cliente pediu o modo assíncrono (?async=1 ou campo 'async').
+    """
+    value = request.args.get('async') or request.form.get('async')
+    if value is None and request.is_json:
+        value = (request.get_json(silent=True) or {}).get('async')
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def analysis_options():
+    """
+    Lê o perfil, a janela e o modo de faixa completa (full) da requisição
+    (query string, formulário ou JSON), validando os valores.
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data or {}
+    profile = request.args.get('profile') or request.form.get('profile') or data.get('profile') or DEFAULT_PROFILE
+    window = request.args.get('window') or request.form.get('window') or data.get('window') or WINDOW_START
+    full = request.args.get('full') or request.form.get('full') or data.get('full')
+    if profile not in PROFILES:
+        raise ValueError(f'Perfil de análise desconhecido: {profile}')
+    if window not in WINDOWS:
+        raise ValueError(f'Janela de análise desconhecida: {window}')
+    return profile, window, str(full).lower() in ('1', 'true', 'yes')
+
+def job_accepted(job):
+    """
+    Resposta 202 de um job assíncrono com os links de acompanhamento.
+    """
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/jobs/{job.id}',
+        'stream_url': f'/jobs/{job.id}/stream'
+    }), 202
+
+def submit_analysis_job(job_fn, job_args, cache_key, filepath=None, timeout=None, job=None, extra=None,
+                        label=''):
+    """
+    Enfileira a análise como job assíncrono (criado aqui, ou `job` quando já
+    existe); os resultados parciais são repassados ao job conforme o
+    processo de trabalho os calcula.
+    """
+    pool = get_analysis_pool()
+    job = job or jobs.create('analyze')
+    pool.subscribe(job.id, job.publish)
+    start = time.perf_counter()
+    try:
+        future = pool.submit(job_fn, *job_args, job.id)
+    except Exception:
+        pool.unsubscribe(job.id)
+        job.fail('Servidor ocupado. Tente novamente em instantes.')
+        raise
+
+    def on_timeout():
+        if not future.done():
+            logger.error(f'Tempo limite excedido no job {job.id}.')
+            errors_total.inc(endpoint='analyze', kind='timeout')
+            job.fail('Tempo limite excedido durante a análise do áudio.')
+            pool.abandon(future)
+
+    timer = threading.Timer(timeout or app.config['ANALYSIS_TIMEOUT'], on_timeout)
+    timer.daemon = True
+    timer.start()
+
+    def on_done(future):
+        timer.cancel()
+        pool.unsubscribe(job.id)
+        remove_upload(filepath)
+        if future.cancelled() or isinstance(future.exception(), JobAbandoned):
+            return  # Descartado na fila pelo tempo limite; o job já falhou.
+        try:
+            analysis = future.result()
+            record_analysis_metrics(analysis, time.perf_counter() - start)
+            index_analysis(analysis, cache_key, (extra or {}).get('Title') or label)
+            result = format_analysis(analysis, track_id(analysis, cache_key), timeline_track(cache_key))
         except Exception as e:
-            logger.exception('Erro ao salvar o arquivo.')
-            return jsonify({'error': f'Erro ao salvar o arquivo: {str(e)}'}), 500
+            logger.exception(f'Erro durante a análise do áudio no job {job.id}.')
+            errors_total.inc(endpoint='analyze', kind='analysis')
+            job.fail(f'Erro durante a análise do áudio: {str(e)}')
+            return
+        if cache_key:
+            try:
+                analysis_cache.set(cache_key, result)
+            except Exception:
+                logger.exception('Erro ao gravar no cache de análise.')
+        job.finish({**result, 'Cached': False, **(extra or {})})
+
+    future.add_done_callback(on_done)
+    return job
+
+def run_download_job(job, youtube_url, from_native=False):
+    """
+    Executa o download de um job assíncrono, publicando o progresso. Com
+    `from_native`, espera antes o áudio original (o download da análise em
+    andamento é compartilhado pelo cache) e gera o MP3 a partir dele.
+    """
+    def progress_hook(status):
+        if status.get('status') == 'downloading':
+            total = status.get('total_bytes') or status.get('total_bytes_estimate')
+            if total:
+                job.publish('progress', round(100.0 * status.get('downloaded_bytes', 0) / total, 1))
+
+    job.start()
+    try:
+        start = time.perf_counter()
+        if from_native:
+            download_cache.get(youtube_url, 'native', progress_hook)
+        entry = download_youtube_mp3(youtube_url, progress_hook)
+        stage_seconds.observe(time.perf_counter() - start, stage='download')
+        job.finish({'filename': entry['filename'], 'title': entry['title'],
+                    'download_url': f'/jobs/{job.id}/file'})
+    except DownloadFailed as e:
+        errors_total.inc(endpoint='download', kind='download')
+        job.fail(str(e))
+    except yt_dlp.utils.DownloadError as e:
+        logger.exception('Erro específico durante o download do YouTube.')
+        errors_total.inc(endpoint='download', kind='youtube')
+        job.fail(f'Erro específico durante o download do YouTube: {str(e)}')
+    except Exception as e:
+        logger.exception('Erro inesperado durante o download do YouTube.')
+        errors_total.inc(endpoint='download', kind='unexpected')
+        job.fail(f'Erro inesperado durante o download do YouTube: {str(e)}')
 
 @app.route('/download', methods=['POST'])
 def download():
@@ -201,66 +937,388 @@ def download():
     youtube_url = data['youtube_url']
     logger.debug(f'URL recebida para download: {youtube_url}')
 
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': os.path.join(app.config['UPLOAD_FOLDER'], '%(title)s.%(ext)s'),
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '320', 
-        }],
-        'logger': YTDLPLogger(),
-        'quiet': True,
-        'no_warnings': True,
-        'restrictfilenames': True,
-    }
+    if wants_async():
+        job = jobs.create('download')
+        threading.Thread(target=run_download_job, args=(job, youtube_url), daemon=True).start()
+        return job_accepted(job)
+
+    try:
+        with g.timer.stage('download'):
+            entry = download_youtube_mp3(youtube_url)
+        stage_seconds.observe(g.timer.timings['download'], stage='download')
+        return send_download(entry)
+
+    except DownloadFailed as e:
+        errors_total.inc(endpoint='download', kind='download')
+        return jsonify({'error': str(e)}), 500
+    except yt_dlp.utils.DownloadError as e:
+        logger.exception('Erro específico durante o download do YouTube.')
+        errors_total.inc(endpoint='download', kind='youtube')
+        return jsonify({'error': f'Erro específico durante o download do YouTube: {str(e)}'}), 500
+    except Exception as e:
+        logger.exception('Erro inesperado durante o download do YouTube.')
+        errors_total.inc(endpoint='download', kind='unexpected')
+        return jsonify({'error': f'Erro inesperado durante o download do YouTube: {str(e)}'}), 500
+
+def start_mp3_job(youtube_url, from_native=True):
+    """
+    Gera o MP3 em segundo plano e retorna os links para acompanhá-lo. Com
+    `from_native`, o job espera o download do áudio original (o mesmo da
+    análise, nunca um segundo download) e converte o MP3 a partir dele.
+    """
+    job = jobs.create('download')
+    threading.Thread(target=run_download_job, args=(job, youtube_url, from_native), daemon=True).start()
+    return {'MP3 Job': f'/jobs/{job.id}', 'MP3 URL': f'/jobs/{job.id}/file'}
+
+def run_youtube_analysis_job(job, youtube_url, profile, window, full, cache_key, timeout, extra):
+    """
+    Baixa o áudio original do vídeo, publicando o progresso, e enfileira a
+    análise no mesmo job.
+    """
+    def progress_hook(status):
+        if status.get('status') == 'downloading':
+            total = status.get('total_bytes') or status.get('total_bytes_estimate')
+            if total:
+                job.publish('download_progress', round(100.0 * status.get('downloaded_bytes', 0) / total, 1))
 
+    job.start()
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(youtube_url, download=True)
-            title = info_dict.get('title', None)
-            if not title:
-                logger.error('Título do vídeo não encontrado.')
-                return jsonify({'error': 'Falha ao obter o título do vídeo.'}), 500
-
-            ext = info_dict.get('ext', 'mp3')
-            filename = f"{sanitize_filename(title)}.{ext}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-            files = os.listdir(app.config['UPLOAD_FOLDER'])
-            logger.debug(f'Arquivos na pasta uploads após download: {files}')
-
-            for file in files:
-                if file.endswith('.mp3') and '｜' in file:
-                    sanitized_file = sanitize_filename(file)
-                    original_path = os.path.join(app.config['UPLOAD_FOLDER'], file)
-                    sanitized_path = os.path.join(app.config['UPLOAD_FOLDER'], sanitized_file)
-                    try:
-                        os.rename(original_path, sanitized_path)
-                        logger.debug(f'Arquivo renomeado de {file} para {sanitized_file}')
-                        filename = sanitized_file
-                        filepath = sanitized_path
-                    except Exception as rename_error:
-                        logger.exception(f'Erro ao renomear arquivo: {rename_error}')
-                        return jsonify({'error': 'Erro ao sanitizar o nome do arquivo.'}), 500
-                    break
-
-            if not os.path.exists(filepath):
-                logger.error('Arquivo MP3 não foi criado.')
-                return jsonify({'error': 'Falha ao baixar o MP3.'}), 500
-
-            logger.debug(f'Arquivo MP3 baixado: {filepath}')
-            return send_from_directory(directory=app.config['UPLOAD_FOLDER'],
-                                       path=filename,
-                                       as_attachment=True,
-                                       mimetype='audio/mpeg')
+        entry, status = download_cache.get(youtube_url, 'native', progress_hook)
+    except Exception as e:
+        logger.exception(f'Erro no download para análise no job {job.id}.')
+        errors_total.inc(endpoint='analyze_youtube', kind='download')
+        job.fail(f'Erro durante o download do YouTube: {str(e)}')
+        return
+    download_lookups_total.inc(result=status)
+
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], entry['filename'])
+    if full:
+        job_fn, job_args = analyze_full_file, (filepath, profile)
+    else:
+        job_fn, job_args = analyze_file, (filepath, profile, window)
+    try:
+        submit_analysis_job(job_fn, job_args, cache_key, timeout=timeout, job=job,
+                            extra={'Title': entry['title'], **extra}, label=entry['filename'])
+    except PoolFullError:
+        # submit_analysis_job já marcou o job como falho.
+        errors_total.inc(endpoint='analyze_youtube', kind='pool_full')
+
+@app.route('/analyze/youtube', methods=['POST'])
+def analyze_youtube():
+    """
+    Rota que analisa um vídeo do YouTube direto no servidor: o áudio original
+    (opus/m4a) é baixado sem conversão para MP3 e decodificado só na janela
+    analisada. O MP3 só é gerado se pedido com 'mp3': true.
+    """
+    data = request.get_json(silent=True) or {}
+    youtube_url = data.get('youtube_url')
+    if not youtube_url:
+        logger.error('Nenhuma URL do YouTube enviada.')
+        return jsonify({'error': 'Nenhuma URL do YouTube enviada.'}), 400
+
+    try:
+        profile, window, full = analysis_options()
+    except ValueError as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), 400
+
+    wants_mp3 = str(data.get('mp3')).lower() in ('1', 'true', 'yes')
+    cache_key = analysis_cache.make_key(
+        f"youtube:{download_key(youtube_url, 'native')}",
+        profile=profile,
+        window='full' if full else window,
+        model=get_model_version(),
+        version=ANALYSIS_VERSION
+    )
+    try:
+        with g.timer.stage('cache_lookup'):
+            cached = analysis_cache.get(cache_key)
+    except Exception:
+        logger.exception('Erro ao consultar o cache de análise.')
+        errors_total.inc(endpoint='analyze_youtube', kind='cache')
+        cached = None
+    cache_lookups_total.inc(result='hit' if cached is not None else 'miss')
+    # Sem análise a fazer, o MP3 é baixado direto; caso contrário, é
+    # convertido do áudio original que a análise baixa.
+    extra = start_mp3_job(youtube_url, from_native=cached is None) if wants_mp3 else {}
+    if cached is not None:
+        if wants_async():
+            job = jobs.create('analyze')
+            job.finish({**cached, 'Cached': True, **extra})
+            return job_accepted(job)
+        return jsonify({**cached, 'Cached': True, **extra})
+
+    timeout = app.config['ANALYSIS_FULL_TIMEOUT' if full else 'ANALYSIS_TIMEOUT']
+    if wants_async():
+        job = jobs.create('analyze')
+        threading.Thread(target=run_youtube_analysis_job,
+                         args=(job, youtube_url, profile, window, full, cache_key, timeout, extra),
+                         daemon=True).start()
+        return job_accepted(job)
 
+    try:
+        with g.timer.stage('download'):
+            entry, status = download_cache.get(youtube_url, 'native')
+        download_lookups_total.inc(result=status)
+    except DownloadFailed as e:
+        errors_total.inc(endpoint='analyze_youtube', kind='download')
+        return jsonify({'error': str(e)}), 500
     except yt_dlp.utils.DownloadError as e:
         logger.exception('Erro específico durante o download do YouTube.')
+        errors_total.inc(endpoint='analyze_youtube', kind='youtube')
         return jsonify({'error': f'Erro específico durante o download do YouTube: {str(e)}'}), 500
     except Exception as e:
         logger.exception('Erro inesperado durante o download do YouTube.')
+        errors_total.inc(endpoint='analyze_youtube', kind='unexpected')
         return jsonify({'error': f'Erro inesperado durante o download do YouTube: {str(e)}'}), 500
 
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], entry['filename'])
+    if full:
+        job_fn, job_args = analyze_full_file, (filepath, profile)
+    else:
+        job_fn, job_args = analyze_file, (filepath, profile, window)
+    # O arquivo pertence ao cache de downloads e não é removido após a análise.
+    return analysis_response(job_fn, job_args, cache_key, timeout=timeout, label=entry['filename'],
+                             extra={'Title': entry['title'], **extra})
+
+@app.route('/similar', methods=['POST'])
+def similar():
+    """
+    Rota que procura, no índice de impressões digitais, gravações iguais ao
+    arquivo enviado (outras codificações, cortes e downloads do mesmo áudio).
+    """
+    if fingerprint_index is None:
+        return jsonify({'error': 'Índice de impressões digitais desativado.'}), 404
+
+    file = request.files.get('music_file')
+    if not file or file.filename == '':
+        logger.error('Nenhum arquivo enviado.')
+        return jsonify({'error': 'Nenhum arquivo enviado.'}), 400
+
+    try:
+        profile, window, _ = analysis_options()
+        limit = int(request.args.get('limit') or request.form.get('limit') or 5)
+    except ValueError as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), 400
+
+    filename = sanitize_filename(file.filename)
+    try:
+        with g.timer.stage('read'):
+            data = file.read()
+        fingerprint = get_analysis_pool().run(
+            fingerprint_bytes, data, os.path.splitext(filename)[1], profile, window)
+        with g.timer.stage('fingerprint_lookup'):
+            matches = fingerprint_index.match(fingerprint['hashes'], fingerprint['offsets'], limit=limit)
+    except PoolFullError:
+        errors_total.inc(endpoint='similar', kind='pool_full')
+        response = jsonify({'error': 'Servidor ocupado. Tente novamente em instantes.'})
+        response.headers['Retry-After'] = str(app.config['ANALYSIS_RETRY_AFTER'])
+        return response, 503
+    except Exception as e:
+        logger.exception('Erro ao calcular a impressão digital.')
+        errors_total.inc(endpoint='similar', kind='fingerprint')
+        return jsonify({'error': f'Erro ao calcular a impressão digital: {str(e)}'}), 500
+
+    return jsonify({
+        'Hashes': len(fingerprint['hashes']),
+        'Matches': [{
+            'Track': match['key'],
+            'Label': match['label'],
+            'Score': match['score'],
+            'Coverage': match['coverage'],
+            'Offset': match['offset'],
+        } for match in matches]
+    })
+
+@app.route('/similar/tracks', methods=['GET'])
+def similar_tracks():
+    """
+    Rota que procura, no armazenamento de características, as faixas mais
+    parecidas com uma faixa já analisada (`track`, o campo 'Track' da
+    análise), com filtros opcionais de BPM (bpm_min, bpm_max) e de
+    tonalidade (key, repetível).
+    """
+    if feature_store is None:
+        return jsonify({'error': 'Armazenamento de características desativado.'}), 404
+
+    track = request.args.get('track')
+    if not track:
+        return jsonify({'error': 'Faixa não informada.'}), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+        bpm_min = float(request.args.get('bpm_min', 0))
+        bpm_max = float(request.args.get('bpm_max', 'inf'))
+    except ValueError as e:
+        logger.error(str(e))
+        return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
+    if limit < 1:
+        return jsonify({'error': 'O limite deve ser positivo.'}), 400
+    keys = request.args.getlist('key')
+    unknown = [key for key in keys if key not in KEY_NAMES]
+    if unknown:
+        return jsonify({'error': f'Tonalidade desconhecida: {unknown[0]}'}), 400
+    bpm_range = (bpm_min, bpm_max) if 'bpm_min' in request.args or 'bpm_max' in request.args else None
+
+    try:
+        with g.timer.stage('feature_search'):
+            matches = feature_store.similar(track, limit=limit, bpm_range=bpm_range, keys=keys)
+    except KeyError:
+        return jsonify({'error': 'Faixa não encontrada.'}), 404
+    except Exception as e:
+        logger.exception('Erro na busca por faixas parecidas.')
+        errors_total.inc(endpoint='similar_tracks', kind='search')
+        return jsonify({'error': f'Erro na busca por faixas parecidas: {str(e)}'}), 500
+
+    return jsonify({
+        'Track': track,
+        'Matches': [{
+            'Track': match['key'],
+            'Label': match['label'],
+            'Score': match['score'],
+            'BPM': match['bpm'],
+            'Key': match['musical_key'],
+        } for match in matches]
+    })
+
+@app.route('/harmonic', methods=['GET'])
+def harmonic():
+    """
+    Rota que lista as faixas compatíveis para mixagem com uma faixa já
+    analisada (`track`) ou com uma tonalidade e BPM (`key` e `bpm`): mesma
+    posição, relativa ou vizinhas na roda de Camelot, com BPM a até
+    `tolerance`, incluindo half-time e double-time (half_double=0 desativa).
+    """
+    if harmonic_index is None:
+        return jsonify({'error': 'Índice harmônico desativado.'}), 404
+
+    try:
+        options = {
+            'tolerance': float(request.args.get('tolerance', DEFAULT_TOLERANCE)),
+            'half_double': request.args.get('half_double', '1') != '0',
+            'limit': int(request.args.get('limit', DEFAULT_LIMIT)),
+        }
+    except ValueError as e:
+        logger.error(str(e))
+        return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
+
+    track = request.args.get('track')
+    key = request.args.get('key')
+    if not track and not (key and request.args.get('bpm')):
+        return jsonify({'error': 'Informe a faixa (track) ou a tonalidade e o BPM (key e bpm).'}), 400
+    try:
+        with g.timer.stage('harmonic_lookup'):
+            if track:
+                reference, matches = harmonic_index.compatible_with(track, **options)
+                key, bpm = reference['musical_key'], reference['bpm']
+            else:
+                bpm = float(request.args['bpm'])
+                matches = harmonic_index.compatible(key, bpm, **options)
+    except KeyError:
+        return jsonify({'error': 'Faixa não encontrada.'}), 404
+    except ValueError as e:
+        return jsonify({'error': f'Parâmetro inválido: {str(e)}'}), 400
+
+    return jsonify({
+        'Track': track,
+        'Key': key,
+        'Camelot': camelot(key),
+        'BPM': round(bpm, 2),
+        'Matches': [{
+            'Track': match['key'],
+            'Label': match['label'],
+            'Key': match['musical_key'],
+            'Camelot': match['camelot'],
+            'BPM': match['bpm'],
+            'Relation': match['relation'],
+            'Tempo': match['tempo'],
+            'BPM Delta': match['bpm_delta'],
+        } for match in matches]
+    })
+
+@app.route('/timeline', methods=['GET'])
+def beat_timeline():
+    """
+    Rota que serve a linha do tempo por batida (resolution=beat) ou por
+    compasso (resolution=bar) de uma faixa já analisada (`track`, o campo
+    'Timeline Track' da análise quando ela foi reaproveitada de outra
+    gravação, senão 'Track'): o arquivo binário compacto, com suporte a
+    Range para buscar só os blocos necessários, ou os valores decodificados
+    com format=json.
+    """
+    if timeline_store is None:
+        return jsonify({'error': 'Linha do tempo por batida desativada.'}), 404
+
+    track = request.args.get('track')
+    resolution = request.args.get('resolution', 'beat')
+    if not track:
+        return jsonify({'error': 'Faixa não informada.'}), 400
+    if resolution not in RESOLUTIONS:
+        return jsonify({'error': f'Resolução desconhecida: {resolution}'}), 400
+    path = timeline_store.find(track, resolution)
+    if path is None:
+        return jsonify({'error': 'Linha do tempo não encontrada.'}), 404
+
+    if request.args.get('format') == 'json':
+        with open(path, 'rb') as f:
+            timeline = decode_timeline(f.read())
+        return jsonify({
+            'Track': track,
+            'Resolution': resolution,
+            'Times': np.round(timeline['times'], 3).tolist(),
+            'Chroma': np.round(timeline['chroma'], 3).tolist(),
+            'RMS': np.round(timeline['rms'], 5).tolist(),
+            'Onset': np.round(timeline['onset'], 4).tolist(),
+        })
+    return send_file(os.path.abspath(path), mimetype='application/octet-stream', conditional=True, max_age=3600)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Rota para consultar o estado e os resultados parciais de um job.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado.'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+def job_stream(job_id):
+    """
+    Rota que envia, via Server-Sent Events, cada resultado assim que é calculado.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado.'}), 404
+
+    def generate():
+        for event in job.events():
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            name, data = event
+            yield f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/file', methods=['GET'])
+def job_file(job_id):
+    """
+    Rota para baixar o arquivo produzido por um job de download ou em lote.
+    """
+    job = jobs.get(job_id)
+    if job is None or job.kind not in ('download', 'batch'):
+        return jsonify({'error': 'Job não encontrado.'}), 404
+    if job.status != DONE:
+        return jsonify({'error': 'Job ainda não concluído.', 'status': job.status}), 409
+    if job.kind == 'batch':
+        return send_from_directory(directory=app.config['RESULTS_FOLDER'],
+                                   path=job.result['filename'],
+                                   as_attachment=True)
+    return send_download(job.result)
+
+start_warm_up()
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,179 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import logging
+import os
+import sys
+
+from analysis import DEFAULT_PROFILE, PROFILES, WINDOW_START, WINDOWS
+from workers import _init_worker, analyze_file
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg', '.m4a', '.opus', '.aac')
+RESULT_FIELDS = ['path', 'bpm', 'key', 'alt_key', 'key_confidence', 'energy', 'danceability', 'genre', 'error']
+
+
+def iter_audio_files(root, extensions=AUDIO_EXTENSIONS):
+    """
+    Percorre um diretório recursivamente, em ordem, retornando os arquivos de áudio.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(extensions):
+                yield os.path.join(dirpath, name)
+
+
+def output_format(path):
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def load_completed(path):
+    """
+    Lê um arquivo de resultados existente e retorna os caminhos já analisados
+    com sucesso, para que uma execução interrompida possa ser retomada.
+    """
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, newline='', encoding='utf-8') as f:
+        if output_format(path) == 'csv':
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        try:
+            for row in rows:
+                if not row.get('error'):
+                    completed.add(row['path'])
+        except ValueError:
+            # Última linha truncada por uma interrupção no meio da escrita.
+            logger.warning(f'Linha inválida ignorada em {path}.')
+    return completed
+
+
+class ResultWriter(object):
+    """
+    Grava os resultados de forma incremental (JSONL ou CSV), um por linha.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.format = output_format(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        if self.format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+            if write_header:
+                self._csv.writeheader()
+
+    def write(self, row):
+        if self.format == 'csv':
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_batch(items, submit, writer, progress=None, window=8, on_result=None):
+    """
+    Distribui a análise de `items` (pares caminho/rótulo) por meio de `submit`,
+    mantendo no máximo `window` jobs em andamento, e grava cada resultado
+    assim que fica pronto. `on_result(caminho, rótulo, análise)` recebe cada
+    análise concluída antes de os campos internos (vetores, linha do tempo
+    por batida, impressão digital) serem descartados. Retorna (concluídos,
+    erros).
+    """
+    items = list(items)
+    total = len(items)
+    pending = {}
+    iterator = iter(items)
+    completed = errors = 0
+
+    def fill():
+        while len(pending) < window:
+            item = next(iterator, None)
+            if item is None:
+                return
+            path, label = item
+            pending[submit(path)] = (path, label)
+
+    fill()
+    while pending:
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            path, label = pending.pop(future)
+            try:
+                analysis = future.result()
+                if on_result:
+                    on_result(path, label, analysis)
+                analysis.pop('timings', None)
+                analysis.pop('fingerprint', None)
+                analysis.pop('vectors', None)
+                analysis.pop('beat_sync', None)
+                row = {'path': label, **analysis}
+            except Exception as e:
+                logger.error(f'Erro ao analisar {label}: {e}')
+                row = {'path': label, 'error': str(e)}
+                errors += 1
+            writer.write(row)
+            completed += 1
+            if progress:
+                progress(completed, total, row)
+        fill()
+    return completed, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analisa em lote todos os áudios de um diretório.')
+    parser.add_argument('directory', help='Diretório com os arquivos de áudio.')
+    parser.add_argument('-o', '--output', default='results.jsonl',
+                        help='Arquivo de resultados (.jsonl ou .csv).')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='Número de processos de análise.')
+    parser.add_argument('--model', default='genre_classifier.pkl',
+                        help='Caminho do modelo de gênero.')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default=DEFAULT_PROFILE,
+                        help='Perfil de análise.')
+    parser.add_argument('--window', choices=WINDOWS, default=WINDOW_START,
+                        help='Trecho da faixa a analisar.')
+    args = parser.parse_args(argv)
+
+    done = load_completed(args.output)
+    paths = [p for p in iter_audio_files(args.directory) if p not in done]
+    print(f'{len(paths)} arquivo(s) para analisar, {len(done)} já analisado(s).')
+
+    def progress(completed, total, row):
+        status = 'erro' if row.get('error') else 'ok'
+        print(f'[{completed}/{total}] {status}: {row["path"]}', flush=True)
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_init_worker, initargs=(args.model,)) as executor:
+        with ResultWriter(args.output) as writer:
+            completed, errors = run_batch(
+                ((p, p) for p in paths),
+                lambda path: executor.submit(analyze_file, path, args.profile, args.window),
+                writer,
+                progress=progress,
+                window=args.workers * 2
+            )
+
+    print(f'Concluído: {completed - errors} analisado(s), {errors} erro(s). Resultados em {args.output}.')
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
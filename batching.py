@@ -0,0 +1,228 @@
+import concurrent.futures
+import inspect
+import logging
+import queue
+import threading
+import time
+
+from analysis import finish_features
+from workers import BATCHED_JOBS
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+# Campos concluídos no lote por finish_features, publicados como eventos na
+# mesma ordem em que analyze_signal os emite.
+FINISHED_FIELDS = ('key', 'alt_key', 'key_confidence', 'key_candidates', 'genre')
+
+
+def _resolved(value):
+    future = concurrent.futures.Future()
+    future.set_result(value)
+    return future
+
+
+def chain(future, fn):
+    """
+    Retorna um Future resolvido com o resultado de `fn(resultado)`, onde `fn`
+    também retorna um Future. Cancelar o Future retornado cancela o original,
+    que fica acessível em `source`.
+    """
+    outer = concurrent.futures.Future()
+    outer.source = future
+
+    def resolve(source):
+        try:
+            if source.cancelled():
+                outer.cancel()
+            elif source.exception() is not None:
+                outer.set_exception(source.exception())
+            else:
+                return True
+        except concurrent.futures.InvalidStateError:
+            pass  # `outer` já foi cancelado por quem esperava o resultado.
+        return False
+
+    def forward(inner):
+        if resolve(inner):
+            try:
+                outer.set_result(inner.result())
+            except concurrent.futures.InvalidStateError:
+                pass
+
+    def on_first(first):
+        if outer.done() or not resolve(first):
+            return
+        try:
+            fn(first.result()).add_done_callback(forward)
+        except Exception as e:
+            outer.set_exception(e)
+
+    outer.add_done_callback(lambda f: f.cancelled() and future.cancel())
+    future.add_done_callback(on_first)
+    return outer
+
+
+class MicroBatcher(object):
+    """
+    Agrupa os itens enviados dentro de uma janela de `max_wait` segundos
+    (contada a partir do primeiro item), até `max_batch` itens, e os processa
+    juntos com `process_batch(itens) -> resultados`. Janelas maiores aumentam
+    o tamanho dos lotes (vazão) ao custo de latência.
+    """
+
+    def __init__(self, process_batch, max_batch=16, max_wait=0.01, on_batch=None):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.on_batch = on_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = concurrent.futures.Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _CLOSE:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _CLOSE:
+                self._queue.put(_CLOSE)
+                break
+            batch.append(entry)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [(item, future) for item, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                results = self.process_batch([item for item, _ in batch])
+            except Exception as e:
+                logger.exception('Erro ao processar lote.')
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            if self.on_batch:
+                self.on_batch(len(batch), time.perf_counter() - start)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self):
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+
+class BatchingPool(object):
+    """
+    Envolve um AnalysisPool com a mesma interface (submit/run/subscribe):
+    os processos calculam as características por faixa e a etapa final
+    (tonalidade e gênero) de requisições concorrentes é feita em lote no
+    processo principal, com o modelo retornado por `get_genre_model`.
+    """
+
+    def __init__(self, pool, get_genre_model, max_batch=16, max_wait=0.01, on_batch=None):
+        self.pool = pool
+        self.get_genre_model = get_genre_model
+        self._listeners = {}
+        self._listeners_lock = threading.Lock()
+        self._batcher = MicroBatcher(self._finish, max_batch, max_wait, on_batch)
+
+    @property
+    def workers(self):
+        return self.pool.workers
+
+    @property
+    def max_queue(self):
+        return self.pool.max_queue
+
+    @property
+    def timeout(self):
+        return self.pool.timeout
+
+    def _finish(self, partials):
+        return finish_features(partials, self.get_genre_model())
+
+    def _publish(self, token, result):
+        # Os campos concluídos no lote não passam pelo processo de trabalho:
+        # são publicados aqui, antes de o job terminar.
+        with self._listeners_lock:
+            callback = self._listeners.get(token)
+        if callback:
+            for name in FINISHED_FIELDS:
+                try:
+                    callback(name, result[name])
+                except Exception:
+                    logger.exception('Erro ao repassar evento da análise.')
+        return _resolved(result)
+
+    def _finish_later(self, partial, token=None):
+        # Resultados reaproveitados pela impressão digital já vêm completos.
+        if 'chroma_mean' not in partial:
+            return _resolved(partial)
+        future = self._batcher.submit(partial)
+        if token is None:
+            return future
+        return chain(future, lambda result: self._publish(token, result))
+
+    def submit(self, fn, *args, block=False):
+        batched_fn = BATCHED_JOBS.get(fn)
+        if batched_fn is None:
+            return self.pool.submit(fn, *args, block=block)
+        token = inspect.signature(fn).bind(*args).arguments.get('token')
+        return chain(self.pool.submit(batched_fn, *args, block=block),
+                     lambda partial: self._finish_later(partial, token))
+
+    def run(self, fn, *args, timeout=None):
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout or self.pool.timeout)
+        except concurrent.futures.TimeoutError:
+            self.abandon(future)
+            raise
+
+    @property
+    def stuck(self):
+        return self.pool.stuck
+
+    def abandon(self, future):
+        """
+        Como AnalysisPool.abandon; para os jobs em lote, o job do pool é o
+        Future original da cadeia.
+        """
+        future.cancel()
+        return self.pool.abandon(getattr(future, 'source', future))
+
+    def subscribe(self, token, callback):
+        with self._listeners_lock:
+            self._listeners[token] = callback
+        self.pool.subscribe(token, callback)
+
+    def unsubscribe(self, token):
+        with self._listeners_lock:
+            self._listeners.pop(token, None)
+        self.pool.unsubscribe(token)
+
+    def shutdown(self, wait=True):
+        self._batcher.close()
+        self.pool.shutdown(wait=wait)
@@ -0,0 +1,180 @@
+import hashlib
+import logging
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from analysis import bars_from_beats
+
+logger = logging.getLogger(__name__)
+
+# Formato binário da linha do tempo por batida (ou por compasso):
+#
+#   cabeçalho (HEADER): assinatura, versão, resolução, intervalos por bloco,
+#       total de intervalos, total de blocos e as escalas de RMS e de onset;
+#   índice: um uint32 por bloco com o fim do bloco, relativo ao fim do índice;
+#   blocos: zlib de colunas quantizadas de até BLOCK_SIZE intervalos: início
+#       em ms (uint32), croma (12 x uint8), RMS (uint8) e onset (uint8).
+#
+# Cada bloco é comprimido separadamente: um cliente pode ler o cabeçalho e o
+# índice com um Range pequeno e buscar só os blocos do trecho que exibe.
+MAGIC = b'UFBT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBHIIff')
+BLOCK_SIZE = 64
+RESOLUTIONS = ('beat', 'bar')
+LEVELS = 255
+
+
+def _quantize(values, scale):
+    if scale <= 0:
+        return np.zeros(np.shape(values), dtype=np.uint8)
+    return np.clip(np.rint(np.asarray(values) / scale * LEVELS), 0, LEVELS).astype(np.uint8)
+
+
+def encode(beats, resolution='beat'):
+    """
+    Codifica o resultado de beat_sync (por batida) na resolução pedida. A
+    croma já está em [0, 1]; RMS e onset são quantizados em relação ao
+    máximo da faixa, gravado no cabeçalho.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f'Resolução desconhecida: {resolution}')
+    if resolution == 'bar':
+        beats = bars_from_beats(beats)
+    times = np.rint(np.asarray(beats['times']) * 1000).astype('<u4')
+    count = len(times)
+    rms_scale = float(np.max(beats['rms'])) if count else 0.0
+    onset_scale = float(np.max(beats['onset'])) if count else 0.0
+    chroma = _quantize(beats['chroma'], 1.0)
+    rms = _quantize(beats['rms'], rms_scale)
+    onset = _quantize(beats['onset'], onset_scale)
+
+    blocks = []
+    for start in range(0, count, BLOCK_SIZE):
+        end = start + BLOCK_SIZE
+        payload = b''.join([times[start:end].tobytes(), chroma[start:end].tobytes(),
+                            rms[start:end].tobytes(), onset[start:end].tobytes()])
+        blocks.append(zlib.compress(payload, 9))
+    index = np.cumsum([len(block) for block in blocks], dtype=np.int64).astype('<u4')
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, RESOLUTIONS.index(resolution), BLOCK_SIZE,
+                         count, len(blocks), rms_scale, onset_scale)
+    return header + index.tobytes() + b''.join(blocks)
+
+
+def read_header(data):
+    """
+    Lê o cabeçalho: dicionário com 'resolution', 'block_size', 'count',
+    'blocks', 'rms_scale', 'onset_scale' e 'data_offset' (início do
+    primeiro bloco).
+    """
+    magic, version, resolution, block_size, count, blocks, rms_scale, onset_scale = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Arquivo de linha do tempo inválido.')
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Versão da linha do tempo não suportada: {version}')
+    return {
+        'resolution': RESOLUTIONS[resolution],
+        'block_size': block_size,
+        'count': count,
+        'blocks': blocks,
+        'rms_scale': rms_scale,
+        'onset_scale': onset_scale,
+        'data_offset': HEADER.size + 4 * blocks,
+    }
+
+
+def decode(data):
+    """
+    Decodifica um arquivo inteiro de volta em arrays (valores
+    desquantizados): 'times', 'chroma', 'rms' e 'onset'.
+    """
+    header = read_header(data)
+    ends = np.frombuffer(data, dtype='<u4', count=header['blocks'], offset=HEADER.size)
+    columns = {'times': [], 'chroma': [], 'rms': [], 'onset': []}
+    start = 0
+    for i, end in enumerate(ends):
+        n = min(header['block_size'], header['count'] - i * header['block_size'])
+        payload = zlib.decompress(data[header['data_offset'] + start:header['data_offset'] + int(end)])
+        columns['times'].append(np.frombuffer(payload, dtype='<u4', count=n))
+        columns['chroma'].append(np.frombuffer(payload, dtype=np.uint8, count=n * 12, offset=4 * n).reshape(n, 12))
+        columns['rms'].append(np.frombuffer(payload, dtype=np.uint8, count=n, offset=16 * n))
+        columns['onset'].append(np.frombuffer(payload, dtype=np.uint8, count=n, offset=17 * n))
+        start = int(end)
+    if not header['count']:
+        return {'times': np.zeros(0), 'chroma': np.zeros((0, 12)), 'rms': np.zeros(0), 'onset': np.zeros(0)}
+    return {
+        'times': np.concatenate(columns['times']) / 1000.0,
+        'chroma': np.concatenate(columns['chroma']) / LEVELS,
+        'rms': np.concatenate(columns['rms']) * (header['rms_scale'] / LEVELS),
+        'onset': np.concatenate(columns['onset']) * (header['onset_scale'] / LEVELS),
+    }
+
+
+def shift(beats, seconds):
+    """
+    Desloca os tempos de uma linha do tempo em `seconds` (a posição da mesma
+    batida em outra gravação, com outra introdução), descartando os
+    intervalos que ficariam antes do início.
+    """
+    times = np.asarray(beats['times']) + seconds
+    keep = times >= 0
+    return {'times': times[keep], 'chroma': np.asarray(beats['chroma'])[keep],
+            'rms': np.asarray(beats['rms'])[keep], 'onset': np.asarray(beats['onset'])[keep]}
+
+
+class TimelineStore(object):
+    """
+    Arquivos das linhas do tempo por faixa na pasta `directory`, um por
+    resolução, nomeados pelo hash do id da faixa. Uma análise só substitui
+    a linha do tempo gravada se cobrir pelo menos o mesmo número de batidas
+    (a análise completa prevalece sobre a da janela).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, track, resolution='beat'):
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f'Resolução desconhecida: {resolution}')
+        name = hashlib.sha256(track.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f'{name}.{resolution}.uft')
+
+    def _count(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return read_header(f.read(HEADER.size))['count']
+        except (OSError, ValueError, struct.error):
+            return -1
+
+    def save(self, track, beats):
+        """
+        Grava as duas resoluções da faixa; retorna False se já havia uma
+        linha do tempo mais longa.
+        """
+        if self._count(self.path(track)) > len(beats['times']):
+            return False
+        for resolution in RESOLUTIONS:
+            path = self.path(track, resolution)
+            with open(f'{path}.tmp', 'wb') as f:
+                f.write(encode(beats, resolution))
+            os.replace(f'{path}.tmp', path)
+        return True
+
+    def find(self, track, resolution='beat'):
+        path = self.path(track, resolution)
+        return path if os.path.exists(path) else None
+
+    def load(self, track):
+        """
+        Linha do tempo por batida gravada para a faixa (decodificada), ou None.
+        """
+        path = self.find(track)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return decode(f.read())
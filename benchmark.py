@@ -0,0 +1,462 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from analysis import (DEFAULT_PROFILE, PROFILES, FeatureExtractor, analyze_signal,
+                      analyze_stream, estimate_key, load_audio)
+from genre import GenreModel
+
+FIXTURE_SR = 44100
+BPM_TOLERANCE = 0.04  # 4% (também aceita metade/dobro do andamento)
+
+# Tríades (semitons a partir da tônica) de uma progressão I-IV-V-I.
+MAJOR_PROGRESSION = [[0, 4, 7], [5, 9, 12], [7, 11, 14], [0, 4, 7]]
+MINOR_PROGRESSION = [[0, 3, 7], [5, 8, 12], [7, 10, 14], [0, 3, 7]]
+
+
+def click_track(bpm, seconds, sr=FIXTURE_SR):
+    times = np.arange(0.0, seconds, 60.0 / bpm)
+    return librosa.clicks(times=times, sr=sr, length=int(seconds * sr)).astype(np.float32)
+
+
+def tone(frequency, seconds, sr=FIXTURE_SR):
+    t = np.arange(int(seconds * sr)) / sr
+    envelope = np.exp(-1.5 * t)
+    partials = sum(np.sin(2 * np.pi * frequency * n * t) / n for n in (1, 2, 3))
+    return envelope * partials
+
+
+def chord_progression(tonic, minor, seconds, chord_seconds=2.0, sr=FIXTURE_SR):
+    """
+    Sintetiza uma progressão I-IV-V-I (ou i-iv-v-i) na tonalidade indicada,
+    com o baixo dobrando a fundamental de cada acorde.
+    """
+    progression = MINOR_PROGRESSION if minor else MAJOR_PROGRESSION
+    base = librosa.note_to_hz('C4') * 2 ** (tonic / 12.0)
+    chords = []
+    for chord in progression:
+        y = sum(tone(base * 2 ** (step / 12.0), chord_seconds, sr) for step in chord)
+        y += tone(base * 2 ** (chord[0] / 12.0 - 1), chord_seconds, sr)
+        chords.append(y)
+    cycle = np.concatenate(chords)
+    repeats = int(np.ceil(seconds * sr / len(cycle)))
+    y = np.tile(cycle, repeats)[:int(seconds * sr)]
+    return (0.2 * y / np.max(np.abs(y))).astype(np.float32)
+
+
+def noise(seconds, sr=FIXTURE_SR, seed=0):
+    rng = np.random.default_rng(seed)
+    return (0.1 * rng.standard_normal(int(seconds * sr))).astype(np.float32)
+
+
+def fixture_specs(include_long=True):
+    """
+    Fixtures sintéticas com respostas conhecidas (BPM e/ou tonalidade).
+    """
+    specs = [
+        {'name': 'click_90', 'seconds': 60, 'bpm': 90,
+         'signal': lambda: click_track(90, 60)},
+        {'name': 'click_120', 'seconds': 60, 'bpm': 120,
+         'signal': lambda: click_track(120, 60)},
+        {'name': 'click_140', 'seconds': 60, 'bpm': 140,
+         'signal': lambda: click_track(140, 60)},
+        {'name': 'chords_c_major', 'seconds': 60, 'key': 'C Major',
+         'signal': lambda: chord_progression(0, False, 60)},
+        {'name': 'chords_a_minor', 'seconds': 60, 'key': 'A Minor',
+         'signal': lambda: chord_progression(9, True, 60)},
+        {'name': 'chords_e_major_click_100', 'seconds': 60, 'key': 'E Major', 'bpm': 100,
+         'signal': lambda: chord_progression(4, False, 60) + 0.5 * click_track(100, 60)},
+        {'name': 'noise', 'seconds': 60,
+         'signal': lambda: noise(60)},
+    ]
+    if include_long:
+        specs.append({'name': 'long_click_128', 'seconds': 600, 'bpm': 128, 'long': True,
+                      'signal': lambda: click_track(128, 600) + noise(600, seed=1) * 0.1})
+    return specs
+
+
+def build_fixtures(directory, include_long=True):
+    """
+    Grava as fixtures em WAV (reaproveitando as que já existem) e retorna
+    suas descrições com o caminho de cada arquivo.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fixtures = []
+    for spec in fixture_specs(include_long):
+        path = os.path.join(directory, f"{spec['name']}.wav")
+        if not os.path.exists(path):
+            sf.write(path, spec['signal'](), FIXTURE_SR, subtype='PCM_16')
+        fixture = {k: v for k, v in spec.items() if k != 'signal'}
+        fixture['path'] = path
+        fixtures.append(fixture)
+    return fixtures
+
+
+def time_call(fn, repeat):
+    """
+    Executa `fn` `repeat` vezes e retorna a mediana do tempo (s) e o último valor.
+    """
+    timings = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), value
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _stage(prerequisites, compute):
+    def run(y, sr):
+        features = FeatureExtractor(y, sr)
+        for name in prerequisites:
+            getattr(features, name)
+        start = time.perf_counter()
+        compute(features)
+        return time.perf_counter() - start
+    return run
+
+
+# Estágios medidos isoladamente: os intermediários de que dependem são
+# calculados antes de iniciar o cronômetro.
+STAGES = [
+    ('stft', _stage([], lambda f: f.spectrogram)),
+    ('onset_strength', _stage(['spectrogram'], lambda f: f.onset_env)),
+    ('beat_track', _stage(['onset_env'], lambda f: f.beats)),
+    ('rms', _stage(['spectrogram'], lambda f: f.rms)),
+    ('chroma_cqt', _stage([], lambda f: f.chroma)),
+    ('detect_key', _stage(['chroma_mean'], lambda f: estimate_key(f.chroma_mean))),
+    ('mfcc', _stage(['mel_db'], lambda f: f.mfcc)),
+]
+
+
+def load_genre_model(path):
+    if path and os.path.exists(path):
+        return GenreModel(path)
+    return None
+
+
+def bpm_matches(expected, detected):
+    return any(abs(detected - expected * factor) <= BPM_TOLERANCE * expected * factor
+               for factor in (0.5, 1.0, 2.0))
+
+
+def benchmark_fixture(fixture, profile, repeat, genre_model):
+    """
+    Mede cada estágio do pipeline para uma fixture e verifica as respostas
+    conhecidas. Retorna um dicionário de tempos e o resultado da análise.
+    """
+    timings = {}
+    if fixture.get('long'):
+        timings['analyze_stream'], analysis = time_call(
+            lambda: analyze_stream(fixture['path'], genre_model, profile=profile), 1)
+        return timings, analysis
+
+    timings['decode'], (y, sr, _) = time_call(lambda: load_audio(fixture['path'], profile=profile), repeat)
+    for name, stage in STAGES:
+        timings[name] = statistics.median(stage(y, sr) for _ in range(repeat))
+    if genre_model is not None:
+        timings['detect_genre'] = statistics.median(
+            _stage(['mfcc_mean'], lambda f: f.genre(genre_model))(y, sr) for _ in range(repeat))
+    timings['analyze'], analysis = time_call(
+        lambda: analyze_signal(*load_audio(fixture['path'], profile=profile)[:2], genre_model), repeat)
+    return timings, analysis
+
+
+def check_accuracy(fixture, analysis):
+    checks = {}
+    if 'bpm' in fixture:
+        checks['bpm'] = {'expected': fixture['bpm'], 'detected': round(analysis['bpm'], 2),
+                         'ok': bpm_matches(fixture['bpm'], analysis['bpm'])}
+    if 'key' in fixture:
+        checks['key'] = {'expected': fixture['key'], 'detected': analysis['key'],
+                         'ok': analysis['key'] == fixture['key']}
+    return checks
+
+
+def benchmark_metadata(fixtures, repeat):
+    """
+    Mede get_audio_metadata (ffprobe) quando o editor de metadados está disponível.
+    """
+    if shutil.which('ffprobe') is None:
+        return None
+    try:
+        from mp3metadados import get_audio_metadata
+    except ImportError:
+        return None
+    paths = [f['path'] for f in fixtures]
+    elapsed, _ = time_call(lambda: [get_audio_metadata(p) for p in paths], repeat)
+    return elapsed / len(paths)
+
+
+def benchmark_route(fixtures, profile, repeat, workdir):
+    """
+    Mede a rota /analyze de ponta a ponta pelo cliente de teste do Flask,
+    com o cache de resultados desativado. Os índices (impressões digitais,
+    características, harmônico e linhas do tempo) também ficam desligados:
+    as repetições mediriam o atalho do índice de impressões digitais, e
+    nada é gravado na pasta atual.
+    """
+    os.environ.setdefault('ANALYSIS_WORKERS', '1')
+    for name in ('FINGERPRINT_ENABLED', 'FEATURES_ENABLED', 'HARMONIC_ENABLED', 'BEAT_TIMELINE_ENABLED'):
+        os.environ[name] = '0'
+    import app as app_module
+    from cache import AnalysisCache
+
+    app_module.analysis_cache = AnalysisCache(os.path.join(workdir, 'benchmark-cache.sqlite'),
+                                              max_memory_entries=0, max_disk_entries=0)
+    client = app_module.app.test_client()
+    timings = {}
+    for fixture in fixtures:
+        if fixture.get('long'):
+            continue
+
+        def post():
+            with open(fixture['path'], 'rb') as f:
+                response = client.post(f'/analyze?profile={profile}',
+                                       data={'music_file': (f, os.path.basename(fixture['path']))},
+                                       content_type='multipart/form-data')
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        timings[fixture['name']], _ = time_call(post, repeat)
+    app_module.get_analysis_pool().shutdown()
+    return timings
+
+
+# Meta de latência de uma consulta ao índice de impressões digitais.
+FINGERPRINT_LOOKUP_TARGET = 0.001
+
+
+def benchmark_fingerprint_lookup(workdir, tracks=100000, hashes_per_track=500, queries=200, chunk=20000):
+    """
+    Mede a consulta ao índice de impressões digitais com `tracks` faixas
+    sintéticas (hashes aleatórios no espaço de 22 bits, gravados direto no
+    segmento com add_many). Cada consulta usa MAX_QUERY_HASHES hashes de
+    uma faixa indexada, com outro deslocamento; retorna a mediana e o p99
+    do tempo de match() e a fração de consultas que acharam a faixa certa.
+    """
+    from fingerprint import MAX_QUERY_HASHES, FingerprintIndex
+
+    directory = os.path.join(workdir, f'fingerprint-{tracks}x{hashes_per_track}')
+    shutil.rmtree(directory, ignore_errors=True)
+    index = FingerprintIndex(os.path.join(directory, 'fingerprints.sqlite'), compact_rows=0)
+    rng = np.random.default_rng(0)
+
+    def track_hashes(n):
+        track_rng = np.random.default_rng(n)
+        return (track_rng.integers(0, 1 << 22, hashes_per_track, dtype=np.int64),
+                track_rng.integers(0, 1300, hashes_per_track, dtype=np.int64))
+
+    start = time.perf_counter()
+    for first in range(0, tracks, chunk):
+        index.add_many((f'track-{n}', *track_hashes(n), None) for n in range(first, min(first + chunk, tracks)))
+    build_seconds = time.perf_counter() - start
+
+    timings = []
+    found = 0
+    for track in rng.integers(0, tracks, queries):
+        hashes, offsets = track_hashes(int(track))
+        query = rng.choice(hashes_per_track, MAX_QUERY_HASHES, replace=False)
+        start = time.perf_counter()
+        matches = index.match(hashes[query], offsets[query] + 40)
+        timings.append(time.perf_counter() - start)
+        found += bool(matches) and matches[0]['key'] == f'track-{track}'
+    shutil.rmtree(directory, ignore_errors=True)
+    return {
+        'tracks': tracks,
+        'postings': tracks * hashes_per_track,
+        'build_seconds': round(build_seconds, 1),
+        'median': statistics.median(timings),
+        'p99': float(np.percentile(timings, 99)),
+        'found': round(found / queries, 3),
+    }
+
+
+def benchmark_load(fixtures, profile, model_path, concurrency, micro_batch, rounds=4):
+    """
+    Mede a vazão (faixas/s) do pool de análise sob carga: `concurrency`
+    requisições simultâneas, por `rounds` rodadas, com o micro-batching
+    ligado ou desligado.
+    """
+    from batching import BatchingPool
+    from workers import AnalysisPool, analyze_file
+
+    pool = AnalysisPool(model_path, workers=min(concurrency, os.cpu_count() or 1),
+                        max_queue=concurrency, warm_up=True)
+    batches = []
+    if micro_batch:
+        genre_model = load_genre_model(model_path)
+        pool = BatchingPool(pool, lambda: genre_model, max_batch=concurrency,
+                            on_batch=lambda size, _: batches.append(size))
+    paths = [f['path'] for f in fixtures if not f.get('long')]
+    requests = [paths[i % len(paths)] for i in range(concurrency * rounds)]
+    try:
+        start = time.perf_counter()
+        futures = [pool.submit(analyze_file, path, profile, block=True) for path in requests]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.shutdown()
+    result = {'tracks_per_sec': round(len(requests) / elapsed, 3), 'requests': len(requests)}
+    if batches:
+        result['mean_batch_size'] = round(statistics.mean(batches), 2)
+    return result
+
+
+def run(fixtures, profile, repeat, genre_model, route=False, workdir=None):
+    report = {'profile': profile, 'fixtures': {}, 'accuracy': {}}
+    total_time = total_audio = tracks = 0
+    for fixture in fixtures:
+        timings, analysis = benchmark_fixture(fixture, profile, repeat, genre_model)
+        report['fixtures'][fixture['name']] = timings
+        report['accuracy'][fixture['name']] = check_accuracy(fixture, analysis)
+        if not fixture.get('long'):
+            total_time += timings['analyze']
+            total_audio += min(fixture['seconds'], PROFILES[profile]['duration'])
+            tracks += 1
+        print(f"{fixture['name']}: " + ', '.join(f'{k}={v * 1000:.1f}ms' for k, v in timings.items()),
+              flush=True)
+
+    report['throughput'] = {
+        'tracks_per_sec': round(tracks / total_time, 3) if total_time else 0.0,
+        'audio_seconds_per_sec': round(total_audio / total_time, 2) if total_time else 0.0,
+    }
+    metadata = benchmark_metadata(fixtures, repeat)
+    if metadata is not None:
+        report['get_audio_metadata'] = metadata
+    if route:
+        report['analyze_route'] = benchmark_route(fixtures, profile, repeat, workdir)
+    peak = peak_rss_mb()
+    report['peak_rss_mb'] = round(peak, 1) if peak is not None else None
+    return report
+
+
+def flatten_timings(report):
+    timings = {}
+    for fixture, stages in report['fixtures'].items():
+        for stage, seconds in stages.items():
+            timings[f'{fixture}/{stage}'] = seconds
+    for fixture, seconds in report.get('analyze_route', {}).items():
+        timings[f'{fixture}/analyze_route'] = seconds
+    if 'get_audio_metadata' in report:
+        timings['get_audio_metadata'] = report['get_audio_metadata']
+    if 'fingerprint_lookup' in report:
+        timings['fingerprint_lookup'] = report['fingerprint_lookup']['median']
+    return timings
+
+
+def compare(report, baseline, tolerance):
+    """
+    Compara os tempos com a linha de base e retorna as regressões acima da
+    tolerância relativa.
+    """
+    current = flatten_timings(report)
+    previous = flatten_timings(baseline)
+    regressions = []
+    for name, seconds in sorted(current.items()):
+        if name not in previous or previous[name] <= 0:
+            continue
+        ratio = seconds / previous[name]
+        marker = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            marker = '  <-- regressão'
+        print(f'{name}: {previous[name] * 1000:.1f}ms -> {seconds * 1000:.1f}ms ({ratio:.2f}x){marker}')
+    print(f"Throughput: {baseline['throughput']['tracks_per_sec']} -> "
+          f"{report['throughput']['tracks_per_sec']} faixas/s")
+    print(f"Pico de RSS: {baseline['peak_rss_mb']} -> {report['peak_rss_mb']} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do pipeline de análise com fixtures sintéticas.')
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'unspokenfreq-fixtures'),
+                        help='Diretório onde as fixtures são geradas.')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default=DEFAULT_PROFILE)
+    parser.add_argument('--repeat', type=int, default=3, help='Repetições por estágio (usa a mediana).')
+    parser.add_argument('--model', default='genre_classifier.pkl', help='Modelo de gênero, se existir.')
+    parser.add_argument('--quick', action='store_true', help='Não inclui a fixture longa.')
+    parser.add_argument('--route', action='store_true', help='Mede também a rota /analyze do Flask.')
+    parser.add_argument('--load', type=int, default=0, metavar='N',
+                        help='Mede a vazão com N requisições simultâneas, com e sem micro-batching.')
+    parser.add_argument('--fingerprint-tracks', type=int, default=100000, metavar='N',
+                        help='Faixas sintéticas no benchmark de consulta ao índice de impressões '
+                             'digitais (0 desativa).')
+    parser.add_argument('--output', help='Grava o relatório em JSON.')
+    parser.add_argument('--save-baseline', help='Grava o relatório como nova linha de base.')
+    parser.add_argument('--baseline', help='Compara com uma linha de base salva.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Aumento relativo de tempo tolerado antes de acusar regressão.')
+    args = parser.parse_args(argv)
+
+    fixtures = build_fixtures(args.fixtures, include_long=not args.quick)
+    report = run(fixtures, args.profile, args.repeat, load_genre_model(args.model),
+                 route=args.route, workdir=args.fixtures)
+
+    print(f"Throughput: {report['throughput']['tracks_per_sec']} faixas/s, "
+          f"{report['throughput']['audio_seconds_per_sec']} s de áudio/s")
+    print(f"Pico de RSS: {report['peak_rss_mb']} MB")
+
+    if args.load:
+        report['load'] = {}
+        for micro_batch in (False, True):
+            mode = 'micro_batch' if micro_batch else 'sem_batch'
+            report['load'][mode] = benchmark_load(fixtures, args.profile, args.model, args.load, micro_batch)
+            print(f"Carga ({args.load} simultâneas, {mode}): "
+                  f"{report['load'][mode]['tracks_per_sec']} faixas/s", flush=True)
+
+    failures = [f'{name}/{check}' for name, checks in report['accuracy'].items()
+                for check, result in checks.items() if not result['ok']]
+
+    if args.fingerprint_tracks:
+        lookup = benchmark_fingerprint_lookup(args.fixtures, tracks=args.fingerprint_tracks)
+        report['fingerprint_lookup'] = lookup
+        status = 'ok' if lookup['median'] < FINGERPRINT_LOOKUP_TARGET else 'ACIMA DA META'
+        print(f"Consulta ao índice de impressões digitais ({lookup['tracks']} faixas, "
+              f"{lookup['postings']} ocorrências): mediana {lookup['median'] * 1000:.3f}ms, "
+              f"p99 {lookup['p99'] * 1000:.3f}ms, acertos {lookup['found']:.0%} [{status}]", flush=True)
+        if lookup['median'] >= FINGERPRINT_LOOKUP_TARGET or lookup['found'] < 1:
+            failures.append('fingerprint_lookup')
+    for name, checks in report['accuracy'].items():
+        for check, result in checks.items():
+            status = 'ok' if result['ok'] else 'FALHOU'
+            print(f"Precisão {name}/{check}: esperado {result['expected']}, "
+                  f"detectado {result['detected']} [{status}]")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+
+    return 1 if failures or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
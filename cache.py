@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def hash_stream(stream, chunk_size=1024 * 1024):
+    """
+    Calcula o SHA-256 do conteúdo de um stream e volta o cursor ao início.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def hash_bytes(data):
+    """
+    Calcula o SHA-256 de um bloco de bytes.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class AnalysisCache(object):
+    """
+    Cache de resultados de análise em dois níveis: LRU em memória e SQLite em
+    disco, com limite de tamanho e de idade nas duas camadas.
+    """
+
+    def __init__(self, path, max_memory_entries=256, max_disk_entries=10000,
+                 max_age=30 * 24 * 3600):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_age = max_age
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' created REAL NOT NULL,'
+                ' accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(content_hash, **params):
+        """
+        Combina o hash do conteúdo com os parâmetros que influenciam o resultado.
+        """
+        suffix = '&'.join(f'{name}={params[name]}' for name in sorted(params))
+        return f'{content_hash}?{suffix}'
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.max_age:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value, created FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if now - created > self.max_age:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+
+        value = json.loads(value)
+        self._remember(key, created, value)
+        return value
+
+    def set(self, key, value):
+        now = time.time()
+        self._remember(key, now, value)
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now, now)
+            )
+            self._evict(conn, now)
+
+    def _remember(self, key, created, value):
+        with self._lock:
+            self._memory[key] = (created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self, conn, now):
+        conn.execute('DELETE FROM entries WHERE created < ?', (now - self.max_age,))
+        excess = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+            conn.execute(
+                'DELETE FROM entries WHERE key IN ('
+                ' SELECT key FROM entries ORDER BY accessed LIMIT ?)',
+                (excess,)
+            )
+            logger.debug(f'{excess} entrada(s) removida(s) do cache de análise.')
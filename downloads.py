@@ -0,0 +1,255 @@
+import concurrent.futures
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+HIT = 'hit'
+MISS = 'miss'
+SHARED = 'shared'
+
+# Opções do yt-dlp para cada formato servido; o formato faz parte da chave.
+FORMATS = {
+    'mp3': {
+        'format': 'bestaudio/best',
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': '320',
+        }],
+    },
+    # Áudio original (opus/m4a), sem conversão, para alimentar a análise.
+    'native': {
+        'format': 'bestaudio/best',
+    },
+}
+
+# Formatos que podem ser gerados localmente com o ffmpeg a partir de outro
+# formato já baixado, sem repetir o download.
+TRANSCODE_FROM = {'mp3': 'native'}
+TRANSCODE_ARGS = {'mp3': ['-vn', '-codec:a', 'libmp3lame', '-b:a', '320k', '-f', 'mp3']}
+
+YOUTUBE_ID = re.compile(
+    r'(?:youtu\.be/|[?&]v=|/(?:shorts|embed|live|v)/)([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])')
+
+
+class DownloadFailed(Exception):
+    """
+    Falha tratada no download, com a mensagem a ser devolvida ao cliente.
+    """
+
+
+def video_id(url):
+    """
+    Extrai o id do vídeo de uma URL do YouTube (watch, youtu.be, shorts,
+    embed, live), ou None se a URL não for reconhecida.
+    """
+    match = YOUTUBE_ID.search(url)
+    return match.group(1) if match else None
+
+
+def download_key(url, fmt):
+    """
+    Chave do cache: id normalizado do vídeo (ou hash da URL) e formato.
+    Também é o nome base do arquivo, então downloads de vídeos diferentes
+    nunca disputam o mesmo arquivo.
+    """
+    vid = video_id(url) or 'url-' + hashlib.sha256(url.strip().encode('utf-8')).hexdigest()[:16]
+    return f'{vid}-{fmt}'
+
+
+def default_extractor(options):
+    import yt_dlp  # importado só quando um download real é feito
+    return yt_dlp.YoutubeDL(options)
+
+
+class DownloadCache(object):
+    """
+    Cache dos áudios baixados do YouTube na pasta `directory`, com despejo
+    LRU quando o total passa de `max_bytes` e deduplicação (single-flight):
+    requisições simultâneas para o mesmo vídeo e formato compartilham um
+    único download. Cada arquivo tem um JSON ao lado com título e tamanho,
+    de onde o índice é reconstruído ao reiniciar.
+
+    `extractor(opções)` deve retornar um context manager com o método
+    extract_info(url, download=True) (o padrão é yt_dlp.YoutubeDL), o que
+    permite usar um extrator local nos testes.
+
+    Um arquivo devolvido por get() ainda vai ser aberto pelo chamador (envio
+    ao cliente, processo de trabalho), então entradas usadas há menos de
+    `min_age` segundos não são despejadas, mesmo que o total passe de
+    `max_bytes`; elas saem num despejo seguinte.
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, extractor=None, ydl_options=None,
+                 min_age=900):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.extractor = extractor or default_extractor
+        self.ydl_options = dict(ydl_options or {})
+        self._entries = OrderedDict()
+        # Último uso de cada entrada nesta execução (time.monotonic()).
+        self._used = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_index(self):
+        entries = []
+        for sidecar in glob.glob(self._path('*.json')):
+            try:
+                with open(sidecar, encoding='utf-8') as f:
+                    entry = json.load(f)
+                entries.append((os.path.getmtime(self._path(entry['filename'])), entry))
+            except (OSError, ValueError, KeyError):
+                logger.warning(f'Entrada inválida no cache de downloads: {sidecar}')
+        for _, entry in sorted(entries, key=lambda item: item[0]):
+            self._entries[entry['key']] = entry
+        logger.debug(f'Cache de downloads com {len(self._entries)} arquivo(s).')
+
+    def get(self, url, fmt='mp3', progress_hook=None):
+        """
+        Retorna (entrada, situação) do áudio de `url`, onde situação é 'hit',
+        'miss' (baixado agora) ou 'shared' (baixado por outra requisição
+        simultânea). A entrada tem 'filename', 'title', 'video_id' e 'size'.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f'Formato de download desconhecido: {fmt}')
+        key = download_key(url, fmt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                filepath = self._path(entry['filename'])
+                if os.path.exists(filepath):
+                    self._entries.move_to_end(key)
+                    # A data de modificação preserva a ordem LRU ao reiniciar.
+                    os.utime(filepath)
+                    self._used[key] = time.monotonic()
+                    return entry, HIT
+                del self._entries[key]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._inflight[key] = future
+        if not leader:
+            logger.debug(f'Aguardando download em andamento de {key}.')
+            return future.result(), SHARED
+
+        try:
+            entry = self._produce(url, key, fmt, progress_hook)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = entry
+            self._used[key] = time.monotonic()
+            del self._inflight[key]
+            self._evict(keep=key)
+        future.set_result(entry)
+        return entry, MISS
+
+    def _produce(self, url, key, fmt, progress_hook):
+        source_fmt = TRANSCODE_FROM.get(fmt)
+        if source_fmt and shutil.which('ffmpeg'):
+            with self._lock:
+                source = self._entries.get(download_key(url, source_fmt))
+            if source is not None and os.path.exists(self._path(source['filename'])):
+                try:
+                    return self._transcode(source, key, fmt)
+                except (OSError, subprocess.CalledProcessError):
+                    logger.exception(f'Erro ao converter {source["filename"]}; baixando novamente.')
+        return self._download(url, key, fmt, progress_hook)
+
+    def _transcode(self, source, key, fmt):
+        filepath = self._path(f'{key}.{fmt}')
+        tmp_path = f'{filepath}.tmp'
+        subprocess.run(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-i', self._path(source['filename'])]
+            + TRANSCODE_ARGS[fmt] + [tmp_path],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        os.replace(tmp_path, filepath)
+        logger.debug(f'Áudio convertido localmente: {filepath}')
+        return self._store(key, filepath, source['title'], source.get('video_id'))
+
+    def _store(self, key, filepath, title, vid):
+        entry = {
+            'key': key,
+            'filename': os.path.basename(filepath),
+            'title': title,
+            'video_id': vid,
+            'size': os.path.getsize(filepath),
+        }
+        sidecar = self._path(f'{key}.json')
+        with open(f'{sidecar}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(f'{sidecar}.tmp', sidecar)
+        return entry
+
+    def _download(self, url, key, fmt, progress_hook):
+        options = dict(self.ydl_options, **FORMATS[fmt])
+        options['outtmpl'] = self._path(f'{key}.%(ext)s')
+        if progress_hook:
+            options['progress_hooks'] = [progress_hook]
+
+        with self.extractor(options) as ydl:
+            info = ydl.extract_info(url, download=True)
+        title = info.get('title')
+        if not title:
+            logger.error('Título do vídeo não encontrado.')
+            raise DownloadFailed('Falha ao obter o título do vídeo.')
+
+        filepath = self._downloaded_path(info, key)
+        if filepath is None:
+            logger.error('Arquivo de áudio não foi criado.')
+            raise DownloadFailed('Falha ao baixar o áudio.')
+
+        logger.debug(f'Áudio baixado: {filepath}')
+        return self._store(key, filepath, title, info.get('id'))
+
+    def _downloaded_path(self, info, key):
+        # Caminho final após os pós-processadores, quando o extrator o informa.
+        for download in info.get('requested_downloads') or []:
+            path = download.get('filepath')
+            if path and os.path.exists(path):
+                return path
+        for path in glob.glob(self._path(f'{glob.escape(key)}.*')):
+            if not path.endswith(('.json', '.part', '.tmp')):
+                return path
+        return None
+
+    def _evict(self, keep):
+        total = sum(entry['size'] for entry in self._entries.values())
+        now = time.monotonic()
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep or now - self._used.get(key, -float('inf')) < self.min_age:
+                # Recém-gravada ou devolvida há pouco: o chamador ainda pode abrir o arquivo.
+                continue
+            entry = self._entries.pop(key)
+            self._used.pop(key, None)
+            total -= entry['size']
+            for path in (self._path(entry['filename']), self._path(f'{key}.json')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            logger.debug(f'Download removido do cache: {entry["filename"]}')
@@ -0,0 +1,340 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from analysis import KEY_NAMES, N_MFCC, NOTES
+
+logger = logging.getLogger(__name__)
+
+# Incrementar sempre que a composição dos vetores mudar: armazenamentos
+# gravados com outra versão são recriados.
+FEATURE_VERSION = 1
+
+# Vetor de cada faixa: croma média, MFCC médios, energia (RMS médio) e
+# dançabilidade (força média dos onsets).
+FEATURE_NAMES = ([f'chroma_{note}' for note in NOTES]
+                 + [f'mfcc_{i}' for i in range(N_MFCC)]
+                 + ['energy', 'danceability'])
+DIMENSIONS = len(FEATURE_NAMES)
+
+# Colunas do armazenamento: arquivos binários crus, uma linha por faixa, na
+# ordem da tabela de ids. A tonalidade é o índice em KEY_NAMES (-1: nenhuma).
+COLUMNS = {
+    'vectors': (np.float32, DIMENSIONS),
+    'bpm': (np.float32, 1),
+    'key': (np.int8, 1),
+}
+NO_KEY = -1
+
+# Linhas processadas por vez na busca, para limitar a memória temporária.
+CHUNK_ROWS = 65536
+# As médias e desvios usados na padronização são recalculados quando o
+# número de faixas cresce mais que esta fração.
+STATS_GROWTH = 0.1
+
+
+def feature_vector(analysis):
+    """
+    Monta o vetor de características de um resultado de análise (com
+    'vectors', como devolvido por analyze_signal, finish_features e
+    analyze_stream), ou None se o resultado não traz os vetores médios.
+    """
+    vectors = analysis.get('vectors')
+    if not vectors:
+        return None
+    return np.concatenate([
+        np.asarray(vectors['chroma_mean'], dtype=np.float32),
+        np.asarray(vectors['mfcc_mean'], dtype=np.float32),
+        np.array([analysis['energy'], analysis['danceability']], dtype=np.float32),
+    ])
+
+
+def key_index(name):
+    try:
+        return KEY_NAMES.index(name)
+    except ValueError:
+        return NO_KEY
+
+
+class FeatureStore(object):
+    """
+    Armazenamento colunar dos vetores de características das faixas
+    analisadas, na pasta `directory`: uma matriz float32 (faixas x
+    DIMENSIONS), o BPM e a tonalidade em arquivos binários mapeados em
+    memória, e um SQLite com o id (hash do conteúdo) e o rótulo de cada
+    linha. Nenhuma faixa vira objeto Python na busca: similar() percorre a
+    matriz em blocos de CHUNK_ROWS com operações vetorizadas do NumPy.
+
+    As gravações são serializadas pela transação do SQLite (BEGIN IMMEDIATE),
+    então vários processos podem abrir o mesmo armazenamento.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, 'ids.sqlite')
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._maps = {}
+        self._maps_rows = 0
+        self._maps_lock = threading.Lock()
+        self._stats = None
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+                version = f'{FEATURE_VERSION}:{DIMENSIONS}'
+                row = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+                if row is not None and row[0] != version:
+                    logger.warning('Armazenamento de características de outra versão; recriando.')
+                    conn.execute('DROP TABLE IF EXISTS tracks')
+                conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (version,))
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS tracks ('
+                    ' row INTEGER PRIMARY KEY,'
+                    ' key TEXT UNIQUE NOT NULL,'
+                    ' label TEXT,'
+                    ' updated REAL NOT NULL)'
+                )
+                rows = conn.execute('SELECT COUNT(*) FROM tracks').fetchone()[0]
+                self._truncate(rows)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _column_path(self, name):
+        return os.path.join(self.directory, f'{name}.bin')
+
+    def _row_bytes(self, name):
+        dtype, width = COLUMNS[name]
+        return np.dtype(dtype).itemsize * width
+
+    def _truncate(self, rows):
+        # Linhas gravadas nas colunas sem o id correspondente (gravação
+        # interrompida) são descartadas.
+        for name in COLUMNS:
+            path = self._column_path(name)
+            with open(path, 'ab') as f:
+                size = rows * self._row_bytes(name)
+                if f.tell() > size:
+                    try:
+                        f.truncate(size)
+                    except OSError:
+                        logger.warning(f'Não foi possível truncar {path}.')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM tracks').fetchone()[0]
+
+    def add(self, key, vector, bpm, musical_key, label=None):
+        """
+        Grava o vetor da faixa `key` (hash do conteúdo) com o BPM e a
+        tonalidade (nome em KEY_NAMES) e retorna a linha. Uma faixa já
+        gravada é atualizada na mesma linha.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (DIMENSIONS,):
+            raise ValueError(f'Vetor com {vector.size} dimensões; esperado {DIMENSIONS}.')
+        values = {
+            'vectors': vector,
+            'bpm': np.array([bpm], dtype=np.float32),
+            'key': np.array([key_index(musical_key)], dtype=np.int8),
+        }
+        conn = self._connection()
+        with self._write_lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                found = conn.execute('SELECT row FROM tracks WHERE key = ?', (key,)).fetchone()
+                row = found[0] if found is not None else conn.execute(
+                    'SELECT COUNT(*) FROM tracks').fetchone()[0]
+                # Colunas primeiro: a linha só passa a existir para as buscas
+                # quando o id é gravado.
+                for name, value in values.items():
+                    with open(self._column_path(name), 'r+b') as f:
+                        f.seek(row * self._row_bytes(name))
+                        f.write(value.tobytes())
+                conn.execute(
+                    'INSERT OR REPLACE INTO tracks (row, key, label, updated) VALUES (?, ?, ?, ?)',
+                    (row, key, label, time.time())
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return row
+
+    def _columns(self):
+        """
+        Retorna (linhas, {coluna: array mapeado}) com as linhas já gravadas;
+        os mapeamentos são refeitos só quando o armazenamento cresce.
+        """
+        rows = len(self)
+        with self._maps_lock:
+            if rows != self._maps_rows:
+                maps = {}
+                if rows:
+                    for name, (dtype, width) in COLUMNS.items():
+                        shape = (rows, width) if width > 1 else (rows,)
+                        maps[name] = np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=shape)
+                self._maps, self._maps_rows = maps, rows
+            return self._maps_rows, self._maps
+
+    def row_of(self, key):
+        row = self._connection().execute('SELECT row FROM tracks WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def vector(self, key):
+        row = self.row_of(key)
+        if row is None:
+            return None
+        _, columns = self._columns()
+        return np.array(columns['vectors'][row])
+
+    def tracks(self, chunk_rows=CHUNK_ROWS):
+        """
+        Percorre as faixas gravadas em blocos: listas de (id, tonalidade,
+        BPM, rótulo), na ordem das linhas.
+        """
+        rows, columns = self._columns()
+        conn = self._connection()
+        for start in range(0, rows, chunk_rows):
+            end = min(start + chunk_rows, rows)
+            bpm = columns['bpm'][start:end].tolist()
+            keys = columns['key'][start:end].tolist()
+            chunk = []
+            for row, key, label in conn.execute(
+                    'SELECT row, key, label FROM tracks WHERE row >= ? AND row < ? ORDER BY row', (start, end)):
+                key_value = keys[row - start]
+                chunk.append((key, KEY_NAMES[key_value] if key_value != NO_KEY else None,
+                              bpm[row - start], label))
+            yield chunk
+
+    def _standardization(self, rows, vectors):
+        # Média e desvio de cada dimensão: sem a padronização os MFCCs, em
+        # escala muito maior, dominariam a similaridade de cosseno.
+        if self._stats is not None:
+            stats_rows, mean, scale = self._stats
+            if stats_rows == rows or (rows <= stats_rows * (1 + STATS_GROWTH) and rows > CHUNK_ROWS):
+                return mean, scale
+        total = np.zeros(DIMENSIONS, dtype=np.float64)
+        squares = np.zeros(DIMENSIONS, dtype=np.float64)
+        for start in range(0, rows, CHUNK_ROWS):
+            block = np.asarray(vectors[start:start + CHUNK_ROWS], dtype=np.float64)
+            total += block.sum(axis=0)
+            squares += np.square(block).sum(axis=0)
+        mean = total / rows
+        std = np.sqrt(np.maximum(squares / rows - np.square(mean), 0.0))
+        scale = np.where(std > 1e-6, 1.0 / np.maximum(std, 1e-6), 0.0)
+        self._stats = (rows, mean.astype(np.float32), scale.astype(np.float32))
+        return self._stats[1], self._stats[2]
+
+    def similar(self, query, limit=10, bpm_range=None, keys=None):
+        """
+        Retorna as `limit` faixas mais parecidas com `query` (id de uma faixa
+        gravada, que fica fora do resultado, ou um vetor): similaridade de
+        cosseno entre os vetores padronizados, calculada em blocos sobre a
+        matriz inteira. `bpm_range` (mínimo, máximo) e `keys` (nomes em
+        KEY_NAMES) filtram as candidatas. Cada resultado tem 'key', 'label',
+        'score', 'bpm' e 'musical_key'.
+        """
+        rows, columns = self._columns()
+        if rows == 0:
+            return []
+        exclude = None
+        if isinstance(query, str):
+            exclude = self.row_of(query)
+            if exclude is None or exclude >= rows:
+                raise KeyError(query)
+            query = columns['vectors'][exclude]
+        mean, scale = self._standardization(rows, columns['vectors'])
+        target = (np.asarray(query, dtype=np.float32) - mean) * scale
+        norm = float(np.linalg.norm(target))
+        if norm == 0.0:
+            return []
+        target /= norm
+        wanted = None
+        if keys:
+            wanted = np.array([key_index(name) for name in keys], dtype=np.int8)
+
+        best_rows = []
+        best_scores = []
+        for start in range(0, rows, CHUNK_ROWS):
+            end = min(start + CHUNK_ROWS, rows)
+            # Os filtros são aplicados antes: só as linhas que passam por
+            # eles são lidas e padronizadas.
+            mask = np.ones(end - start, dtype=bool)
+            if bpm_range is not None:
+                bpm = columns['bpm'][start:end]
+                mask &= (bpm >= bpm_range[0]) & (bpm <= bpm_range[1])
+            if wanted is not None:
+                mask &= np.isin(columns['key'][start:end], wanted)
+            if exclude is not None and start <= exclude < end:
+                mask[exclude - start] = False
+            candidates = np.nonzero(mask)[0]
+            if len(candidates) == 0:
+                continue
+            if len(candidates) == end - start:
+                block = np.subtract(columns['vectors'][start:end], mean)
+            else:
+                block = np.subtract(columns['vectors'][start:end][candidates], mean)
+            block *= scale
+            norms = np.sqrt(np.einsum('ij,ij->i', block, block))
+            scores = block @ target
+            scores /= np.maximum(norms, 1e-12)
+            scores[norms == 0] = -np.inf
+            if len(candidates) > limit:
+                top = np.argpartition(-scores, limit - 1)[:limit]
+                candidates, scores = candidates[top], scores[top]
+            best_rows.append(candidates + start)
+            best_scores.append(scores)
+
+        if not best_rows:
+            return []
+        best_rows = np.concatenate(best_rows)
+        best_scores = np.concatenate(best_scores)
+        order = np.argsort(-best_scores, kind='stable')[:limit]
+        ranked = [(int(best_rows[i]), float(best_scores[i])) for i in order
+                  if np.isfinite(best_scores[i])]
+        if not ranked:
+            return []
+        info = {}
+        conn = self._connection()
+        for i in range(0, len(ranked), 500):
+            chunk = [row for row, _ in ranked[i:i + 500]]
+            for row, key, label in conn.execute(
+                    f'SELECT row, key, label FROM tracks WHERE row IN ({",".join("?" * len(chunk))})', chunk):
+                info[row] = (key, label)
+        results = []
+        for row, score in ranked:
+            key, label = info[row]
+            key_value = int(columns['key'][row])
+            results.append({
+                'key': key,
+                'label': label,
+                'score': round(score, 4),
+                'bpm': round(float(columns['bpm'][row]), 2),
+                'musical_key': KEY_NAMES[key_value] if key_value != NO_KEY else None,
+            })
+        return results
+
+    def stats(self):
+        rows, _ = self._columns()
+        return {
+            'tracks': rows,
+            'dimensions': DIMENSIONS,
+            'bytes': sum(rows * self._row_bytes(name) for name in COLUMNS),
+        }
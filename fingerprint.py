@@ -0,0 +1,541 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from startup import lazy_import
+
+librosa = lazy_import('librosa')
+
+logger = logging.getLogger(__name__)
+
+# Incrementar sempre que o cálculo das impressões digitais mudar: índices
+# gravados com outra versão são recriados.
+FINGERPRINT_VERSION = 1
+
+# Espectrograma em taxa fixa, para que arquivos decodificados em taxas
+# diferentes (perfis, MP3 a 48 kHz, áudio do YouTube) gerem os mesmos hashes.
+FP_SAMPLE_RATE = 11025
+FP_N_FFT = 1024
+FP_HOP_LENGTH = 512
+FP_FRAME_SECONDS = FP_HOP_LENGTH / FP_SAMPLE_RATE
+
+# Picos espectrais: máximos locais numa vizinhança de frequência x tempo.
+PEAK_FREQ_SIZE = 21
+PEAK_TIME_SIZE = 11
+PEAK_MIN_DB = -60.0
+MIN_FREQ_BIN = 2
+MAX_FREQ_BIN = 512
+
+# Cada pico é combinado com os FAN_OUT seguintes (marcos): hash de 22 bits
+# com a frequência do primeiro pico (9), a diferença de frequência (7) e a
+# distância em quadros (6).
+FAN_OUT = 5
+MAX_DT = 63
+MAX_DF = 63
+HASH_BITS = 22
+
+# Hashes usados numa consulta (amostrados ao longo da faixa) e votos
+# alinhados necessários para considerar duas faixas a mesma gravação.
+MAX_QUERY_HASHES = 128
+MIN_MATCHES = 12
+OFFSET_TOLERANCE = 1
+# Fração mínima dos hashes consultados alinhados com a faixa para reaproveitar
+# o resultado dela. Recodificações (MP3 de 64-128 kbps, opus, outra
+# introdução) ficam acima de 0,2; uma introdução ou um sample em comum (5 a
+# 10 s numa janela de 60 s) fica perto de 0,1 e passa em MIN_MATCHES, o
+# bastante para /similar mas não para copiar BPM, tonalidade e gênero.
+MIN_REUSE_COVERAGE = 0.2
+# Ocorrências recentes (no SQLite) que disparam a compactação do segmento.
+COMPACT_ROWS = 1000000
+
+
+def _max_filter(S, size, axis):
+    pad = size // 2
+    widths = [(0, 0)] * S.ndim
+    widths[axis] = (pad, pad)
+    padded = np.pad(S, widths, constant_values=-np.inf)
+    return np.lib.stride_tricks.sliding_window_view(padded, size, axis=axis).max(axis=-1)
+
+
+def find_peaks(S):
+    """
+    Retorna (frequências, quadros) dos máximos locais do espectrograma em dB,
+    ordenados por tempo.
+    """
+    local_max = _max_filter(_max_filter(S, PEAK_FREQ_SIZE, 0), PEAK_TIME_SIZE, 1)
+    peaks = (S == local_max) & (S > PEAK_MIN_DB)
+    peaks[:MIN_FREQ_BIN] = False
+    peaks[MAX_FREQ_BIN:] = False
+    freqs, times = np.nonzero(peaks)
+    order = np.lexsort((freqs, times))
+    return freqs[order], times[order]
+
+
+def landmark_hashes(freqs, times):
+    """
+    Combina cada pico com os seguintes dentro da zona alvo e retorna
+    (hashes, quadro do primeiro pico), sem pares repetidos.
+    """
+    hashes = []
+    offsets = []
+    for k in range(1, FAN_OUT + 1):
+        f1, t1 = freqs[:-k], times[:-k]
+        df = freqs[k:] - f1
+        dt = times[k:] - t1
+        ok = (dt >= 1) & (dt <= MAX_DT) & (np.abs(df) <= MAX_DF)
+        hashes.append((f1[ok] << 13) | ((df[ok] + 64) << 6) | dt[ok])
+        offsets.append(t1[ok])
+    if not hashes:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int32)
+    pairs = np.unique(np.stack([np.concatenate(hashes), np.concatenate(offsets)]), axis=1)
+    return pairs[0].astype(np.uint32), pairs[1].astype(np.int32)
+
+
+def compute_fingerprint(y, sr):
+    """
+    Impressão digital de um sinal: hashes de pares de picos espectrais,
+    robustos a recodificação (128k, 320k, opus do YouTube) e a mudanças de
+    volume. Retorna (hashes uint32, quadros int32).
+    """
+    if sr != FP_SAMPLE_RATE:
+        y = librosa.resample(y, orig_sr=sr, target_sr=FP_SAMPLE_RATE, res_type='polyphase')
+    if len(y) < FP_N_FFT:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int32)
+    S = np.abs(librosa.stft(y, n_fft=FP_N_FFT, hop_length=FP_HOP_LENGTH))
+    S = librosa.amplitude_to_db(S, ref=np.max)
+    freqs, times = find_peaks(S)
+    return landmark_hashes(freqs.astype(np.int64), times.astype(np.int64))
+
+
+def result_params(**params):
+    """
+    Parâmetros que influenciam o resultado da análise, no mesmo formato do
+    sufixo das chaves do AnalysisCache.
+    """
+    return '&'.join(f'{name}={params[name]}' for name in sorted(params))
+
+
+def hash_directory(hashes):
+    """
+    Posição da primeira ocorrência de cada hash possível (2^HASH_BITS + 1
+    entradas) num array de hashes ordenado: as ocorrências de h ficam em
+    [diretório[h], diretório[h + 1]).
+    """
+    counts = np.bincount(np.asarray(hashes, dtype=np.int64), minlength=1 << HASH_BITS)
+    return np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+
+class Segment(object):
+    """
+    Listas de ocorrência compactadas: três arrays .npy mapeados em memória,
+    ordenados por hash, e o diretório hash -> primeira ocorrência, que
+    resolve cada hash com duas leituras em vez de uma busca binária sobre
+    todas as ocorrências (segmentos sem diretório usam np.searchsorted).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hashes = np.load(os.path.join(directory, 'hashes.npy'), mmap_mode='r')
+        self.tracks = np.load(os.path.join(directory, 'tracks.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')
+        path = os.path.join(directory, 'directory.npy')
+        self.starts = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+
+    def lookup(self, hashes, offsets):
+        """
+        Retorna (faixas, deslocamentos) de todas as ocorrências dos hashes.
+        """
+        if self.starts is not None:
+            lo = self.starts[hashes]
+            hi = self.starts[hashes + 1]
+        else:
+            # Mesmo dtype do segmento: senão o searchsorted converte (copia)
+            # o array inteiro a cada consulta.
+            hashes = hashes.astype(self.hashes.dtype)
+            lo = np.searchsorted(self.hashes, hashes, side='left')
+            hi = np.searchsorted(self.hashes, hashes, side='right')
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # Índices de todas as faixas [lo, hi) concatenadas, sem laço em Python.
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        idx = starts + np.arange(total)
+        deltas = self.offsets[idx].astype(np.int64) - np.repeat(offsets, counts)
+        return self.tracks[idx].astype(np.int64), deltas
+
+
+def _segment_arrays(segment):
+    if segment is None:
+        return (np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int32))
+    return segment.hashes, segment.tracks, segment.offsets
+
+
+class FingerprintIndex(object):
+    """
+    Índice invertido de hash -> (faixa, quadro), com os resultados de análise
+    de cada faixa por conjunto de parâmetros.
+
+    As faixas, os resultados e as ocorrências recentes ficam num SQLite; a
+    maior parte das ocorrências fica num segmento compactado (arrays
+    ordenados e mapeados em memória, ver Segment), recriado por compact()
+    quando as recentes passam de `compact_rows`. Uma consulta amostra até
+    MAX_QUERY_HASHES hashes, busca-os no segmento (np.searchsorted) e na
+    tabela de recentes e vota pelo deslocamento de tempo entre as faixas:
+    gravações iguais concentram os votos num mesmo deslocamento.
+
+    Pode ser aberto ao mesmo tempo pelos processos de trabalho (consulta) e
+    pelo processo principal (gravação); cada thread mantém a sua conexão.
+    """
+
+    def __init__(self, path, min_matches=MIN_MATCHES, compact_rows=COMPACT_ROWS,
+                 min_coverage=MIN_REUSE_COVERAGE):
+        self.path = path
+        self.min_matches = min_matches
+        self.min_coverage = min_coverage
+        self.compact_rows = compact_rows
+        self.segments_dir = f'{path}.segments'
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._segment = None
+        self._segment_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            if self._meta(conn, 'version', str(FINGERPRINT_VERSION)) != str(FINGERPRINT_VERSION):
+                logger.warning('Índice de impressões digitais de outra versão; recriando.')
+                for table in ('recent', 'results', 'tracks'):
+                    conn.execute(f'DROP TABLE IF EXISTS {table}')
+                conn.execute("DELETE FROM meta WHERE name IN ('segment', 'segment_track')")
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)",
+                         (str(FINGERPRINT_VERSION),))
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tracks ('
+                ' id INTEGER PRIMARY KEY,'
+                ' key TEXT UNIQUE NOT NULL,'
+                ' label TEXT,'
+                ' hashes INTEGER NOT NULL,'
+                ' created REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS recent ('
+                ' hash INTEGER NOT NULL,'
+                ' track INTEGER NOT NULL,'
+                ' offset INTEGER NOT NULL,'
+                ' PRIMARY KEY (hash, track, offset)) WITHOUT ROWID'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                ' track INTEGER NOT NULL,'
+                ' params TEXT NOT NULL,'
+                ' value TEXT NOT NULL,'
+                ' PRIMARY KEY (track, params)) WITHOUT ROWID'
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            # WAL: consultas dos outros processos não esperam pelas gravações.
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _meta(conn, name, default=None):
+        row = conn.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row is not None else default
+
+    def _load_segment(self, generation):
+        # Troca o segmento mapeado quando outro processo compactou o índice.
+        with self._segment_lock:
+            if generation is None:
+                self._segment = None
+            elif self._segment is None or os.path.basename(self._segment.directory) != generation:
+                self._segment = Segment(os.path.join(self.segments_dir, generation))
+            return self._segment
+
+    def add(self, key, hashes, offsets, label=None):
+        """
+        Indexa a impressão digital da faixa `key` (hash do conteúdo) e
+        retorna o id da faixa; faixas já indexadas não são regravadas.
+        """
+        conn = self._connection()
+        with self._write_lock, conn:
+            row = conn.execute('SELECT id FROM tracks WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                return row[0]
+            track = conn.execute(
+                'INSERT INTO tracks (key, label, hashes, created) VALUES (?, ?, ?, ?)',
+                (key, label, len(hashes), time.time())
+            ).lastrowid
+            conn.executemany(
+                'INSERT OR IGNORE INTO recent (hash, track, offset) VALUES (?, ?, ?)',
+                ((int(h), track, int(t)) for h, t in zip(hashes, offsets))
+            )
+            pending = conn.execute(
+                'SELECT COALESCE(SUM(hashes), 0) FROM tracks WHERE id > ?',
+                (int(self._meta(conn, 'segment_track', 0)),)
+            ).fetchone()[0]
+        if self.compact_rows and pending > self.compact_rows and not self._compact_lock.locked():
+            threading.Thread(target=self.compact, name='fingerprint-compact', daemon=True).start()
+        return track
+
+    def add_many(self, tracks):
+        """
+        Indexa várias faixas (key, hashes, quadros, rótulo) de uma vez, direto
+        no segmento compactado em vez da tabela de recentes: para importações
+        grandes (e o benchmark de consulta). Faixas já indexadas não são
+        regravadas. Retorna os ids, na ordem recebida.
+        """
+        conn = self._connection()
+        ids, postings = [], []
+        with self._compact_lock:
+            with self._write_lock, conn:
+                for key, hashes, offsets, label in tracks:
+                    row = conn.execute('SELECT id FROM tracks WHERE key = ?', (key,)).fetchone()
+                    if row is not None:
+                        ids.append(row[0])
+                        continue
+                    track = conn.execute(
+                        'INSERT INTO tracks (key, label, hashes, created) VALUES (?, ?, ?, ?)',
+                        (key, label, len(hashes), time.time())
+                    ).lastrowid
+                    ids.append(track)
+                    pairs = np.unique(np.stack([np.asarray(hashes, dtype=np.int64),
+                                                np.asarray(offsets, dtype=np.int64)]), axis=1)
+                    postings.append(np.stack([pairs[0], np.full(pairs.shape[1], track), pairs[1]], axis=1))
+            if postings:
+                self._merge(np.concatenate(postings))
+        return ids
+
+    def compact(self):
+        """
+        Incorpora as ocorrências recentes ao segmento: grava um novo segmento
+        (intercalando as recentes, já ordenadas, no segmento atual), publica-o
+        e remove as recentes na mesma transação, e apaga os segmentos antigos.
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._merge()
+        finally:
+            self._compact_lock.release()
+
+    def _merge(self, extra=None):
+        # Chamado com _compact_lock; `extra` são ocorrências (hash, faixa,
+        # quadro) que entram no segmento junto com as recentes.
+        conn = self._connection()
+        generation = self._meta(conn, 'segment')
+        max_track = conn.execute('SELECT MAX(track) FROM recent').fetchone()[0]
+        if max_track is None and extra is None:
+            return False
+        rows = []
+        if max_track is not None:
+            rows = conn.execute(
+                'SELECT hash, track, offset FROM recent WHERE track <= ? ORDER BY hash, track, offset',
+                (max_track,)
+            ).fetchall()
+        recent = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        if extra is not None:
+            recent = np.concatenate([recent, extra])
+            recent = recent[np.lexsort((recent[:, 2], recent[:, 1], recent[:, 0]))]
+        segment_track = max(int(recent[:, 1].max()), int(self._meta(conn, 'segment_track', 0)))
+        old = _segment_arrays(self._load_segment(generation))
+        # As recentes entram depois das ocorrências do mesmo hash no segmento.
+        positions = np.searchsorted(old[0], recent[:, 0].astype(old[0].dtype), side='right')
+
+        new_generation = f'{int(time.time() * 1000):x}'
+        target = os.path.join(self.segments_dir, new_generation)
+        tmp_dir = f'{target}.tmp'
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name, column, dtype in (('hashes', 0, np.uint32), ('tracks', 1, np.uint32),
+                                    ('offsets', 2, np.int32)):
+            merged = np.insert(np.asarray(old[column], dtype=dtype), positions, recent[:, column].astype(dtype))
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), merged)
+            if name == 'hashes':
+                np.save(os.path.join(tmp_dir, 'directory.npy'), hash_directory(merged))
+            del merged
+        os.replace(tmp_dir, target)
+
+        with self._write_lock, conn:
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('segment', ?)",
+                         (new_generation,))
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('segment_track', ?)",
+                         (str(segment_track),))
+            if max_track is not None:
+                conn.execute('DELETE FROM recent WHERE track <= ?', (max_track,))
+        self._load_segment(new_generation)
+        logger.debug(f'Índice de impressões digitais compactado: {len(recent)} ocorrência(s) '
+                     f'incorporada(s) ao segmento {new_generation}.')
+
+        for name in os.listdir(self.segments_dir):
+            if name != new_generation:
+                # Outros processos podem manter o segmento antigo mapeado;
+                # no Windows ele só pode ser apagado na próxima compactação.
+                shutil.rmtree(os.path.join(self.segments_dir, name), ignore_errors=True)
+        return True
+
+    def set_result(self, track, params, value):
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO results (track, params, value) VALUES (?, ?, ?)',
+                (track, params, json.dumps(value))
+            )
+
+    def get_result(self, track, params):
+        row = self._connection().execute(
+            'SELECT value FROM results WHERE track = ? AND params = ?', (track, params)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _lookup(self, hashes, offsets):
+        conn = self._connection()
+        # Segmento e recentes lidos no mesmo snapshot, para não contar duas
+        # vezes (nem perder) as ocorrências durante uma compactação.
+        conn.execute('BEGIN')
+        try:
+            generation = self._meta(conn, 'segment')
+            query = defaultdict(list)
+            for h, t in zip(hashes.tolist(), offsets.tolist()):
+                query[h].append(t)
+            keys = list(query)
+            recent = []
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                recent.extend(conn.execute(
+                    f'SELECT hash, track, offset FROM recent WHERE hash IN ({",".join("?" * len(chunk))})',
+                    chunk
+                ))
+        finally:
+            conn.execute('COMMIT')
+
+        tracks, deltas = [], []
+        for h, track, offset in recent:
+            for t in query[h]:
+                tracks.append(track)
+                deltas.append(offset - t)
+        recent_tracks = np.array(tracks, dtype=np.int64)
+        recent_deltas = np.array(deltas, dtype=np.int64)
+        try:
+            segment = self._load_segment(generation)
+        except FileNotFoundError:
+            logger.warning(f'Segmento {generation} do índice de impressões digitais não encontrado.')
+            segment = None
+        if segment is None:
+            return recent_tracks, recent_deltas
+        segment_tracks, segment_deltas = segment.lookup(hashes, offsets)
+        return (np.concatenate([segment_tracks, recent_tracks]),
+                np.concatenate([segment_deltas, recent_deltas]))
+
+    def match(self, hashes, offsets, limit=5):
+        """
+        Retorna as faixas indexadas com a mesma gravação, da mais parecida
+        para a menos: dicionários com 'track', 'key', 'label', 'score' (votos
+        alinhados), 'coverage' (fração dos hashes consultados) e 'offset'
+        (deslocamento em segundos da consulta em relação à faixa).
+        """
+        hashes = np.asarray(hashes, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        step = max(1, -(-len(hashes) // MAX_QUERY_HASHES))
+        hashes, offsets = hashes[::step], offsets[::step]
+        if len(hashes) == 0:
+            return []
+
+        tracks, deltas = self._lookup(hashes, offsets)
+        if len(tracks) == 0:
+            return []
+        # Um voto por (faixa, deslocamento); o deslocamento ocupa os 32 bits
+        # baixos da chave, com viés para ficar positivo.
+        keys, counts = np.unique((tracks << 32) | (deltas + (1 << 31)), return_counts=True)
+        # Tolera o desalinhamento de um quadro entre codificações diferentes.
+        scores = counts.copy()
+        for d in range(1, OFFSET_TOLERANCE + 1):
+            for neighbour in (keys - d, keys + d):
+                pos = np.searchsorted(keys, neighbour)
+                pos = np.minimum(pos, len(keys) - 1)
+                scores += np.where(keys[pos] == neighbour, counts[pos], 0)
+
+        # Melhor deslocamento de cada faixa, só entre as que têm votos suficientes.
+        candidates = np.nonzero(scores >= self.min_matches)[0]
+        if len(candidates) == 0:
+            return []
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        _, first = np.unique(keys[order] >> 32, return_index=True)
+        best = order[np.sort(first)][:limit]
+        ranked = [(int(scores[i]), int(keys[i] >> 32), int(i)) for i in best]
+
+        rows = self._connection().execute(
+            f'SELECT id, key, label FROM tracks WHERE id IN ({",".join("?" * len(ranked))})',
+            [track for _, track, _ in ranked]
+        )
+        info = {row[0]: row[1:] for row in rows}
+        return [{
+            'track': track,
+            'key': info[track][0],
+            'label': info[track][1],
+            'score': score,
+            'coverage': round(min(1.0, score / len(hashes)), 4),
+            'offset': round(-(int(keys[i] & 0xFFFFFFFF) - (1 << 31)) * FP_FRAME_SECONDS, 2),
+        } for score, track, i in ranked if track in info]
+
+    def find_result(self, hashes, offsets, params):
+        """
+        Retorna (correspondência, resultado) da faixa mais parecida que já
+        tem resultado para `params`, ou (None, None). Só faixas com pelo
+        menos `min_coverage` dos hashes alinhados contam: os votos mínimos de
+        match() aceitam também trechos em comum, que não garantem o mesmo
+        BPM, tonalidade e gênero.
+        """
+        for match in self.match(hashes, offsets):
+            if match['coverage'] < self.min_coverage:
+                continue
+            value = self.get_result(match['track'], params)
+            if value is not None:
+                return match, value
+        return None, None
+
+    def stats(self):
+        conn = self._connection()
+        segment = self._load_segment(self._meta(conn, 'segment'))
+        return {
+            'tracks': conn.execute('SELECT COUNT(*) FROM tracks').fetchone()[0],
+            'segment_postings': len(segment.hashes) if segment is not None else 0,
+            'recent_postings': conn.execute('SELECT COUNT(*) FROM recent').fetchone()[0],
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manutenção do índice de impressões digitais.')
+    parser.add_argument('command', choices=('stats', 'compact'),
+                        help='stats: mostra os totais; compact: incorpora as ocorrências recentes ao segmento.')
+    parser.add_argument('--index', default=os.path.join('cache', 'fingerprints.sqlite'),
+                        help='Caminho do índice.')
+    args = parser.parse_args(argv)
+
+    index = FingerprintIndex(args.index, compact_rows=0)
+    if args.command == 'compact':
+        start = time.perf_counter()
+        index.compact()
+        print(f'Índice compactado em {time.perf_counter() - start:.1f}s.')
+    print(json.dumps(index.stats(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
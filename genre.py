@@ -0,0 +1,125 @@
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from startup import lazy_import
+
+joblib = lazy_import('joblib')
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_GENRE = 'Unknown'
+
+
+def model_version(path):
+    """
+    Identifica a versão do modelo pelo tamanho e data de modificação.
+    """
+    if not path or not os.path.exists(path):
+        return 'none'
+    stat = os.stat(path)
+    return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+
+class GenreModel(object):
+    """
+    Modelo de gênero carregado com joblib em `mmap_mode`: os arrays do modelo
+    ficam mapeados do arquivo, e os processos de trabalho compartilham as
+    mesmas páginas em vez de manter uma cópia cada. O arquivo é verificado a
+    cada `check_interval` segundos e recarregado quando muda; para trocar o
+    modelo em produção, grave um novo arquivo e use os.replace (ver export_model).
+    """
+
+    def __init__(self, path, mmap_mode='r', check_interval=2.0):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.check_interval = check_interval
+        self.version = 'none'
+        self._model = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def __bool__(self):
+        return self._model is not None
+
+    def reload(self):
+        """
+        Carrega (ou recarrega) o modelo do disco. Em caso de erro, mantém o
+        modelo anterior.
+        """
+        with self._lock:
+            self._checked = time.monotonic()
+            version = model_version(self.path)
+            if version == self.version:
+                return False
+            if version == 'none':
+                self._model, self.version = None, version
+                logger.warning('Modelo de gênero não encontrado. Gênero será definido como "Unknown".')
+                return True
+            try:
+                model = joblib.load(self.path, mmap_mode=self.mmap_mode)
+            except Exception:
+                logger.exception(f'Erro ao carregar o modelo de gênero {self.path}.')
+                return False
+            self._model, self.version = model, version
+            logger.debug(f'Modelo de gênero carregado ({version}) no processo {os.getpid()}.')
+            return True
+
+    def maybe_reload(self):
+        """
+        Recarrega o modelo se o arquivo mudou desde a última verificação.
+        """
+        if time.monotonic() - self._checked < self.check_interval:
+            return False
+        return self.reload()
+
+    def predict(self, X):
+        """
+        Mesma interface do estimador carregado (compatível com genre_from_mfcc).
+        """
+        if self._model is None:
+            return [UNKNOWN_GENRE] * len(X)
+        return self._model.predict(X)
+
+    def predict_batch(self, mfcc_means):
+        """
+        Classifica vários vetores médios de MFCC numa única chamada ao modelo.
+        """
+        if len(mfcc_means) == 0:
+            return []
+        if self._model is None:
+            return [UNKNOWN_GENRE] * len(mfcc_means)
+        X = np.vstack([np.asarray(m, dtype=np.float64) for m in mfcc_means])
+        return [str(label) for label in self._model.predict(X)]
+
+
+def export_model(model, path):
+    """
+    Grava o modelo sem compressão (requisito do mmap_mode) e de forma atômica,
+    para que processos com o arquivo antigo mapeado não leiam dados parciais.
+    """
+    tmp_path = f'{path}.tmp'
+    joblib.dump(model, tmp_path, compress=0)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Regrava um modelo de gênero em formato compatível com mmap.')
+    parser.add_argument('source', help='Modelo existente (joblib/pickle, comprimido ou não).')
+    parser.add_argument('destination', nargs='?', help='Destino (padrão: sobrescreve a origem).')
+    args = parser.parse_args(argv)
+
+    export_model(joblib.load(args.source), args.destination or args.source)
+    print(f'Modelo gravado em {args.destination or args.source}.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
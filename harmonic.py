@@ -0,0 +1,253 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from analysis import KEY_NAMES, NOTES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join('cache', 'harmonic.sqlite')
+DEFAULT_TOLERANCE = 3.0
+DEFAULT_LIMIT = 50
+
+# Relações de andamento aceitas: a faixa candidata no mesmo BPM, na metade
+# (half-time) ou no dobro (double-time) do BPM de referência.
+TEMPO_RATIOS = (('same', 1.0), ('half', 0.5), ('double', 2.0))
+# Ordem das relações harmônicas na resposta.
+RELATIONS = ('same', 'relative', 'adjacent')
+
+
+def camelot(key_name):
+    """
+    Código da roda de Camelot ('8B' para Dó maior, '8A' para Lá menor) de
+    uma tonalidade em KEY_NAMES, ou None para tonalidades desconhecidas.
+    """
+    if key_name not in KEY_NAMES:
+        return None
+    index = KEY_NAMES.index(key_name)
+    pitch = index % len(NOTES)
+    if index < len(NOTES):
+        return f'{(7 * pitch + 7) % 12 + 1}B'
+    # Menores: mesma posição da relativa maior, três semitons acima.
+    return f'{(7 * (pitch + 3) + 7) % 12 + 1}A'
+
+
+CAMELOT_KEYS = {camelot(name): name for name in KEY_NAMES}
+
+
+def compatible_codes(code):
+    """
+    Códigos compatíveis para mixagem harmônica e a relação de cada um: o
+    próprio código, a relativa (mesmo número, outra letra) e os vizinhos no
+    círculo das quintas (número ±1, mesma letra).
+    """
+    number, letter = int(code[:-1]), code[-1]
+    other = 'A' if letter == 'B' else 'B'
+    return [
+        (code, 'same'),
+        (f'{number}{other}', 'relative'),
+        (f'{(number - 2) % 12 + 1}{letter}', 'adjacent'),
+        (f'{number % 12 + 1}{letter}', 'adjacent'),
+    ]
+
+
+class HarmonicIndex(object):
+    """
+    Índice das faixas analisadas por posição na roda de Camelot e BPM, num
+    SQLite com índice (camelot, bpm): cada consulta é um punhado de buscas
+    por intervalo na árvore B (4 códigos x 3 relações de andamento), em
+    tempo logarítmico no número de faixas, sem percorrer o índice.
+
+    Pode ser aberto por vários processos; cada thread mantém a sua conexão.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tracks ('
+                ' key TEXT PRIMARY KEY,'
+                ' camelot TEXT NOT NULL,'
+                ' bpm REAL NOT NULL,'
+                ' label TEXT,'
+                ' updated REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS tracks_camelot_bpm ON tracks (camelot, bpm)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def add(self, key, musical_key, bpm, label=None):
+        """
+        Indexa (ou atualiza) a faixa `key` (hash do conteúdo). Retorna o
+        código de Camelot, ou None se a tonalidade não é reconhecida.
+        """
+        return self.add_many([(key, musical_key, bpm, label)])[0]
+
+    def add_many(self, tracks):
+        """
+        Indexa uma lista de (id, tonalidade, BPM, rótulo) numa única
+        transação e retorna os códigos de Camelot.
+        """
+        rows = []
+        codes = []
+        now = time.time()
+        for key, musical_key, bpm, label in tracks:
+            code = camelot(musical_key)
+            codes.append(code)
+            if code is not None and bpm and bpm > 0:
+                rows.append((key, code, float(bpm), label, now))
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO tracks (key, camelot, bpm, label, updated) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+        return codes
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT camelot, bpm, label FROM tracks WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'key': key, 'camelot': row[0], 'musical_key': CAMELOT_KEYS[row[0]],
+                'bpm': row[1], 'label': row[2]}
+
+    def compatible(self, musical_key, bpm, tolerance=DEFAULT_TOLERANCE, half_double=True,
+                   limit=DEFAULT_LIMIT, exclude=None):
+        """
+        Faixas harmonicamente compatíveis com `musical_key` cujo BPM fica a
+        até `tolerance` de `bpm` (com `half_double`, também no half-time e
+        no double-time, com a tolerância na mesma escala). Ordenadas pela
+        relação harmônica e pela diferença de BPM; cada resultado tem 'key',
+        'label', 'camelot', 'musical_key', 'bpm', 'relation', 'tempo' e
+        'bpm_delta'.
+        """
+        code = camelot(musical_key)
+        if code is None:
+            raise ValueError(f'Tonalidade desconhecida: {musical_key}')
+        ratios = TEMPO_RATIOS if half_double else TEMPO_RATIOS[:1]
+        conn = self._connection()
+        found = {}
+        for candidate, relation in compatible_codes(code):
+            for tempo, ratio in ratios:
+                rows = conn.execute(
+                    'SELECT key, bpm, label FROM tracks WHERE camelot = ? AND bpm BETWEEN ? AND ? '
+                    'ORDER BY ABS(bpm - ?) LIMIT ?',
+                    (candidate, (bpm - tolerance) * ratio, (bpm + tolerance) * ratio, bpm * ratio, limit)
+                )
+                for key, track_bpm, label in rows:
+                    if key == exclude or key in found:
+                        continue
+                    found[key] = {
+                        'key': key,
+                        'label': label,
+                        'camelot': candidate,
+                        'musical_key': CAMELOT_KEYS[candidate],
+                        'bpm': round(track_bpm, 2),
+                        'relation': relation,
+                        'tempo': tempo,
+                        'bpm_delta': round(track_bpm / ratio - bpm, 2) + 0.0,
+                    }
+        results = sorted(found.values(), key=lambda item: (RELATIONS.index(item['relation']),
+                                                           abs(item['bpm_delta'])))
+        return results[:limit]
+
+    def compatible_with(self, key, **options):
+        """
+        Como compatible(), a partir de uma faixa indexada (que fica fora do
+        resultado). Levanta KeyError se a faixa não está no índice.
+        """
+        track = self.get(key)
+        if track is None:
+            raise KeyError(key)
+        return track, self.compatible(track['musical_key'], track['bpm'], exclude=key, **options)
+
+    def stats(self):
+        conn = self._connection()
+        return {
+            'tracks': conn.execute('SELECT COUNT(*) FROM tracks').fetchone()[0],
+            'camelot': dict(conn.execute('SELECT camelot, COUNT(*) FROM tracks GROUP BY camelot')),
+        }
+
+
+def rebuild_from_features(index, features_path):
+    """
+    Indexa as faixas já gravadas no armazenamento de características
+    (analisadas antes de o índice existir). Retorna o total indexado.
+    """
+    from feature_store import FeatureStore
+
+    total = 0
+    for chunk in FeatureStore(features_path).tracks():
+        index.add_many(chunk)
+        total += len(chunk)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Consulta de faixas compatíveis para mixagem (tonalidade e BPM).')
+    parser.add_argument('command', choices=('query', 'stats', 'rebuild'),
+                        help='query: faixas compatíveis; stats: totais por código de Camelot; '
+                             'rebuild: indexa as faixas do armazenamento de características.')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help='Caminho do índice.')
+    parser.add_argument('--features', default=os.path.join('cache', 'features'),
+                        help='Pasta do armazenamento de características (rebuild).')
+    parser.add_argument('--track', help='Id de uma faixa indexada (query).')
+    parser.add_argument('--key', help="Tonalidade de referência, por exemplo 'A Minor' (query).")
+    parser.add_argument('--bpm', type=float, help='BPM de referência (query).')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Diferença máxima de BPM (query).')
+    parser.add_argument('--no-half-double', action='store_true',
+                        help='Não considera half-time e double-time (query).')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help='Máximo de resultados (query).')
+    args = parser.parse_args(argv)
+
+    index = HarmonicIndex(args.index)
+    if args.command == 'stats':
+        print(json.dumps(index.stats(), indent=2))
+        return 0
+    if args.command == 'rebuild':
+        total = rebuild_from_features(index, args.features)
+        print(f'{total} faixa(s) indexada(s).')
+        return 0
+
+    options = {'tolerance': args.tolerance, 'half_double': not args.no_half_double, 'limit': args.limit}
+    try:
+        if args.track:
+            _, results = index.compatible_with(args.track, **options)
+        elif args.key and args.bpm:
+            results = index.compatible(args.key, args.bpm, **options)
+        else:
+            parser.error('informe --track ou --key e --bpm.')
+    except KeyError:
+        print(f'Faixa não encontrada: {args.track}', file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,613 @@
+import io
+import logging
+import os
+import struct
+import tempfile
+import zlib
+
+logger = logging.getLogger(__name__)
+
+ID3V1_SIZE = 128
+# Espaço livre deixado no fim da tag, para que edições futuras caibam no lugar.
+DEFAULT_PADDING = 2048
+# Quanto do início do áudio é lido para encontrar o primeiro quadro MPEG.
+MPEG_SCAN_BYTES = 64 * 1024
+
+ID3V1_GENRES = [
+    'Blues', 'Classic Rock', 'Country', 'Dance', 'Disco', 'Funk', 'Grunge', 'Hip-Hop', 'Jazz',
+    'Metal', 'New Age', 'Oldies', 'Other', 'Pop', 'R&B', 'Rap', 'Reggae', 'Rock', 'Techno',
+    'Industrial', 'Alternative', 'Ska', 'Death Metal', 'Pranks', 'Soundtrack', 'Euro-Techno',
+    'Ambient', 'Trip-Hop', 'Vocal', 'Jazz+Funk', 'Fusion', 'Trance', 'Classical', 'Instrumental',
+    'Acid', 'House', 'Game', 'Sound Clip', 'Gospel', 'Noise', 'AlternRock', 'Bass', 'Soul', 'Punk',
+    'Space', 'Meditative', 'Instrumental Pop', 'Instrumental Rock', 'Ethnic', 'Gothic', 'Darkwave',
+    'Techno-Industrial', 'Electronic', 'Pop-Folk', 'Eurodance', 'Dream', 'Southern Rock', 'Comedy',
+    'Cult', 'Gangsta', 'Top 40', 'Christian Rap', 'Pop/Funk', 'Jungle', 'Native American',
+    'Cabaret', 'New Wave', 'Psychadelic', 'Rave', 'Showtunes', 'Trailer', 'Lo-Fi', 'Tribal',
+    'Acid Punk', 'Acid Jazz', 'Polka', 'Retro', 'Musical', 'Rock & Roll', 'Hard Rock', 'Folk',
+    'Folk-Rock', 'National Folk', 'Swing', 'Fast Fusion', 'Bebob', 'Latin', 'Revival', 'Celtic',
+    'Bluegrass', 'Avantgarde', 'Gothic Rock', 'Progressive Rock', 'Psychedelic Rock',
+    'Symphonic Rock', 'Slow Rock', 'Big Band', 'Chorus', 'Easy Listening', 'Acoustic', 'Humour',
+    'Speech', 'Chanson', 'Opera', 'Chamber Music', 'Sonata', 'Symphony', 'Booty Bass', 'Primus',
+    'Porn Groove', 'Satire', 'Slow Jam', 'Club', 'Tango', 'Samba', 'Folklore', 'Ballad',
+    'Power Ballad', 'Rhythmic Soul', 'Freestyle', 'Duet', 'Punk Rock', 'Drum Solo', 'A capella',
+    'Euro-House', 'Dance Hall', 'Goa', 'Drum & Bass', 'Club-House', 'Hardcore', 'Terror', 'Indie',
+    'BritPop', 'Afro-Punk', 'Polsk Punk', 'Beat', 'Christian Gangsta', 'Heavy Metal', 'Black Metal',
+    'Crossover', 'Contemporary Christian', 'Christian Rock', 'Merengue', 'Salsa', 'Thrash Metal',
+    'Anime', 'JPop', 'Synthpop',
+]
+
+# Quadros de texto e os nomes de tag usados pelo ffmpeg/ffprobe.
+FRAME_TAGS = {
+    'TIT2': 'title', 'TPE1': 'artist', 'TALB': 'album', 'TCON': 'genre', 'TDRC': 'date',
+    'TYER': 'date', 'TRCK': 'track', 'TPE2': 'album_artist', 'TPOS': 'disc', 'TCOM': 'composer',
+    'TCOP': 'copyright', 'TENC': 'encoded_by', 'TSSE': 'encoder', 'TPUB': 'publisher',
+    'TLAN': 'language',
+}
+TAG_FRAMES = {tag: frame for frame, tag in FRAME_TAGS.items() if frame != 'TYER'}
+
+# Identificadores de 3 caracteres do ID3v2.2 convertidos para os do 2.3/2.4.
+V22_FRAMES = {
+    'TT2': 'TIT2', 'TP1': 'TPE1', 'TAL': 'TALB', 'TCO': 'TCON', 'TYE': 'TYER', 'TRK': 'TRCK',
+    'TP2': 'TPE2', 'TPA': 'TPOS', 'TCM': 'TCOM', 'TCR': 'TCOP', 'TEN': 'TENC', 'TSS': 'TSSE',
+    'TPB': 'TPUB', 'TLA': 'TLAN', 'COM': 'COMM', 'ULT': 'USLT', 'TXX': 'TXXX',
+}
+
+# Quadros lidos por read_tags; os demais (capas etc.) são pulados sem leitura.
+TEXT_FRAMES = ('T', 'COMM', 'USLT')
+
+ENCODINGS = {0: 'latin-1', 1: 'utf-16', 2: 'utf-16-be', 3: 'utf-8'}
+
+MPEG1, MPEG2, MPEG25 = 3, 2, 0
+LAYER1, LAYER2, LAYER3 = 3, 2, 1
+BITRATES = {
+    (MPEG1, LAYER1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (MPEG1, LAYER2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (MPEG1, LAYER3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (MPEG2, LAYER1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (MPEG2, LAYER2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+BITRATES[(MPEG2, LAYER3)] = BITRATES[(MPEG2, LAYER2)]
+SAMPLE_RATES = {MPEG1: [44100, 48000, 32000], MPEG2: [22050, 24000, 16000], MPEG25: [11025, 12000, 8000]}
+CODECS = {LAYER1: ('mp1', 'MP1 (MPEG audio layer 1)'), LAYER2: ('mp2', 'MP2 (MPEG audio layer 2)'),
+          LAYER3: ('mp3', 'MP3 (MPEG audio layer 3)')}
+
+
+class ID3Error(Exception):
+    """
+    Tag ID3 inválida ou que não pode ser processada.
+    """
+
+
+class Tag(object):
+    """
+    Tag ID3v2 lida de um arquivo: versão (2, 3 ou 4), tamanho total em disco
+    (0 se não há tag) e quadros como pares (id, conteúdo). `complete` é
+    falso quando algum quadro não pôde ser lido ou convertido (compressão
+    do ID3v2.2, quadros criptografados, quadros do 2.2 sem equivalente,
+    cabeçalhos inválidos): reescrever a tag a partir de `frames` perderia
+    esses quadros.
+    """
+
+    def __init__(self, version=0, size=0, frames=None, complete=True):
+        self.version = version
+        self.size = size
+        self.frames = frames or []
+        self.complete = complete
+
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _to_syncsafe(value):
+    return bytes([(value >> 21) & 0x7f, (value >> 14) & 0x7f, (value >> 7) & 0x7f, value & 0x7f])
+
+
+def _remove_unsync(data):
+    return data.replace(b'\xff\x00', b'\xff')
+
+
+def _read_frames(f, version, end, wanted):
+    """
+    Lê os quadros até `end`. Quadros fora de `wanted` são pulados com seek,
+    sem ler o conteúdo (imagens de capa podem ter vários megabytes).
+    Retorna (quadros, completo), com completo falso se algum quadro foi
+    descartado ou a leitura parou antes do preenchimento.
+    """
+    header_size = 6 if version == 2 else 10
+    frames = []
+    complete = True
+    while f.tell() + header_size <= end:
+        header = f.read(header_size)
+        if len(header) < header_size or header[0] == 0:
+            break  # Início do preenchimento.
+        if version == 2:
+            frame_id = V22_FRAMES.get(header[:3].decode('latin-1'), header[:3].decode('latin-1'))
+            size = int.from_bytes(header[3:6], 'big')
+            flags = 0
+        else:
+            frame_id = header[:4].decode('latin-1')
+            size = _syncsafe(header[4:8]) if version == 4 else int.from_bytes(header[4:8], 'big')
+            flags = int.from_bytes(header[8:10], 'big')
+        if size <= 0 or f.tell() + size > end:
+            complete = False
+            break
+        if wanted is not None and not frame_id.startswith(wanted):
+            f.seek(size, os.SEEK_CUR)
+            continue
+        data = f.read(size)
+        try:
+            data = _decode_frame_data(data, version, flags)
+        except (ID3Error, zlib.error) as e:
+            logger.debug(f'Quadro {frame_id} ignorado: {e}')
+            complete = False
+            continue
+        if version == 2 and len(frame_id) == 3:
+            complete = False
+            continue  # Quadro do ID3v2.2 sem equivalente (ex.: PIC).
+        frames.append((frame_id, data))
+    return frames, complete
+
+
+def _decode_frame_data(data, version, flags):
+    if version == 4:
+        if flags & 0x0004:
+            raise ID3Error('quadro criptografado')
+        if flags & 0x0001:
+            data = data[4:]  # Indicador de tamanho dos dados.
+        if flags & 0x0002:
+            data = _remove_unsync(data)
+        if flags & 0x0008:
+            data = zlib.decompress(data)
+    elif version == 3:
+        if flags & 0x0040:
+            raise ID3Error('quadro criptografado')
+        if flags & 0x0020:
+            data = data[1:]  # Identificador de grupo.
+        if flags & 0x0080:
+            data = zlib.decompress(data[4:])
+    return data
+
+
+def read_tag(f, wanted=TEXT_FRAMES):
+    """
+    Lê a tag ID3v2 no início de `f` (arquivo binário). Com `wanted=None`,
+    todos os quadros são carregados (usado ao reescrever a tag).
+    """
+    f.seek(0)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b'ID3' or header[3] not in (2, 3, 4):
+        return Tag()
+    version, flags = header[3], header[5]
+    body_size = _syncsafe(header[6:10])
+    size = 10 + body_size + (10 if version == 4 and flags & 0x10 else 0)
+    end = 10 + body_size
+    if version == 2 and flags & 0x40:
+        return Tag(version, size, complete=False)  # Compressão do ID3v2.2, sem formato definido.
+
+    if flags & 0x80 and version < 4:
+        # Dessincronização na tag inteira (ID3v2.2/2.3): processa em memória.
+        body = _remove_unsync(f.read(body_size))
+        f = io.BytesIO(b'\0' * 10 + body)
+        f.seek(10)
+        end = 10 + len(body)
+    if flags & 0x40 and version >= 3:
+        extended = f.read(4)
+        extended_size = _syncsafe(extended) - 4 if version == 4 else int.from_bytes(extended, 'big')
+        f.seek(extended_size, os.SEEK_CUR)
+    frames, complete = _read_frames(f, version, end, wanted)
+    return Tag(version, size, frames, complete)
+
+
+def _split_string(encoding, data):
+    """
+    Separa a primeira string terminada em nulo do restante dos dados.
+    """
+    if encoding in (1, 2):
+        index = 0
+        while True:
+            index = data.find(b'\0\0', index)
+            if index < 0:
+                return data, b''
+            if index % 2 == 0:
+                return data[:index], data[index + 2:]
+            index += 1
+    index = data.find(b'\0')
+    if index < 0:
+        return data, b''
+    return data[:index], data[index + 1:]
+
+
+def _decode(encoding, data):
+    text = data.decode(ENCODINGS.get(encoding, 'latin-1'), errors='replace')
+    return '/'.join(value for value in text.split('\0') if value)
+
+
+def _resolve_genre(value):
+    # Referências numéricas ao ID3v1: "(13)", "13" ou "(13)Pop".
+    stripped = value.strip()
+    if stripped.startswith('(') and ')' in stripped:
+        number, rest = stripped[1:].split(')', 1)
+        if number.isdigit():
+            if rest:
+                return rest
+            stripped = number
+    if stripped.isdigit() and int(stripped) < len(ID3V1_GENRES):
+        return ID3V1_GENRES[int(stripped)]
+    return value
+
+
+def _frame_value(frame_id, data):
+    """
+    Converte um quadro em (nome da tag, valor), ou None se não é textual.
+    """
+    if not data:
+        return None
+    encoding, payload = data[0], data[1:]
+    if frame_id == 'TXXX':
+        description, value = _split_string(encoding, payload)
+        return _decode(encoding, description) or 'TXXX', _decode(encoding, value)
+    if frame_id in ('COMM', 'USLT'):
+        description, value = _split_string(encoding, payload[3:])
+        description = _decode(encoding, description)
+        base = 'comment' if frame_id == 'COMM' else 'lyrics'
+        if not description:
+            return base, _decode(encoding, value)
+        return (description if frame_id == 'COMM' else f'{base}-{description}'), _decode(encoding, value)
+    if frame_id.startswith('T'):
+        value = _decode(encoding, payload)
+        if frame_id == 'TCON':
+            value = _resolve_genre(value)
+        return FRAME_TAGS.get(frame_id, frame_id), value
+    return None
+
+
+def read_id3v1(f):
+    """
+    Lê a tag ID3v1/1.1 dos últimos 128 bytes, se existir.
+    """
+    f.seek(0, os.SEEK_END)
+    if f.tell() < ID3V1_SIZE:
+        return {}
+    f.seek(-ID3V1_SIZE, os.SEEK_END)
+    data = f.read(ID3V1_SIZE)
+    if data[:3] != b'TAG':
+        return {}
+
+    def text(raw):
+        return raw.split(b'\0', 1)[0].decode('latin-1').strip()
+
+    tags = {'title': text(data[3:33]), 'artist': text(data[33:63]), 'album': text(data[63:93]),
+            'date': text(data[93:97])}
+    comment = data[97:127]
+    if comment[28] == 0 and comment[29] != 0:
+        tags['track'] = str(comment[29])
+        comment = comment[:28]
+    tags['comment'] = text(comment)
+    if data[127] < len(ID3V1_GENRES):
+        tags['genre'] = ID3V1_GENRES[data[127]]
+    return {name: value for name, value in tags.items() if value}
+
+
+def _collect_tags(tag, v1_tags):
+    tags = {}
+    for frame_id, data in tag.frames:
+        item = _frame_value(frame_id, data)
+        if item and item[0] not in tags:
+            tags[item[0]] = item[1]
+    for name, value in v1_tags.items():
+        tags.setdefault(name, value)
+    return tags
+
+
+def read_tags(path):
+    """
+    Lê as tags de um arquivo como um dicionário no formato do ffprobe
+    (title, artist, album, genre, date, track, comment, lyrics...). Os
+    valores do ID3v2 têm prioridade sobre os do ID3v1.
+    """
+    with open(path, 'rb') as f:
+        return _collect_tags(read_tag(f), read_id3v1(f))
+
+
+def parse_frame_header(header):
+    """
+    Interpreta o cabeçalho de 4 bytes de um quadro MPEG de áudio. Retorna um
+    dicionário com versão, camada, taxa de bits, taxa de amostragem, canais e
+    tamanho do quadro, ou None se o cabeçalho é inválido.
+    """
+    if len(header) < 4 or header[0] != 0xff or header[1] & 0xe0 != 0xe0:
+        return None
+    value = int.from_bytes(header[:4], 'big')
+    version = (value >> 19) & 3
+    layer = (value >> 17) & 3
+    bitrate_index = (value >> 12) & 0xf
+    rate_index = (value >> 10) & 3
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    padding = (value >> 9) & 1
+    channel_mode = (value >> 6) & 3
+    bitrate = BITRATES[(MPEG1 if version == MPEG1 else MPEG2, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    if layer == LAYER1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 576 if layer == LAYER3 and version != MPEG1 else 1152
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {
+        'version': version,
+        'layer': layer,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'channels': 1 if channel_mode == 3 else 2,
+        'samples': samples,
+        'length': length,
+    }
+
+
+def _find_first_frame(data):
+    index = data.find(b'\xff')
+    while 0 <= index < len(data) - 4:
+        frame = parse_frame_header(data[index:index + 4])
+        if frame is not None:
+            following = index + frame['length']
+            # Confirma com o quadro seguinte para não aceitar um falso sincronismo.
+            if following + 4 > len(data) or parse_frame_header(data[following:following + 4]):
+                return index, frame
+        index = data.find(b'\xff', index + 1)
+    return None, None
+
+
+def _vbr_header(data, frame):
+    """
+    Número de quadros e de bytes dos cabeçalhos Xing/Info ou VBRI, se houver.
+    """
+    if frame['version'] == MPEG1:
+        side_info = 17 if frame['channels'] == 1 else 32
+    else:
+        side_info = 9 if frame['channels'] == 1 else 17
+    offset = 4 + side_info
+    if data[offset:offset + 4] in (b'Xing', b'Info'):
+        flags = int.from_bytes(data[offset + 4:offset + 8], 'big')
+        position = offset + 8
+        frames = size = None
+        if flags & 1:
+            frames = int.from_bytes(data[position:position + 4], 'big')
+            position += 4
+        if flags & 2:
+            size = int.from_bytes(data[position:position + 4], 'big')
+        return frames, size
+    if data[36:40] == b'VBRI':
+        size, frames = struct.unpack('>II', data[46:54])
+        return frames, size
+    return None, None
+
+
+def probe(path):
+    """
+    Lê tags e propriedades do áudio de um MP3 sem processos externos e
+    retorna um dicionário no mesmo formato do ffprobe (-show_format
+    -show_streams). Retorna None se não encontra um quadro MPEG válido, para
+    que o chamador use o ffprobe.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        tag = read_tag(f)
+        f.seek(tag.size)
+        data = f.read(MPEG_SCAN_BYTES)
+        v1_tags = read_id3v1(f)
+        f.seek(-min(ID3V1_SIZE, file_size), os.SEEK_END)
+        has_v1 = file_size >= ID3V1_SIZE and f.read(3) == b'TAG'
+    offset, frame = _find_first_frame(data)
+    if frame is None:
+        return None
+
+    audio_size = file_size - tag.size - offset - (ID3V1_SIZE if has_v1 else 0)
+    frames, vbr_size = _vbr_header(data[offset:offset + frame['length']], frame)
+    if frames:
+        duration = frames * frame['samples'] / frame['sample_rate']
+        bitrate = int((vbr_size or audio_size) * 8 / duration) if duration else frame['bitrate']
+    else:
+        bitrate = frame['bitrate']
+        duration = audio_size * 8 / bitrate
+    codec_name, codec_long_name = CODECS[frame['layer']]
+
+    return {
+        'streams': [{
+            'index': 0,
+            'codec_name': codec_name,
+            'codec_long_name': codec_long_name,
+            'codec_type': 'audio',
+            'sample_rate': str(frame['sample_rate']),
+            'channels': frame['channels'],
+            'channel_layout': 'mono' if frame['channels'] == 1 else 'stereo',
+            'duration': f'{duration:.6f}',
+            'bit_rate': str(bitrate),
+        }],
+        'format': {
+            'filename': path,
+            'nb_streams': 1,
+            'format_name': 'mp3',
+            'format_long_name': 'MP2/3 (MPEG audio layer 2/3)',
+            'duration': f'{duration:.6f}',
+            'size': str(file_size),
+            'bit_rate': str(int(file_size * 8 / duration)) if duration else str(bitrate),
+            'tags': _collect_tags(tag, v1_tags),
+        },
+    }
+
+
+def _encode_text(text, version):
+    if version == 4:
+        return 3, text.encode('utf-8')
+    try:
+        return 0, text.encode('latin-1')
+    except UnicodeEncodeError:
+        return 1, text.encode('utf-16')
+
+
+def _terminator(encoding):
+    return b'\0\0' if encoding in (1, 2) else b'\0'
+
+
+def _build_frame_data(frame_id, value, version, description=''):
+    if frame_id in ('COMM', 'USLT', 'TXXX'):
+        encoding, _ = _encode_text(description + value, version)
+        codec = ENCODINGS[encoding]
+        language = b'' if frame_id == 'TXXX' else b'eng'
+        return (bytes([encoding]) + language + description.encode(codec) + _terminator(encoding)
+                + value.encode(codec))
+    encoding, text = _encode_text(value, version)
+    return bytes([encoding]) + text
+
+
+def _tag_target(name, version):
+    """
+    Quadro (e descrição, para COMM/USLT/TXXX) onde uma tag é gravada.
+    """
+    if name == 'comment':
+        return 'COMM', ''
+    if name == 'lyrics':
+        return 'USLT', ''
+    if name.startswith('lyrics-'):
+        return 'USLT', name[len('lyrics-'):]
+    if name == 'date':
+        return ('TDRC' if version == 4 else 'TYER'), None
+    if name in TAG_FRAMES:
+        return TAG_FRAMES[name], None
+    if len(name) == 4 and name.isupper() and name.startswith('T') and name != 'TXXX':
+        return name, None
+    return 'TXXX', name
+
+
+def _matches(frame_id, data, target, description):
+    if target in ('TDRC', 'TYER'):
+        return frame_id in ('TDRC', 'TYER', 'TDAT')
+    if frame_id != target:
+        return False
+    if description is None:
+        return True
+    if not data:
+        return False
+    encoding = data[0]
+    payload = data[4:] if frame_id in ('COMM', 'USLT') else data[1:]
+    return _decode(encoding, _split_string(encoding, payload)[0]) == description
+
+
+def merge_frames(frames, tags, version):
+    """
+    Aplica `tags` (nome -> valor, como no -metadata do ffmpeg) aos quadros
+    existentes: substitui os quadros correspondentes, remove-os quando o
+    valor é vazio e mantém todos os demais (capas, tags desconhecidas...).
+    """
+    frames = list(frames)
+    for name, value in tags.items():
+        target, description = _tag_target(name, version)
+        kept = [(fid, data) for fid, data in frames if not _matches(fid, data, target, description)]
+        frames = kept
+        if value is None or str(value) == '':
+            continue
+        value = str(value)
+        if target == 'TYER':
+            value = value[:4]
+        frames.append((target, _build_frame_data(target, value, version, description or '')))
+    return frames
+
+
+def render_tag(frames, version, padding=DEFAULT_PADDING, min_size=0):
+    """
+    Serializa a tag ID3v2.3/2.4 (sem dessincronização nem compressão),
+    preenchida com zeros até pelo menos `min_size` bytes.
+    """
+    body = b''
+    for frame_id, data in frames:
+        size = _to_syncsafe(len(data)) if version == 4 else len(data).to_bytes(4, 'big')
+        body += frame_id.encode('latin-1') + size + b'\0\0' + data
+    total = max(10 + len(body) + padding, min_size)
+    body += b'\0' * (total - 10 - len(body))
+    return b'ID3' + bytes([version, 0, 0]) + _to_syncsafe(len(body)) + body
+
+
+def _render_id3v1(existing, tags):
+    data = bytearray(existing)
+
+    def put(start, length, value):
+        raw = value.encode('latin-1', errors='replace')[:length]
+        data[start:start + length] = raw + b'\0' * (length - len(raw))
+
+    fields = {'title': (3, 30), 'artist': (33, 30), 'album': (63, 30), 'date': (93, 4)}
+    for name, (start, length) in fields.items():
+        if name in tags:
+            put(start, length, str(tags[name] or ''))
+    if 'comment' in tags:
+        put(97, 28, str(tags['comment'] or ''))
+    if 'track' in tags:
+        track = str(tags['track'] or '').split('/')[0]
+        data[125] = 0
+        data[126] = int(track) if track.isdigit() and int(track) < 256 else 0
+    if 'genre' in tags and tags['genre'] in ID3V1_GENRES:
+        data[127] = ID3V1_GENRES.index(tags['genre'])
+    return bytes(data)
+
+
+def write_tags(path, tags, output_path=None, padding=DEFAULT_PADDING):
+    """
+    Atualiza as tags ID3 sem recodificar o áudio. A tag ID3v1, se existir,
+    também é atualizada. Sem `output_path` (ou com o mesmo caminho) a tag é
+    regravada no lugar quando cabe no espaço da tag atual; caso contrário o
+    arquivo é reescrito (tag nova + áudio copiado) e substituído
+    atomicamente. Com `output_path`, grava uma cópia com as tags novas.
+
+    Levanta ID3Error se a tag atual não pôde ser lida por completo, para
+    que o chamador use o ffmpeg em vez de descartar os quadros não lidos.
+    """
+    in_place = output_path is None or os.path.abspath(output_path) == os.path.abspath(path)
+    with open(path, 'rb') as f:
+        tag = read_tag(f, wanted=None)
+        if not tag.complete:
+            raise ID3Error('a tag ID3 atual não pôde ser lida por completo')
+        version = tag.version if tag.version in (3, 4) else 3
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        v1 = b''
+        if file_size - tag.size >= ID3V1_SIZE:
+            f.seek(-ID3V1_SIZE, os.SEEK_END)
+            v1 = f.read(ID3V1_SIZE)
+            if v1[:3] != b'TAG':
+                v1 = b''
+    frames = merge_frames(tag.frames, tags, version)
+    if v1:
+        v1 = _render_id3v1(v1, tags)
+
+    if in_place and tag.size:
+        rendered = render_tag(frames, version, padding=0)
+        if len(rendered) <= tag.size:
+            with open(path, 'r+b') as f:
+                f.write(render_tag(frames, version, padding=0, min_size=tag.size))
+                if v1:
+                    f.seek(-ID3V1_SIZE, os.SEEK_END)
+                    f.write(v1)
+            return path
+
+    target = path if in_place else output_path
+    directory = os.path.dirname(os.path.abspath(target))
+    fd, tmp_path = tempfile.mkstemp(prefix='.id3-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as out, open(path, 'rb') as f:
+            out.write(render_tag(frames, version, padding))
+            f.seek(tag.size)
+            remaining = file_size - tag.size - len(v1)
+            while remaining > 0:
+                chunk = f.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                out.write(chunk)
+                remaining -= len(chunk)
+            out.write(v1)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return target
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+
+class Job(object):
+    """
+    Job assíncrono com resultados parciais e uma lista de eventos que pode ser
+    acompanhada por vários consumidores (polling ou streaming).
+    """
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.result = {}
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._events = []
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in (DONE, ERROR)
+
+    def _append(self, name, data):
+        self._events.append((name, data))
+        self._cond.notify_all()
+
+    def start(self):
+        with self._cond:
+            if self.status == QUEUED:
+                self.status = RUNNING
+                self._append('status', RUNNING)
+
+    def publish(self, name, value):
+        """
+        Registra um resultado parcial assim que ele é calculado.
+        """
+        with self._cond:
+            if self.done:
+                return
+            if self.status == QUEUED:
+                self.status = RUNNING
+                self._append('status', RUNNING)
+            self.result[name] = value
+            self._append(name, value)
+
+    def finish(self, result):
+        with self._cond:
+            if self.done:
+                return
+            self.result.update(result)
+            self.status = DONE
+            self.finished = time.time()
+            self._append(DONE, self.result)
+
+    def fail(self, error):
+        with self._cond:
+            if self.done:
+                return
+            self.error = error
+            self.status = ERROR
+            self.finished = time.time()
+            self._append(ERROR, error)
+
+    def events(self, start=0, keepalive=15):
+        """
+        Gera os eventos a partir do índice indicado, bloqueando até chegarem
+        novos; produz None a cada `keepalive` segundos sem eventos.
+        """
+        index = start
+        while True:
+            with self._cond:
+                if index >= len(self._events) and not self.done:
+                    self._cond.wait(timeout=keepalive)
+                pending = self._events[index:]
+                finished = self.done
+            if not pending:
+                if finished:
+                    return
+                yield None
+                continue
+            for event in pending:
+                yield event
+            index += len(pending)
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'result': dict(self.result),
+                'error': self.error,
+            }
+
+
+class JobStore(object):
+    """
+    Registro em memória dos jobs, descartando os concluídos após `ttl` segundos.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind):
+        job = Job(kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        logger.debug(f'Job {job.id} ({kind}) criado.')
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        limit = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished is not None and job.finished < limit]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,141 @@
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'unspokenfreq', 'metadata.sqlite')
+
+
+class MetadataIndex(object):
+    """
+    Índice persistente (SQLite) dos metadados já lidos, chaveado pelo caminho
+    e validado pela data de modificação e pelo tamanho do arquivo: só os
+    arquivos alterados precisam ser lidos de novo.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS metadata ('
+                ' path TEXT PRIMARY KEY,'
+                ' mtime_ns INTEGER NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' value TEXT NOT NULL)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, stats):
+        """
+        Recebe {caminho: os.stat_result} e retorna {caminho: metadados} dos
+        arquivos cujo registro ainda corresponde ao arquivo em disco.
+        """
+        found = {}
+        if not stats:
+            return found
+        with self._lock, self._connect() as conn:
+            paths = list(stats)
+            # Consulta em blocos para respeitar o limite de parâmetros do SQLite.
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows = conn.execute(
+                    f'SELECT path, mtime_ns, size, value FROM metadata '
+                    f'WHERE path IN ({",".join("?" * len(chunk))})', chunk
+                ).fetchall()
+                for path, mtime_ns, size, value in rows:
+                    stat = stats[path]
+                    if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+                        found[path] = json.loads(value)
+        return found
+
+    def set_many(self, entries):
+        """
+        Grava uma lista de (caminho, os.stat_result, metadados).
+        """
+        if not entries:
+            return
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO metadata (path, mtime_ns, size, value) VALUES (?, ?, ?, ?)',
+                [(path, stat.st_mtime_ns, stat.st_size, json.dumps(metadata))
+                 for path, stat, metadata in entries]
+            )
+
+
+class MetadataScanner(object):
+    """
+    Lê os metadados de vários arquivos em paralelo com `probe(caminho)`
+    (por exemplo get_audio_metadata, que chama o ffprobe) em um pool de
+    threads limitado, reaproveitando o índice persistente para os arquivos
+    que não mudaram. Resultados com 'error' não são gravados no índice.
+    """
+
+    def __init__(self, probe, index=None, max_workers=None):
+        self.probe = probe
+        self.index = index
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) * 2)
+
+    def scan(self, paths, progress=None):
+        """
+        Retorna {caminho: metadados} na ordem de `paths`. `progress(feitos,
+        total, caminho)` é chamado a cada arquivo concluído.
+        """
+        results = {}
+        stats = {}
+        for path in paths:
+            try:
+                stats[path] = os.stat(path)
+            except OSError as e:
+                results[path] = {'error': str(e)}
+
+        if self.index is not None:
+            try:
+                results.update(self.index.get_many(stats))
+            except sqlite3.Error:
+                logger.exception('Erro ao consultar o índice de metadados.')
+        pending = [path for path in stats if path not in results]
+        total = len(paths)
+        done = total - len(pending)
+        if progress and done:
+            progress(done, total, None)
+
+        probed = []
+        if pending:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self.probe, path): path for path in pending}
+                for future in concurrent.futures.as_completed(futures):
+                    path = futures[future]
+                    try:
+                        metadata = future.result()
+                    except Exception as e:
+                        metadata = {'error': str(e)}
+                    results[path] = metadata
+                    if 'error' not in metadata:
+                        probed.append((path, stats[path], metadata))
+                    done += 1
+                    if progress:
+                        progress(done, total, path)
+
+        if self.index is not None:
+            try:
+                self.index.set_many(probed)
+            except sqlite3.Error:
+                logger.exception('Erro ao gravar o índice de metadados.')
+        return {path: results[path] for path in paths}
@@ -4,9 +4,23 @@ import subprocess
 import os
 import json
 import platform
+import threading
+import time
 from flet import DataTable, DataColumn, DataRow, DataCell, Text
+from metadata_scanner import MetadataIndex, MetadataScanner
+from save_queue import SaveJob, SaveQueue, ffmpeg_command, PENDING, RUNNING, DONE, FAILED, CANCELLED
+import id3
 
 def get_audio_metadata(file_path):
+    # Caminho rápido: lê as tags ID3 e o cabeçalho MPEG no próprio processo.
+    # O ffprobe fica para os contêineres que o leitor nativo não reconhece.
+    if file_path.lower().endswith('.mp3'):
+        try:
+            metadata = id3.probe(file_path)
+            if metadata is not None:
+                return metadata
+        except Exception as e:
+            print(f"Leitura nativa falhou para {file_path}, usando ffprobe: {str(e)}")
     try:
         cmd = [
             'ffprobe', '-v', 'quiet', '-print_format', 'json',
@@ -22,23 +36,12 @@ def get_audio_metadata(file_path):
         return {"error": str(e)}
 
 def update_audio_metadata(file_path, new_metadata, output_path, audio_filters=None):
+    # Sem filtros, o áudio não precisa ser recodificado: só as tags mudam.
+    if not audio_filters:
+        return update_audio_tags(file_path, new_metadata, output_path)
     try:
-        cmd = ['ffmpeg', '-i', file_path]
-        
-        if audio_filters:
-            print(f"Aplicando filtros de áudio: {audio_filters}") 
-            cmd.extend(['-af', audio_filters])
-        for key, value in new_metadata.items():
-            cmd.extend(['-metadata', f'{key}={value}'])
-            print(f"Adicionando metadado: {key}={value}")  
-        
-        cmd.extend([
-            '-c:a', 'libmp3lame',    
-            '-b:a', '320k',          
-            '-ar', '48000',          
-            '-q:a', '0',             
-            output_path
-        ])
+        print(f"Aplicando filtros de áudio: {audio_filters}") 
+        cmd = ffmpeg_command(file_path, new_metadata, output_path, audio_filters)
         print(f"Re-encodificando com libmp3lame para: {output_path}")
         
         print(f"Comando FFmpeg: {' '.join(cmd)}")
@@ -54,6 +57,32 @@ def update_audio_metadata(file_path, new_metadata, output_path, audio_filters=No
         print(f"Exceção: {str(e)}")
         return f"Erro ao atualizar metadados: {str(e)}"
 
+def update_audio_tags(file_path, new_metadata, output_path):
+    """
+    Atualiza só os metadados, sem recodificar: reescreve a tag ID3 de MP3s
+    diretamente e, para os demais formatos (ou se a tag não puder ser lida),
+    copia os streams com o ffmpeg (-c copy).
+    """
+    if file_path.lower().endswith('.mp3'):
+        try:
+            id3.write_tags(file_path, new_metadata, output_path)
+            print(f"Tags ID3 gravadas em: {output_path}")
+            return "Metadados atualizados sem recodificar o áudio."
+        except Exception as e:
+            print(f"Gravação nativa das tags falhou, usando ffmpeg: {str(e)}")
+    try:
+        cmd = ffmpeg_command(file_path, new_metadata, output_path)
+        print(f"Comando FFmpeg: {' '.join(cmd)}")
+
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0:
+            print(f"Erro no FFmpeg: {process.stderr}")
+            return f"Erro: {process.stderr}"
+        return "Metadados atualizados sem recodificar o áudio."
+    except Exception as e:
+        print(f"Exceção: {str(e)}")
+        return f"Erro ao atualizar metadados: {str(e)}"
+
 def open_folder(file_path):
     folder = os.path.dirname(file_path)
     if platform.system() == "Windows":
@@ -77,8 +106,20 @@ def main(page: ft.Page):
     page.scroll = ft.ScrollMode.AUTO
 
     selected_files = []
-    metadata_fields = {}
-    audio_filters_field = {}
+    scanner = MetadataScanner(get_audio_metadata, MetadataIndex())
+    progress_bar = ft.ProgressBar(width=600, value=0, visible=False)
+    # Os valores editados ficam em dicionários; os controles só existem para
+    # a página visível do editor e para o arquivo aberto no diálogo.
+    EDITOR_PAGE_SIZE = 20
+    metadata_values = {}
+    filter_values = {}
+    editor_page = 0
+    detail_index = 0
+    durations = {}
+    save_rows = {}
+    save_panel = ft.Column(spacing=5, visible=False)
+    last_save_update = 0.0
+    save_lock = threading.Lock()
     metadata_display = ft.Column(scroll='auto')
     output_message = ft.Text("Selecione um ou mais arquivos MP3 para editar os metadados.", size=14)
     output_card = ft.Card(
@@ -103,29 +144,129 @@ def main(page: ft.Page):
         ("lyrics", "Letra")
     ]
 
+    def scan_files(paths):
+        # Lê os metadados em paralelo (ou do índice), mostrando o progresso.
+        last_update = 0.0
+
+        def progress(done, total, path):
+            nonlocal last_update
+            now = time.monotonic()
+            if done == total or now - last_update > 0.1:
+                last_update = now
+                progress_bar.value = done / total
+                output_message.value = f"Lendo metadados: {done}/{total}"
+                page.update()
+
+        progress_bar.value = 0
+        progress_bar.visible = True
+        page.update()
+        try:
+            return scanner.scan(paths, progress)
+        finally:
+            progress_bar.visible = False
+            page.update()
+
+    def bind_value(values, key):
+        # Grava no dicionário o que for digitado no campo.
+        def on_change(e):
+            values[key] = e.control.value
+        return on_change
+
+    def build_editor_card(file_path):
+        values = metadata_values[file_path]
+        fields = []
+        for tag, label in METADATA_FIELDS:
+            if tag == "lyrics":
+                fields.append(ft.TextField(
+                    label=label,
+                    value=values[tag],
+                    width=600,
+                    multiline=True,
+                    min_lines=3,
+                    max_lines=10,
+                    on_change=bind_value(values, tag)
+                ))
+            else:
+                fields.append(ft.TextField(
+                    label=label,
+                    value=values[tag],
+                    width=400,
+                    on_change=bind_value(values, tag)
+                ))
+        return ft.Card(
+            content=ft.Container(
+                content=ft.Column([
+                    ft.Text(f"Arquivo: {os.path.basename(file_path)}", size=16, weight=ft.FontWeight.BOLD),
+                    *fields,
+                    ft.TextField(
+                        label="Filtros de Áudio (FFmpeg)",
+                        hint_text="Exemplo: atempo=1.25,volume=0.8",
+                        value=filter_values[file_path],
+                        width=600,
+                        on_change=bind_value(filter_values, file_path)
+                    )
+                ], spacing=10),
+                padding=10,
+                border_radius=ft.border_radius.all(10),
+                bgcolor=ft.colors.WHITE,
+            ),
+            elevation=3,
+            margin=ft.margin.only(bottom=20)
+        )
+
+    def render_editor_page():
+        # Monta só os cartões da página atual.
+        nonlocal editor_page
+        pages = max(1, -(-len(selected_files) // EDITOR_PAGE_SIZE))
+        editor_page = min(max(editor_page, 0), pages - 1)
+        start = editor_page * EDITOR_PAGE_SIZE
+        metadata_display.controls = [
+            build_editor_card(file_path)
+            for file_path in selected_files[start:start + EDITOR_PAGE_SIZE]
+        ]
+        editor_page_label.value = f"Página {editor_page + 1} de {pages}"
+        previous_page_button.disabled = editor_page == 0
+        next_page_button.disabled = editor_page >= pages - 1
+        editor_nav.visible = pages > 1
+
+    def change_editor_page(step):
+        nonlocal editor_page
+        editor_page += step
+        render_editor_page()
+        page.update()
+
     def on_files_upload(e):
-        nonlocal selected_files
+        nonlocal selected_files, editor_page
         try:
             if e.files:
                 selected_files = []
+                metadata_values.clear()
+                filter_values.clear()
                 metadata_display.controls.clear()
 
+                paths = []
                 for file in e.files:
                     file_path = file.path
                     if not file_path.lower().endswith('.mp3'):
                         output_message.value = f"Arquivo {os.path.basename(file_path)} não é um MP3 válido."
                         print(f"Arquivo inválido: {file_path}")
                         continue
+                    paths.append(file_path)
 
-                    metadata = get_audio_metadata(file_path)
+                scanned = scan_files(paths)
+                for file_path in paths:
+                    metadata = scanned[file_path]
                     if "error" in metadata:
                         output_message.value = f"Erro ao extrair metadados de {os.path.basename(file_path)}: {metadata['error']}"
                         print(f"Erro de metadata: {metadata['error']}")
                         continue
 
                     selected_files.append(file_path)
+                    try:
+                        durations[file_path] = float(metadata.get('format', {}).get('duration') or 0) or None
+                    except ValueError:
+                        durations[file_path] = None
 
-                    fields = {}
                     format_tags = metadata.get('format', {}).get('tags', {})
                     format_properties = {k: v for k, v in metadata.get('format', {}).items() if k not in [
                         'tags', 'filename', 'nb_streams', 'nb_programs', 'format_long_name',
@@ -134,45 +275,13 @@ def main(page: ft.Page):
                     all_format_tags = format_tags.copy()
                     for prop, value in format_properties.items():
                         all_format_tags[prop] = value
-                    for tag, label in METADATA_FIELDS:
-                        value = all_format_tags.get(tag, "")
-                        if tag == "lyrics":
-                            fields[tag] = ft.TextField(
-                                label=label,
-                                value=str(value),
-                                width=600,
-                                multiline=True,
-                                min_lines=3,
-                                max_lines=10
-                            )
-                        else:
-                            fields[tag] = ft.TextField(
-                                label=label,
-                                value=str(value),
-                                width=400
-                            )
-                    audio_filters_field[file_path] = ft.TextField(
-                        label="Filtros de Áudio (FFmpeg)",
-                        hint_text="Exemplo: atempo=1.25,volume=0.8",
-                        width=600
-                    )
-                    metadata_display.controls.append(
-                        ft.Card(
-                            content=ft.Container(
-                                content=ft.Column([
-                                    ft.Text(f"Arquivo: {os.path.basename(file_path)}", size=16, weight=ft.FontWeight.BOLD),
-                                    *[fields[tag] for tag, _ in METADATA_FIELDS],
-                                    audio_filters_field[file_path]
-                                ], spacing=10),
-                                padding=10,
-                                border_radius=ft.border_radius.all(10),
-                                bgcolor=ft.colors.WHITE,
-                            ),
-                            elevation=3,
-                            margin=ft.margin.only(bottom=20)
-                        )
-                    )
-                    metadata_fields[file_path] = fields
+                    metadata_values[file_path] = {
+                        tag: str(all_format_tags.get(tag, "")) for tag, _ in METADATA_FIELDS
+                    }
+                    filter_values[file_path] = ""
+
+                editor_page = 0
+                render_editor_page()
 
                 if selected_files:
                     output_message.value = f"{len(selected_files)} arquivo(s) selecionado(s) para edição."
@@ -193,6 +302,72 @@ def main(page: ft.Page):
             print(f"Erro na função on_files_upload: {str(err)}")
             page.update()
 
+    SAVE_STATUS = {
+        RUNNING: ("Gravando", ft.colors.BLUE),
+        FAILED: ("Erro", ft.colors.RED),
+        CANCELLED: ("Cancelado", ft.colors.ORANGE),
+    }
+
+    def save_row(job):
+        # Uma linha por arquivo: nome, barra de progresso e situação. Só os
+        # trabalhos em andamento e os que falharam ou foram cancelados têm
+        # linha própria; os demais entram apenas no resumo.
+        row = save_rows.get(job.file_path)
+        if row is None:
+            row = {
+                "progress": ft.ProgressBar(width=300, value=0),
+                "status": ft.Text(size=12),
+                "state": None,
+            }
+            row["control"] = ft.Row([
+                ft.Text(os.path.basename(job.file_path), width=350, no_wrap=True),
+                row["progress"],
+                row["status"]
+            ], spacing=10)
+            save_rows[job.file_path] = row
+            save_panel.controls.append(row["control"])
+        return row
+
+    def on_save_update(job):
+        # Chamado pelas threads da fila.
+        with save_lock:
+            update_save_panel(job)
+
+    def update_save_panel(job):
+        # Limita as atualizações da tela a 10 por segundo, exceto nas
+        # mudanças de situação.
+        nonlocal last_save_update
+        status_changed = True
+        if job.status in (PENDING, DONE):
+            row = save_rows.pop(job.file_path, None)
+            if row is not None:
+                save_panel.controls.remove(row["control"])
+        else:
+            row = save_row(job)
+            label, color = SAVE_STATUS[job.status]
+            status_changed = row["state"] != job.status
+            row["state"] = job.status
+            row["progress"].value = job.progress
+            row["status"].value = f"{label}: {job.message}" if job.message else label
+            row["status"].color = color
+
+        now = time.monotonic()
+        if not status_changed and now - last_save_update < 0.1:
+            return
+        last_save_update = now
+        summary = save_queue.summary()
+        finished = summary[DONE] + summary[FAILED] + summary[CANCELLED]
+        output_message.value = (
+            f"Gravando: {finished}/{summary['total']} concluído(s), "
+            f"{summary[FAILED]} com erro, {summary[CANCELLED]} cancelado(s)."
+        )
+        busy = finished < summary['total']
+        cancel_button.disabled = not busy
+        retry_button.disabled = busy or not (summary[FAILED] or summary[CANCELLED])
+        page.update()
+
+    save_queue = SaveQueue(on_update=on_save_update)
+
     def save_metadata(e):
         try:
             if not selected_files:
@@ -201,36 +376,163 @@ def main(page: ft.Page):
                 print("Nenhum arquivo selecionado para salvar.")
                 return
 
+            summary = save_queue.summary()
+            if summary[PENDING] or summary[RUNNING]:
+                output_message.value = "Aguarde o término da gravação em andamento."
+                page.update()
+                return
+
+            # Os trabalhos rodam em segundo plano, em paralelo; a tela só
+            # acompanha o progresso.
+            save_queue.clear()
+            save_rows.clear()
+            save_panel.controls.clear()
+            save_panel.visible = True
             for file_path in selected_files:
-                fields = metadata_fields.get(file_path, {})
+                values = metadata_values.get(file_path, {})
                 new_metadata = {}
 
                 for tag, _ in METADATA_FIELDS:
-                    field = fields.get(tag)
-                    if field and field.value.strip():
-                        new_metadata[tag] = field.value.strip()
+                    value = values.get(tag, "")
+                    if value.strip():
+                        new_metadata[tag] = value.strip()
 
-                audio_filters = audio_filters_field[file_path].value.strip()
+                audio_filters = filter_values.get(file_path, "").strip()
                 audio_filters = audio_filters if audio_filters else None
 
                 output_path = generate_output_path(file_path)
 
-                result = update_audio_metadata(
+                save_queue.submit(SaveJob(
                     file_path,
                     new_metadata,
                     output_path,
-                    audio_filters=audio_filters
-                )
-                output_message.value = result
-                print(f"Resultado da atualização: {result}")
-
+                    audio_filters=audio_filters,
+                    duration=durations.get(file_path)
+                ))
+            print(f"{len(selected_files)} arquivo(s) enviados para gravação.")
             page.update()
         except Exception as err:
             output_message.value = f"Erro ao salvar metadados: {str(err)}"
             print(f"Erro na função save_metadata: {str(err)}")
             page.update()
 
+    def build_metadata_card(file_path, metadata):
+        # Metadados de Formato
+        format_info = metadata.get('format', {})
+        format_tags = format_info.get('tags', {})
+        format_properties = {k: v for k, v in format_info.items() if k not in [
+            'tags', 'filename', 'nb_streams', 'nb_programs', 'format_long_name',
+            'start_time', 'duration', 'size', 'bit_rate', 'probe_score'
+        ]}
+
+        all_format_tags = format_tags.copy()
+        for prop, value in format_properties.items():
+            all_format_tags[prop] = value
+
+        format_table = ft.DataTable(
+            columns=[
+                DataColumn(Text("Campo")),
+                DataColumn(Text("Valor"))
+            ],
+            rows=[
+                DataRow(cells=[
+                    DataCell(Text(k.capitalize())),
+                    DataCell(Text(v))
+                ]) for k, v in sorted(all_format_tags.items())
+            ]
+        )
+
+        streams = metadata.get('streams', [])
+        stream_tables = []
+        for idx, stream in enumerate(streams):
+            codec_type = stream.get('codec_type', 'Unknown').capitalize()
+            stream_tags = stream.get('tags', {})
+            stream_properties = {k: v for k, v in stream.items() if k not in [
+                'tags', 'index', 'codec_name', 'codec_type', 'codec_long_name',
+                'profile', 'codec_time_base', 'codec_tag_string', 'codec_tag',
+                'sample_fmt', 'sample_rate', 'channels', 'channel_layout',
+                'bits_per_sample', 'bits_per_raw_sample', 'r_frame_rate',
+                'avg_frame_rate', 'time_base', 'start_pts', 'start_time',
+                'duration_ts', 'duration', 'bit_rate', 'max_bit_rate',
+                'nb_frames', 'disposition', 'tags'
+            ]}
+
+            all_stream_tags = stream_tags.copy()
+            for prop, value in stream_properties.items():
+                all_stream_tags[prop] = value
+
+            stream_table = ft.DataTable(
+                columns=[
+                    DataColumn(Text("Campo")),
+                    DataColumn(Text("Valor"))
+                ],
+                rows=[
+                    DataRow(cells=[
+                        DataCell(Text(k.capitalize())),
+                        DataCell(Text(v))
+                    ]) for k, v in sorted(all_stream_tags.items())
+                ]
+            )
+
+            # Adiciona a tabela com título para cada stream
+            stream_tables.append(
+                ft.Column([
+                    ft.Text(f"Stream {idx + 1}: {codec_type}", size=14, weight=ft.FontWeight.BOLD),
+                    stream_table
+                ], spacing=5)
+            )
+
+        return ft.Card(
+            content=ft.Container(
+                content=ft.Column([
+                    ft.Text(f"Arquivo: {os.path.basename(file_path)}", size=16, weight=ft.FontWeight.BOLD),
+                    ft.Text("Metadados de Formato:", size=14, weight=ft.FontWeight.BOLD),
+                    format_table,
+                    ft.Text("Metadados de Streams:", size=14, weight=ft.FontWeight.BOLD),
+                    *stream_tables
+                ], spacing=10),
+                padding=10,
+                border_radius=ft.border_radius.all(10),
+                bgcolor=ft.colors.WHITE,
+            ),
+            elevation=2,
+            margin=ft.margin.only(bottom=15)
+        )
+
+    def render_metadata_detail():
+        # Monta o diálogo só para o arquivo exibido; os metadados vêm do
+        # índice e só são lidos de novo se o arquivo mudou.
+        file_path = selected_files[detail_index]
+        metadata = scanner.scan([file_path])[file_path]
+        if "error" in metadata:
+            print(f"Erro ao extrair metadados: {metadata['error']}") 
+            content = ft.Text(
+                f"Erro em {os.path.basename(file_path)}: {metadata['error']}",
+                color=ft.colors.RED
+            )
+        else:
+            content = build_metadata_card(file_path, metadata)
+        metadata_dialog.title.value = f"Metadados dos Arquivos MP3 ({detail_index + 1} de {len(selected_files)})"
+        metadata_dialog.content = ft.Container(
+            content=ft.Column([content], scroll=ft.ScrollMode.AUTO),
+            width=1200,
+            height=700
+        )
+        previous_detail_button.disabled = detail_index == 0
+        next_detail_button.disabled = detail_index >= len(selected_files) - 1
+
+    def change_metadata_detail(step):
+        nonlocal detail_index
+        try:
+            detail_index = min(max(detail_index + step, 0), len(selected_files) - 1)
+            render_metadata_detail()
+        except Exception as err:
+            output_message.value = f"Erro ao mostrar metadados: {str(err)}"
+            print(f"Erro na função change_metadata_detail: {str(err)}")
+        page.update()
+
     def show_metadata(e):
+        nonlocal detail_index
         print("Botão 'Mostrar Metadados' clicado.")
         try:
             if not selected_files:
@@ -239,116 +541,8 @@ def main(page: ft.Page):
                 print("Nenhum arquivo selecionado.")
                 return
 
-            metadata_info = ft.Column(scroll=ft.ScrollMode.AUTO)
-            print(f"Arquivos selecionados: {selected_files}") 
-
-            for file_path in selected_files:
-                print(f"Processando arquivo: {file_path}")  
-                metadata = get_audio_metadata(file_path)
-                if "error" in metadata:
-                    metadata_info.controls.append(
-                        ft.Text(
-                            f"Erro em {os.path.basename(file_path)}: {metadata['error']}",
-                            color=ft.colors.RED
-                        )
-                    )
-                    print(f"Erro ao extrair metadados: {metadata['error']}") 
-                    continue
-
-                # Metadados de Formato
-                format_info = metadata.get('format', {})
-                format_tags = format_info.get('tags', {})
-                format_properties = {k: v for k, v in format_info.items() if k not in [
-                    'tags', 'filename', 'nb_streams', 'nb_programs', 'format_long_name',
-                    'start_time', 'duration', 'size', 'bit_rate', 'probe_score'
-                ]}
-                print(f"Metadados de formato: {format_info}") 
-
-                all_format_tags = format_tags.copy()
-                for prop, value in format_properties.items():
-                    all_format_tags[prop] = value
-
-                format_table = ft.DataTable(
-                    columns=[
-                        DataColumn(Text("Campo")),
-                        DataColumn(Text("Valor"))
-                    ],
-                    rows=[
-                        DataRow(cells=[
-                            DataCell(Text(k.capitalize())),
-                            DataCell(Text(v))
-                        ]) for k, v in sorted(all_format_tags.items())
-                    ]
-                )
-                print("Tabela de metadados de formato criada.") 
-
-                streams = metadata.get('streams', [])
-                stream_tables = []
-                for idx, stream in enumerate(streams):
-                    codec_type = stream.get('codec_type', 'Unknown').capitalize()
-                    stream_tags = stream.get('tags', {})
-                    stream_properties = {k: v for k, v in stream.items() if k not in [
-                        'tags', 'index', 'codec_name', 'codec_type', 'codec_long_name',
-                        'profile', 'codec_time_base', 'codec_tag_string', 'codec_tag',
-                        'sample_fmt', 'sample_rate', 'channels', 'channel_layout',
-                        'bits_per_sample', 'bits_per_raw_sample', 'r_frame_rate',
-                        'avg_frame_rate', 'time_base', 'start_pts', 'start_time',
-                        'duration_ts', 'duration', 'bit_rate', 'max_bit_rate',
-                        'nb_frames', 'disposition', 'tags'
-                    ]}
-                    print(f"Processando stream {idx + 1}: {codec_type}") 
-
-                    all_stream_tags = stream_tags.copy()
-                    for prop, value in stream_properties.items():
-                        all_stream_tags[prop] = value
-
-                    stream_table = ft.DataTable(
-                        columns=[
-                            DataColumn(Text("Campo")),
-                            DataColumn(Text("Valor"))
-                        ],
-                        rows=[
-                            DataRow(cells=[
-                                DataCell(Text(k.capitalize())),
-                                DataCell(Text(v))
-                            ]) for k, v in sorted(all_stream_tags.items())
-                        ]
-                    )
-                    print(f"Tabela de metadados de stream {idx + 1} criada.") 
-
-                    # Adiciona a tabela com título para cada stream
-                    stream_tables.append(
-                        ft.Column([
-                            ft.Text(f"Stream {idx + 1}: {codec_type}", size=14, weight=ft.FontWeight.BOLD),
-                            stream_table
-                        ], spacing=5)
-                    )
-
-                metadata_info.controls.append(
-                    ft.Card(
-                        content=ft.Container(
-                            content=ft.Column([
-                                ft.Text(f"Arquivo: {os.path.basename(file_path)}", size=16, weight=ft.FontWeight.BOLD),
-                                ft.Text("Metadados de Formato:", size=14, weight=ft.FontWeight.BOLD),
-                                format_table,
-                                ft.Text("Metadados de Streams:", size=14, weight=ft.FontWeight.BOLD),
-                                *stream_tables
-                            ], spacing=10),
-                            padding=10,
-                            border_radius=ft.border_radius.all(10),
-                            bgcolor=ft.colors.WHITE,
-                        ),
-                        elevation=2,
-                        margin=ft.margin.only(bottom=15)
-                    )
-                )
-                print(f"Metadados adicionados para {file_path}") 
-
-            metadata_dialog.content = ft.Container(
-                content=metadata_info,
-                width=1200,
-                height=700
-            )
+            detail_index = 0
+            render_metadata_detail()
             metadata_dialog.open = True
             page.update()
             print("Diálogo de metadados aberto.") 
@@ -379,6 +573,18 @@ def main(page: ft.Page):
         on_click=save_metadata,
         disabled=True
     )
+    cancel_button = ft.ElevatedButton(
+        "Cancelar Gravação",
+        icon=ft.icons.CANCEL,
+        on_click=lambda e: save_queue.cancel(),
+        disabled=True
+    )
+    retry_button = ft.ElevatedButton(
+        "Tentar Novamente",
+        icon=ft.icons.REFRESH,
+        on_click=lambda e: save_queue.retry(),
+        disabled=True
+    )
     show_metadata_button = ft.ElevatedButton(
         "Mostrar Metadados",
         icon=ft.icons.INFO,
@@ -403,24 +609,51 @@ def main(page: ft.Page):
         page.update()
         print("Botões atualizados.")
 
+    previous_page_button = ft.IconButton(
+        icon=ft.icons.CHEVRON_LEFT,
+        tooltip="Página anterior",
+        on_click=lambda e: change_editor_page(-1)
+    )
+    next_page_button = ft.IconButton(
+        icon=ft.icons.CHEVRON_RIGHT,
+        tooltip="Próxima página",
+        on_click=lambda e: change_editor_page(1)
+    )
+    editor_page_label = ft.Text(size=14)
+    editor_nav = ft.Row(
+        controls=[previous_page_button, editor_page_label, next_page_button],
+        spacing=10,
+        visible=False
+    )
+
+    previous_detail_button = ft.TextButton("Anterior", on_click=lambda e: change_metadata_detail(-1))
+    next_detail_button = ft.TextButton("Próximo", on_click=lambda e: change_metadata_detail(1))
     metadata_dialog = ft.AlertDialog(
         title=ft.Text("Metadados dos Arquivos MP3"),
         content=ft.Container(),
         actions=[
+            previous_detail_button,
+            next_detail_button,
             ft.TextButton("Fechar", on_click=lambda e: close_metadata_dialog(e, metadata_dialog))
         ],
         actions_alignment=ft.MainAxisAlignment.END,
         modal=True
     )
     page.overlay.append(metadata_dialog)
+    page.on_disconnect = lambda e: save_queue.shutdown()
 
     page.add(
         ft.Row(
-            controls=[pick_button, save_button, show_metadata_button, open_folder_button],
+            controls=[pick_button, save_button, cancel_button, retry_button, show_metadata_button, open_folder_button],
             spacing=10,
             alignment=ft.MainAxisAlignment.START
         ),
+        progress_bar,
+        save_panel,
+        editor_nav,
         metadata_display,
         output_card
     )
-ft.app(target=main)
+
+if __name__ == '__main__':
+    ft.app(target=main)
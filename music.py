@@ -1,9 +1,9 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QFileDialog, QVBoxLayout
-import librosa
-import numpy as np
+from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QFileDialog, QVBoxLayout, QComboBox, QCheckBox
 import os
 
+from analysis import FeatureExtractor, analyze_stream, load_audio, DEFAULT_PROFILE, PROFILES, WINDOWS
+
 class MusicAnalyzer(QWidget):
     def __init__(self):
         super().__init__()
@@ -18,6 +18,20 @@ class MusicAnalyzer(QWidget):
         self.label = QLabel('Selecione um arquivo de música', self)
         self.layout.addWidget(self.label)
 
+        self.profile_combo = QComboBox(self)
+        self.profile_combo.addItems(sorted(PROFILES))
+        self.profile_combo.setCurrentText(DEFAULT_PROFILE)
+        self.layout.addWidget(QLabel('Perfil de análise:', self))
+        self.layout.addWidget(self.profile_combo)
+
+        self.window_combo = QComboBox(self)
+        self.window_combo.addItems(list(WINDOWS))
+        self.layout.addWidget(QLabel('Trecho analisado:', self))
+        self.layout.addWidget(self.window_combo)
+
+        self.full_checkbox = QCheckBox('Analisar a faixa completa (linha do tempo)', self)
+        self.layout.addWidget(self.full_checkbox)
+
         self.button = QPushButton('Selecionar Arquivo', self)
         self.button.clicked.connect(self.openFileNameDialog)
         self.layout.addWidget(self.button)
@@ -37,24 +51,38 @@ class MusicAnalyzer(QWidget):
 
     def analyzeMusic(self, file_path):
         
-        y, sr = librosa.load(file_path, duration=60)  
-
-        
         file_name = os.path.basename(file_path)
+        profile = self.profile_combo.currentText()
+        timeline = []
 
         
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        bpm = float(tempo)
+        if self.full_checkbox.isChecked():
+            analysis = analyze_stream(file_path, profile=profile)
+            bpm = analysis['bpm']
+            key, alt_key = self.translate_key((analysis['key'], analysis['alt_key']))
+            key_confidence = analysis['key_confidence']
+            energy = analysis['energy']
+            danceability = analysis['danceability']
+            timeline = analysis['timeline']
+        else:
+            y, sr, _ = load_audio(file_path, profile=profile,
+                               window=self.window_combo.currentText())  
 
-        
-        key, alt_key = self.detect_key(y, sr)
+            
+            features = FeatureExtractor(y, sr)
 
-        
-        energy = np.mean(librosa.feature.rms(y=y)).item()
+            
+            bpm = features.bpm()
 
-        
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        danceability = np.mean(onset_env).item()
+            
+            key, alt_key = self.translate_key(features.key())
+            key_confidence = features.key_estimate['confidence']
+
+            
+            energy = features.energy()
+
+            
+            danceability = features.danceability()
 
         
         happiness = 'Alta' if 'Maior' in key else 'Baixa'
@@ -64,41 +92,26 @@ class MusicAnalyzer(QWidget):
 <b>Nome do Arquivo:</b> {file_name}
 <b>Tonalidade:</b> {key}
 <b>Tonalidade Alternativa:</b> {alt_key}
+<b>Confiança da Tonalidade:</b> {key_confidence:.2f}
 <b>BPM:</b> {bpm:.2f}
 <b>Energia:</b> {energy:.4f}
 <b>Dançabilidade:</b> {danceability:.4f}
 <b>Felicidade:</b> {happiness}
 '''
+        for segment in timeline:
+            segment_key, = self.translate_key((segment['key'],))
+            result_text += (f"<br>{segment['start']:.0f}s–{segment['end']:.0f}s: "
+                            f"{segment['bpm']:.2f} BPM, {segment_key}")
         self.result_label.setText(result_text)
         self.result_label.setStyleSheet("font-size: 14px;")
 
     def detect_key(self, y, sr):
         
-        chromagram = librosa.feature.chroma_cqt(y=y, sr=sr)
-        
-        chroma_mean = np.mean(chromagram, axis=1)
-        
-        notes = ['C', 'C#', 'D', 'D#', 'E', 'F',
-                 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        
-        max_note = chroma_mean.argmax()
-        key = notes[max_note]
-
-        
-        
-        if max_note in [0, 5, 7]:  
-            scale = 'Maior'
-        else:
-            scale = 'Menor'
-
-        key_full = f'{key} {scale}'
+        return self.translate_key(FeatureExtractor(y, sr).key())
 
+    def translate_key(self, keys):
         
-        alt_note = (max_note + 9) % 12  
-        alt_scale = 'Menor' if scale == 'Maior' else 'Maior'
-        alt_key_full = f'{notes[alt_note]} {alt_scale}'
-
-        return key_full, alt_key_full
+        return tuple(k.replace('Major', 'Maior').replace('Minor', 'Menor') for k in keys)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
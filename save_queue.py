@@ -0,0 +1,230 @@
+import concurrent.futures
+import logging
+import os
+import subprocess
+import threading
+
+import id3
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+def ffmpeg_command(file_path, new_metadata, output_path, audio_filters=None):
+    """
+    Monta o comando do ffmpeg para gravar `new_metadata` em `output_path`:
+    cópia dos streams (-c copy) quando não há filtros, e recodificação com
+    libmp3lame só quando os filtros exigem.
+    """
+    cmd = ['ffmpeg', '-y', '-i', file_path]
+    if audio_filters:
+        cmd.extend(['-af', audio_filters])
+    else:
+        cmd.extend(['-map', '0', '-map_metadata', '0'])
+    for key, value in new_metadata.items():
+        cmd.extend(['-metadata', f'{key}={value}'])
+    if audio_filters:
+        cmd.extend(['-c:a', 'libmp3lame', '-b:a', '320k', '-ar', '48000', '-q:a', '0'])
+    else:
+        cmd.extend(['-c', 'copy'])
+    cmd.append(output_path)
+    return cmd
+
+
+class SaveJob(object):
+    """
+    Gravação de um arquivo. `duration` (em segundos, do ffprobe) permite
+    calcular o progresso a partir da saída -progress do ffmpeg.
+    """
+
+    def __init__(self, file_path, new_metadata, output_path, audio_filters=None, duration=None):
+        self.file_path = file_path
+        self.new_metadata = new_metadata
+        self.output_path = output_path
+        self.audio_filters = audio_filters
+        self.duration = duration
+        self.reset()
+
+    def reset(self):
+        self.status = PENDING
+        self.progress = 0.0
+        self.message = ''
+        self._cancelled = False
+        self._process = None
+        self._future = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def to_dict(self):
+        return {
+            'file_path': self.file_path,
+            'output_path': self.output_path,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+        }
+
+
+class SaveQueue(object):
+    """
+    Fila de gravação em segundo plano: os trabalhos rodam em paralelo, no
+    máximo `max_workers` processos do ffmpeg ao mesmo tempo (padrão: número
+    de núcleos). `on_update(job)` é chamado, a partir das threads da fila, a
+    cada mudança de estado ou de progresso de um trabalho.
+    """
+
+    def __init__(self, max_workers=None, on_update=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.on_update = on_update
+        self.jobs = []
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix='save-queue')
+
+    def submit(self, job):
+        with self._lock:
+            if job not in self.jobs:
+                self.jobs.append(job)
+        self._notify(job)
+        job._future = self._executor.submit(self._run, job)
+        return job
+
+    def cancel(self, job=None):
+        """
+        Cancela um trabalho (ou todos os não concluídos). Trabalhos em
+        andamento têm o processo do ffmpeg encerrado.
+        """
+        with self._lock:
+            jobs = [job] if job is not None else list(self.jobs)
+        for job in jobs:
+            if job.finished:
+                continue
+            job._cancelled = True
+            if job._future is not None and job._future.cancel():
+                job.status = CANCELLED
+                job.message = 'Cancelado.'
+                self._notify(job)
+            elif job._process is not None and job._process.poll() is None:
+                job._process.terminate()
+
+    def retry(self, job=None):
+        """
+        Reenvia um trabalho (ou todos os que falharam ou foram cancelados).
+        """
+        with self._lock:
+            jobs = [job] if job is not None else list(self.jobs)
+        retried = [job for job in jobs if job.status in (FAILED, CANCELLED)]
+        for job in retried:
+            job.reset()
+            self.submit(job)
+        return retried
+
+    def clear(self):
+        """
+        Remove da lista os trabalhos concluídos.
+        """
+        with self._lock:
+            self.jobs = [job for job in self.jobs if not job.finished]
+
+    def summary(self):
+        with self._lock:
+            jobs = list(self.jobs)
+        counts = {status: 0 for status in (PENDING, RUNNING) + FINISHED}
+        for job in jobs:
+            counts[job.status] += 1
+        counts['total'] = len(jobs)
+        return counts
+
+    def shutdown(self, wait=False):
+        self.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def _notify(self, job):
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception:
+                logger.exception('Erro ao notificar o progresso da gravação.')
+
+    def _run(self, job):
+        if job._cancelled:
+            job.status = CANCELLED
+            job.message = 'Cancelado.'
+            self._notify(job)
+            return
+        job.status = RUNNING
+        self._notify(job)
+        try:
+            if not job.audio_filters and self._write_tags(job):
+                job.message = 'Metadados atualizados sem recodificar o áudio.'
+            else:
+                self._run_ffmpeg(job)
+                if job.audio_filters:
+                    job.message = 'Metadados e conteúdo atualizados com sucesso.'
+                else:
+                    job.message = 'Metadados atualizados sem recodificar o áudio.'
+            job.progress = 1.0
+            job.status = DONE
+        except Exception as e:
+            if job._cancelled:
+                job.status = CANCELLED
+                job.message = 'Cancelado.'
+                self._remove_partial(job)
+            else:
+                logger.error(f'Erro ao gravar {job.file_path}: {e}')
+                job.status = FAILED
+                job.message = f'Erro: {e}'
+        finally:
+            job._process = None
+        self._notify(job)
+
+    def _write_tags(self, job):
+        if not job.file_path.lower().endswith('.mp3'):
+            return False
+        try:
+            id3.write_tags(job.file_path, job.new_metadata, job.output_path)
+            return True
+        except Exception as e:
+            logger.debug(f'Gravação nativa das tags falhou, usando ffmpeg: {e}')
+            return False
+
+    def _run_ffmpeg(self, job):
+        cmd = ffmpeg_command(job.file_path, job.new_metadata, job.output_path, job.audio_filters)
+        # Progresso em pares chave=valor na saída padrão; com -loglevel error
+        # o stderr fica pequeno e não bloqueia o processo enquanto lemos stdout.
+        cmd[1:1] = ['-nostats', '-loglevel', 'error', '-progress', 'pipe:1']
+        logger.debug(f"Comando FFmpeg: {' '.join(cmd)}")
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, universal_newlines=True)
+        job._process = process
+        if job._cancelled:
+            process.terminate()
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key == 'out_time_us' and job.duration:
+                try:
+                    job.progress = min(1.0, int(value) / 1e6 / job.duration)
+                except ValueError:
+                    continue
+                self._notify(job)
+        stderr = process.stderr.read()
+        process.wait()
+        if process.returncode != 0:
+            raise RuntimeError(stderr.strip() or f'ffmpeg terminou com código {process.returncode}')
+
+    def _remove_partial(self, job):
+        if job.output_path == job.file_path:
+            return
+        try:
+            os.remove(job.output_path)
+        except OSError:
+            pass
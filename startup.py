@@ -0,0 +1,108 @@
+import importlib
+import importlib.util
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+
+
+def lazy_import(name):
+    """
+    Retorna o módulo `name` sem executá-lo: a importação real só acontece no
+    primeiro acesso a um atributo. Usado para adiar librosa (numba/scipy),
+    yt_dlp e joblib, que dominam o tempo de inicialização.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def ensure_loaded(*names):
+    """
+    Força a importação completa de módulos carregados com lazy_import.
+    """
+    for name in names:
+        module = importlib.import_module(name)
+        # Qualquer acesso a atributo conclui a importação adiada.
+        getattr(module, '__dict__')
+
+
+class Readiness(object):
+    """
+    Estado de prontidão dos componentes aquecidos em segundo plano.
+    Sem componentes registrados o serviço é considerado pronto.
+    """
+
+    def __init__(self):
+        self._components = {}
+        self._lock = threading.Lock()
+
+    def register(self, name):
+        with self._lock:
+            self._components[name] = {'status': PENDING, 'seconds': None, 'error': None}
+
+    def _set(self, name, status, seconds=None, error=None):
+        with self._lock:
+            self._components[name] = {'status': status, 'seconds': seconds, 'error': error}
+
+    @property
+    def ready(self):
+        with self._lock:
+            return all(c['status'] == READY for c in self._components.values())
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'ready': all(c['status'] == READY for c in self._components.values()),
+                'components': {name: dict(c) for name, c in self._components.items()},
+            }
+
+    def run(self, name, fn):
+        """
+        Executa um passo de aquecimento registrando sua duração e resultado.
+        """
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            logger.exception(f'Falha no aquecimento de {name}.')
+            self._set(name, FAILED, time.perf_counter() - start, str(e))
+            return False
+        seconds = time.perf_counter() - start
+        logger.debug(f'Aquecimento de {name} concluído em {seconds:.2f}s.')
+        self._set(name, READY, seconds)
+        return True
+
+
+def warm_up(readiness, steps, background=True):
+    """
+    Executa os passos (nome, função) em ordem, numa thread em segundo plano
+    ou de forma bloqueante. Os passos seguintes continuam mesmo se um falhar.
+    """
+    for name, _ in steps:
+        readiness.register(name)
+
+    def run_steps():
+        for name, fn in steps:
+            readiness.run(name, fn)
+
+    if not background:
+        run_steps()
+        return None
+    thread = threading.Thread(target=run_steps, name='warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from analysis import NOTES, estimate_key, estimate_keys, finish_features, key_scores
+
+
+def chroma(tonic, third, fifth, scale):
+    """
+    Croma sintética: tríade forte, demais notas da escala fracas e as notas
+    fora da escala quase ausentes.
+    """
+    vector = np.full(12, 0.05)
+    vector[[NOTES.index(note) for note in scale]] = 0.3
+    for note, weight in ((tonic, 1.0), (third, 0.8), (fifth, 0.9)):
+        vector[NOTES.index(note)] = weight
+    return vector
+
+
+C_MAJOR = chroma('C', 'E', 'G', ['D', 'F', 'A', 'B'])
+A_MINOR = chroma('A', 'C', 'E', ['B', 'D', 'F', 'G'])
+
+
+def test_key_scores_correlates_with_all_keys():
+    scores = key_scores(np.vstack([C_MAJOR, A_MINOR]))
+
+    assert scores.shape == (2, 24)
+    assert np.all(np.abs(scores) <= 1.0 + 1e-9)
+    np.testing.assert_allclose(key_scores(C_MAJOR), scores[:1])
+    # Croma constante: sem correlação com nenhuma tonalidade.
+    np.testing.assert_array_equal(key_scores(np.ones(12)), np.zeros((1, 24)))
+
+
+@pytest.mark.parametrize('vector, key, alt_key', [
+    (C_MAJOR, 'C Major', 'A Minor'),
+    (A_MINOR, 'A Minor', 'C Major'),
+])
+def test_single_estimate_finds_key_and_relative(vector, key, alt_key):
+    estimate = estimate_key(vector)
+
+    assert (estimate['key'], estimate['alt_key']) == (key, alt_key)
+    assert estimate['candidates'][0] == {'key': key, 'score': estimate['confidence']}
+    assert len(estimate['candidates']) == 3
+
+
+def test_batched_estimates_match_single_estimates():
+    vectors = np.vstack([C_MAJOR, A_MINOR, np.roll(C_MAJOR, 7)])
+
+    estimates = estimate_keys(vectors)
+
+    assert [e['key'] for e in estimates] == ['C Major', 'A Minor', 'G Major']
+    assert estimates == [estimate_key(vector) for vector in vectors]
+
+
+def test_finish_features_estimates_keys_for_the_batch():
+    partials = [{'bpm': 120.0, 'chroma_mean': vector.tolist(), 'mfcc_mean': [0.0] * 13}
+                for vector in (A_MINOR, C_MAJOR)]
+
+    results = finish_features(partials)
+
+    assert [(r['key'], r['alt_key'], r['genre']) for r in results] == [
+        ('A Minor', 'C Major', 'Unknown'), ('C Major', 'A Minor', 'Unknown')]
+    assert results[0]['key_confidence'] == estimate_key(A_MINOR)['confidence']
+    assert 'chroma_mean' not in results[0] and results[0]['bpm'] == 120.0
@@ -0,0 +1,44 @@
+import concurrent.futures
+
+from batch import run_batch
+
+
+class ListWriter(object):
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+
+def finished(value=None, error=None):
+    future = concurrent.futures.Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(value)
+    return future
+
+
+def test_run_batch_hands_full_analysis_to_on_result():
+    results = {
+        'a.mp3': {'bpm': 120.0, 'vectors': [1.0], 'beat_sync': {'times': []}, 'timings': {}},
+        'b.mp3': ValueError('falhou'),
+    }
+
+    def submit(path):
+        value = results[path]
+        return finished(error=value) if isinstance(value, Exception) else finished(dict(value))
+
+    seen = []
+
+    def on_result(path, label, analysis):
+        seen.append((path, label, set(analysis)))
+
+    writer = ListWriter()
+    completed, errors = run_batch([('a.mp3', 'A'), ('b.mp3', 'B')], submit, writer, on_result=on_result)
+
+    assert (completed, errors) == (2, 1)
+    assert seen == [('a.mp3', 'A', {'bpm', 'vectors', 'beat_sync', 'timings'})]
+    assert {'path': 'A', 'bpm': 120.0} in writer.rows
+    assert {'path': 'B', 'error': 'falhou'} in writer.rows
@@ -0,0 +1,162 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from batching import BatchingPool, MicroBatcher, chain
+from workers import analyze_file, extract_file
+
+
+def resolved(value):
+    future = concurrent.futures.Future()
+    future.set_result(value)
+    return future
+
+
+def failed(error):
+    future = concurrent.futures.Future()
+    future.set_exception(error)
+    return future
+
+
+class FakePool(object):
+    """
+    Pool sem processos: cada job devolve um Future controlado pelo teste.
+    """
+
+    workers = 2
+    max_queue = 4
+    timeout = 0.05
+    stuck = 0
+
+    def __init__(self):
+        self.submitted = []
+        self.abandoned = []
+
+    def submit(self, fn, *args, block=False):
+        future = concurrent.futures.Future()
+        self.submitted.append((fn, args, future))
+        return future
+
+    def abandon(self, future):
+        self.abandoned.append(future)
+        return False
+
+
+@pytest.fixture
+def batches():
+    return []
+
+
+def make_batcher(sizes, process=None, **kwargs):
+    process = process or (lambda items: [item * 10 for item in items])
+    return MicroBatcher(process, on_batch=lambda size, seconds: sizes.append(size), **kwargs)
+
+
+def test_micro_batcher_flushes_when_batch_is_full(batches):
+    batcher = make_batcher(batches, max_batch=3, max_wait=30)
+    try:
+        futures = [batcher.submit(n) for n in range(3)]
+        assert [f.result(timeout=5) for f in futures] == [0, 10, 20]
+        assert batches == [3]
+    finally:
+        batcher.close()
+
+
+def test_micro_batcher_flushes_after_max_wait(batches):
+    batcher = make_batcher(batches, max_batch=16, max_wait=0.05)
+    try:
+        futures = [batcher.submit(n) for n in range(2)]
+        assert [f.result(timeout=5) for f in futures] == [0, 10]
+        assert batches == [2]
+    finally:
+        batcher.close()
+
+
+def test_micro_batcher_fails_every_member_when_batch_fails(batches):
+    def process(items):
+        raise RuntimeError('lote inválido')
+
+    batcher = make_batcher(batches, process, max_batch=2, max_wait=30)
+    try:
+        futures = [batcher.submit(n) for n in range(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match='lote inválido'):
+                future.result(timeout=5)
+    finally:
+        batcher.close()
+
+
+def test_micro_batcher_skips_members_cancelled_while_waiting(batches):
+    release = threading.Event()
+    processed = []
+
+    def process(items):
+        release.wait(5)
+        processed.extend(items)
+        return items
+
+    batcher = make_batcher(batches, process, max_batch=1, max_wait=0)
+    try:
+        first = batcher.submit('first')
+        waiting = batcher.submit('cancelled')
+        last = batcher.submit('last')
+        assert waiting.cancel()
+        release.set()
+        assert last.result(timeout=5) == 'last'
+        assert first.result() == 'first'
+        assert processed == ['first', 'last']
+    finally:
+        batcher.close()
+
+
+def test_chain_resolves_with_the_second_future():
+    outer = chain(resolved(2), lambda value: resolved(value * 3))
+    assert outer.result(timeout=1) == 6
+
+
+def raise_error(value):
+    raise ValueError('decodificação')
+
+
+@pytest.mark.parametrize('first, fn', [
+    (failed(ValueError('decodificação')), lambda value: resolved(value)),
+    (resolved(1), lambda value: failed(ValueError('decodificação'))),
+    (resolved(1), raise_error),
+])
+def test_chain_propagates_errors(first, fn):
+    with pytest.raises(ValueError, match='decodificação'):
+        chain(first, fn).result(timeout=1)
+
+
+def test_cancelling_chain_cancels_the_source():
+    source = concurrent.futures.Future()
+    outer = chain(source, lambda value: resolved(value))
+
+    assert outer.source is source
+    assert outer.cancel()
+    assert source.cancelled()
+
+
+def test_batching_pool_timeout_abandons_the_pool_job():
+    pool = FakePool()
+    batching = BatchingPool(pool, get_genre_model=lambda: None)
+
+    with pytest.raises(concurrent.futures.TimeoutError):
+        batching.run(analyze_file, 'faixa.mp3')
+
+    (fn, args, source), = pool.submitted
+    assert fn is extract_file and args == ('faixa.mp3',)
+    assert pool.abandoned == [source]
+    assert source.cancelled()
+
+
+def test_batching_pool_passes_reused_results_through():
+    pool = FakePool()
+    batching = BatchingPool(pool, get_genre_model=lambda: None)
+
+    future = batching.submit(analyze_file, 'faixa.mp3')
+    # Resultado reaproveitado pela impressão digital: já vem completo.
+    pool.submitted[0][2].set_result({'bpm': 120.0, 'key': 'A Minor'})
+
+    assert future.result(timeout=1) == {'bpm': 120.0, 'key': 'A Minor'}
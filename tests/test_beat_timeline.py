@@ -0,0 +1,95 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+import beat_timeline
+from beat_timeline import TimelineStore
+
+
+def beats(count, start=0.0, step=0.5):
+    rng = np.random.default_rng(count)
+    return {
+        'times': start + step * np.arange(count),
+        'chroma': rng.random((count, 12)),
+        'rms': rng.random(count) * 0.3,
+        'onset': rng.random(count) * 4.0,
+    }
+
+
+def test_shift_moves_times_and_drops_intervals_before_start():
+    original = beats(10)
+    shifted = beat_timeline.shift(original, -1.2)
+
+    np.testing.assert_allclose(shifted['times'], original['times'][3:] - 1.2)
+    np.testing.assert_array_equal(shifted['chroma'], original['chroma'][3:])
+    np.testing.assert_array_equal(shifted['onset'], original['onset'][3:])
+    assert len(beat_timeline.shift(original, 2.0)['times']) == 10
+
+
+def test_encode_decode_round_trip_within_quantization_error():
+    original = beats(150)
+    decoded = beat_timeline.decode(beat_timeline.encode(original))
+
+    # Tempos em ms; croma, RMS e onset em 255 níveis da escala de cada coluna.
+    np.testing.assert_allclose(decoded['times'], original['times'], atol=0.0005)
+    np.testing.assert_allclose(decoded['chroma'], original['chroma'], atol=0.5 / beat_timeline.LEVELS)
+    for column in ('rms', 'onset'):
+        scale = np.max(original[column])
+        tolerance = 0.5 * scale / beat_timeline.LEVELS + 1e-6
+        np.testing.assert_allclose(decoded[column], original[column], atol=tolerance)
+
+
+def test_empty_timeline_round_trip():
+    decoded = beat_timeline.decode(beat_timeline.encode(beats(0)))
+    assert len(decoded['times']) == 0 and decoded['chroma'].shape == (0, 12)
+
+
+def test_block_range_decodes_from_header_and_index():
+    original = beats(150)
+    data = beat_timeline.encode(original)
+    header = beat_timeline.read_header(data)
+    assert (header['count'], header['blocks']) == (150, 3)
+
+    # Só o segundo bloco, como faria um cliente com um pedido Range.
+    ends = np.frombuffer(data, dtype='<u4', count=header['blocks'], offset=beat_timeline.HEADER.size)
+    block = data[header['data_offset'] + int(ends[0]):header['data_offset'] + int(ends[1])]
+    payload = zlib.decompress(block)
+    n = header['block_size']
+    times = np.frombuffer(payload, dtype='<u4', count=n) / 1000.0
+    onset = np.frombuffer(payload, dtype=np.uint8, count=n, offset=17 * n)
+    onset = onset * (header['onset_scale'] / beat_timeline.LEVELS)
+
+    decoded = beat_timeline.decode(data)
+    np.testing.assert_array_equal(times, decoded['times'][n:2 * n])
+    np.testing.assert_array_equal(onset, decoded['onset'][n:2 * n])
+
+
+def test_truncated_or_corrupt_header_is_rejected():
+    data = beat_timeline.encode(beats(10))
+
+    with pytest.raises(struct.error):
+        beat_timeline.read_header(data[:beat_timeline.HEADER.size - 1])
+    with pytest.raises(ValueError, match='inválido'):
+        beat_timeline.decode(b'XXXX' + data[4:])
+    with pytest.raises(ValueError, match='Versão'):
+        beat_timeline.decode(data[:4] + bytes([beat_timeline.FORMAT_VERSION + 1]) + data[5:])
+    with pytest.raises(zlib.error):
+        beat_timeline.decode(data[:-5])
+
+
+def test_store_keeps_the_longer_timeline(tmp_path):
+    store = TimelineStore(str(tmp_path))
+    assert store.load('track') is None
+
+    assert store.save('track', beats(40))
+    assert not store.save('track', beats(20))
+    assert len(store.load('track')['times']) == 40
+    assert store.find('track', 'bar') is not None
+
+    # Um arquivo corrompido é substituído.
+    with open(store.path('track'), 'wb') as f:
+        f.write(b'corrompido')
+    assert store.save('track', beats(20))
+    assert len(store.load('track')['times']) == 20
@@ -0,0 +1,101 @@
+import io
+
+import pytest
+
+import cache
+from cache import AnalysisCache, hash_bytes, hash_stream
+
+
+class Clock(object):
+    """
+    Relógio manual para controlar os tempos de criação e acesso do cache.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    return clock
+
+
+def make_cache(tmp_path, **kwargs):
+    return AnalysisCache(str(tmp_path / 'analysis.sqlite'), **kwargs)
+
+
+def test_memory_layer_evicts_least_recently_used(tmp_path, clock):
+    analysis = make_cache(tmp_path, max_memory_entries=2)
+    analysis.set('a', {'bpm': 1})
+    analysis.set('b', {'bpm': 2})
+    analysis.get('a')
+    analysis.set('c', {'bpm': 3})
+
+    assert list(analysis._memory) == ['a', 'c']
+    # Fora da memória, a entrada ainda vem do disco.
+    assert analysis.get('b') == {'bpm': 2}
+
+
+def test_disk_layer_evicts_least_recently_accessed(tmp_path, clock):
+    analysis = make_cache(tmp_path, max_memory_entries=0, max_disk_entries=2)
+    analysis.set('a', {'bpm': 1})
+    clock.now += 1
+    analysis.set('b', {'bpm': 2})
+    clock.now += 1
+    analysis.get('a')
+    clock.now += 1
+    analysis.set('c', {'bpm': 3})
+
+    assert analysis.get('a') == {'bpm': 1}
+    assert analysis.get('b') is None
+    assert analysis.get('c') == {'bpm': 3}
+
+
+def test_entries_expire_after_max_age(tmp_path, clock):
+    analysis = make_cache(tmp_path, max_age=60)
+    analysis.set('a', {'bpm': 1})
+    clock.now += 30
+    assert analysis.get('a') == {'bpm': 1}
+
+    clock.now += 31
+    assert analysis.get('a') is None
+    assert make_cache(tmp_path, max_age=60).get('a') is None
+
+
+def test_set_removes_expired_entries_from_disk(tmp_path, clock):
+    analysis = make_cache(tmp_path, max_age=60)
+    analysis.set('old', {'bpm': 1})
+    clock.now += 61
+    analysis.set('new', {'bpm': 2})
+
+    with analysis._connect() as conn:
+        keys = [row[0] for row in conn.execute('SELECT key FROM entries')]
+    assert keys == ['new']
+
+
+def test_entries_persist_across_instances(tmp_path, clock):
+    make_cache(tmp_path).set('a', {'bpm': 120.0, 'key': 'C Major'})
+
+    assert make_cache(tmp_path).get('a') == {'bpm': 120.0, 'key': 'C Major'}
+    assert make_cache(tmp_path).get('missing') is None
+
+
+def test_hash_stream_matches_hash_bytes_and_rewinds():
+    data = bytes(range(256)) * 1000
+    stream = io.BytesIO(data)
+
+    assert hash_stream(stream, chunk_size=1000) == hash_bytes(data)
+    assert stream.tell() == 0
+
+
+def test_make_key_sorts_params():
+    key = AnalysisCache.make_key('abc', window='start', profile='fast', version=2)
+
+    assert key == 'abc?profile=fast&version=2&window=start'
+    assert key == AnalysisCache.make_key('abc', version=2, profile='fast', window='start')
+    assert key != AnalysisCache.make_key('abc', window='middle', profile='fast', version=2)
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from downloads import HIT, MISS, DownloadCache, DownloadFailed
+
+
+class FakeExtractor(object):
+    """
+    Extrator local: grava `size` bytes no caminho de saída pedido.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.calls = 0
+
+    def __call__(self, options):
+        self.options = options
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=True):
+        self.calls += 1
+        path = self.options['outtmpl'].replace('%(ext)s', 'webm')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * self.size)
+        return {'title': url, 'id': url[-11:], 'requested_downloads': [{'filepath': path}]}
+
+
+def url(n):
+    return f'https://www.youtube.com/watch?v=video{n:06d}'
+
+
+def make_cache(tmp_path, min_age):
+    extractor = FakeExtractor(100)
+    return DownloadCache(str(tmp_path), max_bytes=250, extractor=extractor, min_age=min_age), extractor
+
+
+def test_get_downloads_once_and_then_hits(tmp_path):
+    cache, extractor = make_cache(tmp_path, min_age=0)
+    entry, status = cache.get(url(1), 'native')
+    assert status == MISS
+    assert cache.get(url(1), 'native') == (entry, HIT)
+    assert extractor.calls == 1
+
+
+def test_missing_output_fails_with_format_neutral_message(tmp_path):
+    class EmptyExtractor(FakeExtractor):
+        def extract_info(self, url, download=True):
+            return {'title': url, 'id': url[-11:]}
+
+    cache = DownloadCache(str(tmp_path), extractor=EmptyExtractor(0))
+    with pytest.raises(DownloadFailed, match='Falha ao baixar o áudio.'):
+        cache.get(url(1), 'native')
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache, _ = make_cache(tmp_path, min_age=0)
+    first, _ = cache.get(url(1), 'native')
+    cache.get(url(2), 'native')
+    cache.get(url(1), 'native')
+    cache.get(url(3), 'native')
+
+    assert os.path.exists(tmp_path / first['filename'])
+    assert not os.path.exists(tmp_path / 'video000002-native.webm')
+
+
+def test_keeps_entries_returned_recently(tmp_path):
+    cache, _ = make_cache(tmp_path, min_age=900)
+    entries = [cache.get(url(n), 'native')[0] for n in range(4)]
+
+    # Acima de max_bytes, mas nenhum arquivo devolvido há pouco é removido.
+    for entry in entries:
+        assert os.path.exists(tmp_path / entry['filename'])
+
+    cache.min_age = 0
+    cache.get(url(4), 'native')
+    assert not os.path.exists(tmp_path / entries[0]['filename'])
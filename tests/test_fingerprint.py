@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+import pytest
+
+import fingerprint
+from fingerprint import FP_FRAME_SECONDS, FingerprintIndex, Segment, hash_directory
+
+PARAMS = 'model=none&profile=accurate&version=2&window=start'
+
+
+def random_fingerprint(seed, size=1000):
+    rng = np.random.default_rng(seed)
+    return (rng.integers(0, 1 << fingerprint.HASH_BITS, size, dtype=np.int64),
+            rng.integers(0, 1300, size, dtype=np.int64))
+
+
+@pytest.fixture
+def index(tmp_path):
+    return FingerprintIndex(str(tmp_path / 'fingerprints.sqlite'), compact_rows=0)
+
+
+def test_match_finds_track_and_offset(index):
+    hashes, offsets = random_fingerprint(1)
+    index.add('original', hashes, offsets, 'original.mp3')
+    index.add('other', *random_fingerprint(2))
+
+    matches = index.match(hashes[:600], offsets[:600] + 20)
+
+    assert [m['key'] for m in matches] == ['original']
+    assert matches[0]['label'] == 'original.mp3'
+    assert matches[0]['coverage'] == 1.0
+    assert matches[0]['offset'] == round(20 * FP_FRAME_SECONDS, 2)
+
+
+def test_find_result_requires_minimum_coverage(index):
+    hashes, offsets = random_fingerprint(1)
+    track = index.add('original', hashes, offsets)
+    index.set_result(track, PARAMS, {'bpm': 120.0})
+
+    # Um trecho em comum: 10% dos hashes da consulta vêm da faixa indexada.
+    other_hashes, other_offsets = random_fingerprint(3)
+    shared = np.concatenate([hashes[:100], other_hashes[:900]])
+    shared_offsets = np.concatenate([offsets[:100], other_offsets[:900]])
+    matches = index.match(shared, shared_offsets)
+    assert matches and matches[0]['key'] == 'original'
+    assert matches[0]['coverage'] < fingerprint.MIN_REUSE_COVERAGE
+    assert index.find_result(shared, shared_offsets, PARAMS) == (None, None)
+
+    # Uma recodificação: metade dos hashes sobrevive.
+    encoded = np.concatenate([hashes[:500], other_hashes[:500]])
+    encoded_offsets = np.concatenate([offsets[:500], other_offsets[:500]])
+    match, value = index.find_result(encoded, encoded_offsets, PARAMS)
+    assert match['key'] == 'original'
+    assert value == {'bpm': 120.0}
+
+
+def test_find_result_ignores_other_params(index):
+    hashes, offsets = random_fingerprint(1)
+    index.set_result(index.add('original', hashes, offsets), PARAMS, {'bpm': 120.0})
+    assert index.find_result(hashes, offsets, PARAMS.replace('accurate', 'fast')) == (None, None)
+
+
+def test_compacted_segment_matches_like_recent_rows(index):
+    fingerprints = {f'track-{n}': random_fingerprint(n) for n in range(5)}
+    for key, (hashes, offsets) in fingerprints.items():
+        index.add(key, hashes, offsets)
+    before = [index.match(*fp)[0]['key'] for fp in fingerprints.values()]
+
+    assert index.compact()
+
+    assert index.stats()['recent_postings'] == 0
+    after = [index.match(*fp)[0]['key'] for fp in fingerprints.values()]
+    assert before == after == list(fingerprints)
+
+
+def test_add_many_writes_straight_to_segment(index):
+    index.add('recent', *random_fingerprint(10))
+    ids = index.add_many([(f'track-{n}', *random_fingerprint(n), None) for n in range(3)])
+
+    assert len(set(ids)) == 3
+    assert index.add_many([('track-0', *random_fingerprint(0), None)]) == ids[:1]
+    stats = index.stats()
+    assert stats == {'tracks': 4, 'segment_postings': 4000, 'recent_postings': 0}
+    for key, seed in (('recent', 10), ('track-1', 1)):
+        assert index.match(*random_fingerprint(seed))[0]['key'] == key
+
+
+def test_hash_directory_matches_searchsorted():
+    hashes = np.sort(np.random.default_rng(0).integers(0, 1 << fingerprint.HASH_BITS, 5000))
+    starts = hash_directory(hashes)
+    probe = np.concatenate([hashes[::50], [0, (1 << fingerprint.HASH_BITS) - 1]])
+    np.testing.assert_array_equal(starts[probe], np.searchsorted(hashes, probe, side='left'))
+    np.testing.assert_array_equal(starts[probe + 1], np.searchsorted(hashes, probe, side='right'))
+
+
+def test_segment_without_directory_falls_back_to_search(index):
+    hashes, offsets = random_fingerprint(1)
+    index.add('original', hashes, offsets)
+    index.compact()
+    segment_dir = os.path.join(index.segments_dir, os.listdir(index.segments_dir)[0])
+    with_directory = Segment(segment_dir).lookup(hashes[:50], offsets[:50])
+
+    os.remove(os.path.join(segment_dir, 'directory.npy'))
+    without = Segment(segment_dir).lookup(hashes[:50], offsets[:50])
+
+    for a, b in zip(with_directory, without):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,77 @@
+import pytest
+
+from analysis import KEY_NAMES
+from harmonic import CAMELOT_KEYS, HarmonicIndex, camelot, compatible_codes
+
+# Roda de Camelot de referência.
+WHEEL = {
+    'C Major': '8B', 'G Major': '9B', 'D Major': '10B', 'A Major': '11B', 'E Major': '12B',
+    'B Major': '1B', 'F# Major': '2B', 'C# Major': '3B', 'G# Major': '4B', 'D# Major': '5B',
+    'A# Major': '6B', 'F Major': '7B',
+    'A Minor': '8A', 'E Minor': '9A', 'B Minor': '10A', 'F# Minor': '11A', 'C# Minor': '12A',
+    'G# Minor': '1A', 'D# Minor': '2A', 'A# Minor': '3A', 'F Minor': '4A', 'C Minor': '5A',
+    'G Minor': '6A', 'D Minor': '7A',
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return HarmonicIndex(str(tmp_path / 'harmonic.sqlite'))
+
+
+def test_camelot_matches_the_wheel():
+    assert {name: camelot(name) for name in KEY_NAMES} == WHEEL
+    assert len(CAMELOT_KEYS) == 24
+    assert camelot('H Major') is None
+
+
+def test_compatible_codes_wrap_around_the_wheel():
+    assert compatible_codes('12A') == [('12A', 'same'), ('12B', 'relative'),
+                                       ('11A', 'adjacent'), ('1A', 'adjacent')]
+    assert compatible_codes('1B') == [('1B', 'same'), ('1A', 'relative'),
+                                      ('12B', 'adjacent'), ('2B', 'adjacent')]
+
+
+def test_compatible_finds_tracks_in_the_bpm_window(index):
+    index.add_many([
+        ('same', 'A Minor', 121.0, 'same.mp3'),
+        ('relative', 'C Major', 118.5, None),
+        ('adjacent', 'E Minor', 120.0, None),
+        ('adjacent-down', 'D Minor', 122.0, None),
+        ('far-bpm', 'A Minor', 124.0, None),
+        ('clash', 'F# Major', 120.0, None),
+        ('unknown', 'H Minor', 120.0, None),
+    ])
+
+    results = index.compatible('A Minor', 120.0, tolerance=3.0)
+
+    assert [r['key'] for r in results] == ['same', 'relative', 'adjacent', 'adjacent-down']
+    assert results[0] == {'key': 'same', 'label': 'same.mp3', 'camelot': '8A', 'musical_key': 'A Minor',
+                          'bpm': 121.0, 'relation': 'same', 'tempo': 'same', 'bpm_delta': 1.0}
+    assert results[1]['bpm_delta'] == -1.5
+
+
+def test_compatible_includes_half_and_double_time(index):
+    index.add_many([
+        ('half', 'A Minor', 61.0, None),
+        ('double', 'A Minor', 238.0, None),
+        ('same', 'A Minor', 120.0, None),
+    ])
+
+    results = index.compatible('A Minor', 120.0, tolerance=3.0)
+    assert {r['key']: (r['tempo'], r['bpm_delta']) for r in results} == {
+        'same': ('same', 0.0), 'half': ('half', 2.0), 'double': ('double', -1.0)}
+
+    results = index.compatible('A Minor', 120.0, tolerance=3.0, half_double=False)
+    assert [r['key'] for r in results] == ['same']
+
+
+def test_compatible_with_excludes_the_reference_track(index):
+    index.add('reference', 'A Minor', 120.0)
+    index.add('other', 'A Minor', 120.5)
+
+    track, results = index.compatible_with('reference')
+    assert track['camelot'] == '8A'
+    assert [r['key'] for r in results] == ['other']
+    with pytest.raises(KeyError):
+        index.compatible_with('missing')
@@ -0,0 +1,181 @@
+import io
+
+import pytest
+
+import id3
+
+# Quadro MPEG-1 Layer III, 128 kbps, 44,1 kHz, estéreo: 417 bytes.
+MPEG_HEADER = b'\xff\xfb\x90\x00'
+MPEG_FRAME_LENGTH = 417
+
+
+def text_frame(frame_id, text, version=3):
+    data = b'\x00' + text.encode('latin-1')
+    size = id3._to_syncsafe(len(data)) if version == 4 else len(data).to_bytes(4, 'big')
+    return frame_id.encode('latin-1') + size + b'\0\0' + data
+
+
+def binary_frame(frame_id, data):
+    return frame_id.encode('latin-1') + len(data).to_bytes(4, 'big') + b'\0\0' + data
+
+
+def v22_frame(frame_id, data):
+    return frame_id.encode('latin-1') + len(data).to_bytes(3, 'big') + data
+
+
+def tag_bytes(body, version=3, flags=0, padding=0):
+    body += b'\0' * padding
+    return b'ID3' + bytes([version, 0, flags]) + id3._to_syncsafe(len(body)) + body
+
+
+def unsynchronise(body):
+    return body.replace(b'\xff', b'\xff\x00')
+
+
+def audio(frames=40):
+    return (MPEG_HEADER + b'\x55' * (MPEG_FRAME_LENGTH - 4)) * frames
+
+
+def write_file(tmp_path, data, name='song.mp3'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+APIC = binary_frame('APIC', b'\x00image/png\x00\x03\x00' + b'\x89PNG' + b'\xab' * 500)
+
+
+def test_read_tags_v23_text_frames(tmp_path):
+    body = text_frame('TIT2', 'Song') + text_frame('TPE1', 'Artist') + text_frame('TCON', '(13)')
+    path = write_file(tmp_path, tag_bytes(body, padding=64) + audio())
+    assert id3.read_tags(path) == {'title': 'Song', 'artist': 'Artist', 'genre': 'Pop'}
+
+
+def test_read_tags_v24_syncsafe_sizes(tmp_path):
+    body = text_frame('TIT2', 'Quatro', version=4) + text_frame('TDRC', '2021', version=4)
+    path = write_file(tmp_path, tag_bytes(body, version=4) + audio())
+    assert id3.read_tags(path) == {'title': 'Quatro', 'date': '2021'}
+
+
+def test_read_tags_v22_identifiers(tmp_path):
+    body = v22_frame('TT2', b'\x00Old') + v22_frame('TP1', b'\x00Band')
+    path = write_file(tmp_path, tag_bytes(body, version=2) + audio())
+    assert id3.read_tags(path) == {'title': 'Old', 'artist': 'Band'}
+
+
+@pytest.mark.parametrize('version', [2, 3])
+def test_read_tag_with_whole_tag_unsynchronisation(version):
+    if version == 2:
+        body = v22_frame('TT2', b'\x00Caf\xff')
+    else:
+        body = text_frame('TIT2', 'Caf\xff')
+    data = tag_bytes(unsynchronise(body), version=version, flags=0x80)
+    tag = id3.read_tag(io.BytesIO(data + audio(2)))
+    assert tag.frames == [('TIT2', b'\x00Caf\xff')]
+    assert tag.size == len(data)
+
+
+def test_read_tags_falls_back_to_id3v1(tmp_path):
+    v1 = bytearray(b'TAG' + b'\0' * 125)
+    v1[3:9] = b'Titulo'
+    v1[33:39] = b'Artist'
+    v1[126] = 7
+    v1[127] = 17
+    path = write_file(tmp_path, audio() + bytes(v1))
+    assert id3.read_tags(path) == {'title': 'Titulo', 'artist': 'Artist', 'track': '7', 'genre': 'Rock'}
+
+
+def test_probe_reads_stream_properties(tmp_path):
+    path = write_file(tmp_path, tag_bytes(text_frame('TIT2', 'Song')) + audio(frames=100))
+    info = id3.probe(path)
+    stream = info['streams'][0]
+    assert stream['codec_name'] == 'mp3'
+    assert stream['sample_rate'] == '44100'
+    assert stream['bit_rate'] == '128000'
+    assert float(stream['duration']) == pytest.approx(100 * 1152 / 44100, rel=0.01)
+    assert info['format']['tags'] == {'title': 'Song'}
+
+
+def test_probe_returns_none_without_mpeg_frames(tmp_path):
+    path = write_file(tmp_path, tag_bytes(text_frame('TIT2', 'Song')) + b'\x00' * 4096)
+    assert id3.probe(path) is None
+
+
+def test_write_tags_in_place_keeps_other_frames(tmp_path):
+    body = text_frame('TIT2', 'Old') + APIC
+    original_audio = audio()
+    path = write_file(tmp_path, tag_bytes(body, padding=1024) + original_audio)
+    size = len(open(path, 'rb').read())
+
+    id3.write_tags(path, {'title': 'New', 'artist': 'X'})
+
+    data = open(path, 'rb').read()
+    assert len(data) == size  # Coube no espaço da tag atual.
+    assert data.endswith(original_audio)
+    assert id3.read_tags(path) == {'title': 'New', 'artist': 'X'}
+    with open(path, 'rb') as f:
+        frames = dict(id3.read_tag(f, wanted=None).frames)
+    assert frames['APIC'] == APIC[10:]
+
+
+def test_write_tags_rewrites_file_when_tag_grows(tmp_path):
+    original_audio = audio()
+    path = write_file(tmp_path, tag_bytes(text_frame('TIT2', 'Old')) + original_audio)
+
+    id3.write_tags(path, {'comment': 'c' * 4000})
+
+    data = open(path, 'rb').read()
+    assert data.endswith(original_audio)
+    assert id3.read_tags(path) == {'title': 'Old', 'comment': 'c' * 4000}
+
+
+def test_write_tags_to_output_path_leaves_source_untouched(tmp_path):
+    source = tag_bytes(text_frame('TIT2', 'Old') + text_frame('TALB', 'Album')) + audio()
+    path = write_file(tmp_path, source)
+    output = str(tmp_path / 'out.mp3')
+
+    id3.write_tags(path, {'title': 'New', 'album': ''}, output)
+
+    assert open(path, 'rb').read() == source
+    assert id3.read_tags(output) == {'title': 'New'}
+
+
+def test_write_tags_without_existing_tag_updates_id3v1(tmp_path):
+    v1 = b'TAG' + b'Old'.ljust(30, b'\0') + b'\0' * 94 + b'\xff'
+    path = write_file(tmp_path, audio() + v1)
+
+    id3.write_tags(path, {'title': 'New'})
+
+    data = open(path, 'rb').read()
+    assert data.startswith(b'ID3\x03')
+    assert data[-128:-128 + 6] == b'TAGNew'
+    assert id3.read_tags(path) == {'title': 'New'}
+
+
+def test_write_tags_keeps_frames_of_unsynchronised_tag(tmp_path):
+    body = text_frame('TIT2', 'Old') + APIC
+    path = write_file(tmp_path, tag_bytes(unsynchronise(body), flags=0x80) + audio())
+
+    id3.write_tags(path, {'artist': 'X'})
+
+    assert id3.read_tags(path) == {'title': 'Old', 'artist': 'X'}
+    with open(path, 'rb') as f:
+        frames = dict(id3.read_tag(f, wanted=None).frames)
+    assert frames['APIC'] == APIC[10:]
+
+
+@pytest.mark.parametrize('data', [
+    # ID3v2.2 com a flag de compressão (formato nunca definido).
+    tag_bytes(v22_frame('TT2', b'\x00Old'), version=2, flags=0x40),
+    # Quadro do ID3v2.2 sem equivalente no 2.3 (capa PIC).
+    tag_bytes(v22_frame('TT2', b'\x00Old') + v22_frame('PIC', b'\x00PNG\x03\x00' + b'\xab' * 100),
+              version=2),
+    # Quadro criptografado do ID3v2.3.
+    tag_bytes(text_frame('TIT2', 'Old') + b'PRIV' + (5).to_bytes(4, 'big') + b'\x00\x40' + b'\x01' * 5),
+])
+def test_write_tags_refuses_tags_it_cannot_read_completely(tmp_path, data):
+    path = write_file(tmp_path, data + audio())
+
+    with pytest.raises(id3.ID3Error):
+        id3.write_tags(path, {'artist': 'X'})
+    assert open(path, 'rb').read() == data + audio()
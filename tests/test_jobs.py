@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+import jobs
+from jobs import DONE, ERROR, RUNNING, Job, JobStore
+
+
+class Clock(object):
+    """
+    Relógio manual para os tempos de conclusão dos jobs.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jobs.time, 'time', clock)
+    return clock
+
+
+def test_store_prunes_finished_jobs_after_ttl(clock):
+    store = JobStore(ttl=60)
+    finished = store.create('analyze')
+    failed = store.create('analyze')
+    running = store.create('batch')
+    running.start()
+    finished.finish({'bpm': 120.0})
+    failed.fail('erro')
+
+    clock.now += 60
+    store.create('analyze')
+    assert store.get(finished.id) is finished and store.get(failed.id) is failed
+
+    clock.now += 1
+    store.create('analyze')
+    assert store.get(finished.id) is None and store.get(failed.id) is None
+    assert store.get(running.id) is running
+
+
+def test_events_keep_publication_order():
+    job = Job('analyze')
+    job.publish('bpm', 120.0)
+    job.publish('key', 'A Minor')
+    job.finish({'genre': 'rock'})
+    # Depois de concluído, o job não aceita mais eventos.
+    job.publish('energy', 0.5)
+    job.fail('tarde demais')
+
+    events = list(job.events())
+    assert events == [('status', RUNNING), ('bpm', 120.0), ('key', 'A Minor'),
+                      (DONE, {'bpm': 120.0, 'key': 'A Minor', 'genre': 'rock'})]
+    assert list(job.events(start=2)) == events[2:]
+    assert job.status == DONE and job.error is None
+
+
+def test_failed_job_ends_with_error_event():
+    job = Job('download')
+    job.start()
+    job.start()
+    job.fail('Falha ao baixar o áudio.')
+
+    assert list(job.events()) == [('status', RUNNING), (ERROR, 'Falha ao baixar o áudio.')]
+
+
+def test_events_yield_keepalive_while_waiting():
+    job = Job('analyze')
+    stream = job.events(keepalive=0.05)
+
+    assert next(stream) is None
+    assert next(stream) is None
+
+    threading.Timer(0.1, job.publish, args=('bpm', 120.0)).start()
+    events = []
+    while len(events) < 2:
+        event = next(stream)
+        if event is not None:
+            events.append(event)
+    assert events == [('status', RUNNING), ('bpm', 120.0)]
+
+    job.finish({})
+    assert list(stream) == [(DONE, {'bpm': 120.0})]
@@ -0,0 +1,51 @@
+import concurrent.futures
+import os
+import time
+
+import pytest
+
+from workers import AnalysisPool, JobAbandoned
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**kwargs):
+        pools.append(AnalysisPool('modelo-inexistente', **kwargs))
+        return pools[-1]
+
+    yield make
+    for pool in pools:
+        pool.shutdown(wait=False)
+
+
+def test_queued_job_past_timeout_is_discarded_not_stuck(make_pool):
+    stuck = []
+    pool = make_pool(workers=1, max_queue=3, on_stuck=stuck.append)
+    running = pool.submit(time.sleep, 1.5)
+    # Com um processo, o segundo job já foi entregue à fila do executor e
+    # não pode mais ser cancelado.
+    queued = pool.submit(os.getpid)
+    time.sleep(0.5)
+
+    assert not pool.abandon(queued)
+    assert pool.stuck == 0 and stuck == []
+    assert running.result(timeout=10) is None
+    with pytest.raises(JobAbandoned):
+        queued.result(timeout=10)
+    assert pool.run(os.getpid, timeout=10)
+
+
+def test_running_job_past_timeout_recycles_pool(make_pool):
+    stuck = []
+    pool = make_pool(workers=1, on_stuck=stuck.append)
+    hung = pool.submit(time.sleep, 60)
+    time.sleep(0.5)
+
+    assert pool.abandon(hung)
+    assert stuck == [1]
+    with pytest.raises(concurrent.futures.process.BrokenProcessPool):
+        hung.result(timeout=10)
+    assert pool.stuck == 0
+    assert pool.run(os.getpid, timeout=10)
@@ -0,0 +1,406 @@
+import concurrent.futures
+import io
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+
+from analysis import (ANALYSIS_VERSION, DEFAULT_PROFILE, WINDOW_START, analyze_signal, analyze_stream,
+                      extract_features, load_audio, load_audio_bytes, warm_up_kernels)
+from fingerprint import FingerprintIndex, compute_fingerprint, result_params
+from genre import GenreModel
+from metrics import StageTimer
+from startup import ensure_loaded
+
+logger = logging.getLogger(__name__)
+
+# Modelo de gênero mapeado em memória, compartilhado entre os processos.
+_genre_model = None
+# Fila compartilhada para enviar resultados parciais ao processo principal.
+_event_queue = None
+# Índice de impressões digitais (somente consulta; o processo principal grava).
+_fingerprints = None
+# Estado e pid de cada job do pool, compartilhados com o processo principal
+# (posição: id do job % JOB_SLOTS).
+_job_states = None
+_job_pids = None
+
+# Posições da tabela de estado dos jobs; limita os jobs aceitos de uma vez.
+JOB_SLOTS = 4096
+JOB_QUEUED, JOB_RUNNING, JOB_ABANDONED = 0, 1, 2
+
+
+def _init_worker(model_path, event_queue=None, warm_up=False, fingerprint_path=None,
+                 job_states=None, job_pids=None):
+    """
+    Inicializa um processo de trabalho: importa a librosa e carrega o modelo.
+    Com `warm_up`, compila os kernels numba antes de aceitar o primeiro job.
+    """
+    global _genre_model, _event_queue, _fingerprints, _job_states, _job_pids
+    _event_queue = event_queue
+    _job_states = job_states
+    _job_pids = job_pids
+    if fingerprint_path:
+        _fingerprints = FingerprintIndex(fingerprint_path)
+    # Conclui a importação adiada da librosa antes do primeiro job.
+    ensure_loaded('librosa')
+
+    _genre_model = GenreModel(model_path)
+    if warm_up:
+        warm_up_kernels(_genre_model)
+        logger.debug(f'Kernels da análise aquecidos no processo {os.getpid()}.')
+
+
+def _ping():
+    return os.getpid()
+
+
+def _run_job(job_id, fn, *args):
+    """
+    Executa um job do pool no processo de trabalho, marcando-o como em
+    execução com o pid do processo. Um job desistido enquanto aguardava na
+    fila do executor é descartado sem executar.
+    """
+    if _job_states is not None:
+        slot = job_id % JOB_SLOTS
+        with _job_states.get_lock():
+            if _job_states[slot] == JOB_ABANDONED:
+                raise JobAbandoned('Job descartado após o tempo limite.')
+            _job_states[slot] = JOB_RUNNING
+            _job_pids[slot] = os.getpid()
+    return fn(*args)
+
+
+def _publisher(token):
+    if token is None or _event_queue is None:
+        return None
+    return lambda name, value: _event_queue.put((token, name, value))
+
+
+def _current_model():
+    # Recarrega o modelo se o arquivo foi substituído desde o último job.
+    if _genre_model is not None:
+        _genre_model.maybe_reload()
+    return _genre_model
+
+
+def _match_fingerprint(y, sr, profile, window, timer):
+    """
+    Calcula a impressão digital do sinal e procura no índice uma gravação
+    igual (outra codificação do mesmo áudio) já analisada com os mesmos
+    parâmetros. Retorna (impressão digital, correspondência, resultado).
+    """
+    if _fingerprints is None:
+        return None, None, None
+    try:
+        with timer.stage('fingerprint'):
+            hashes, offsets = compute_fingerprint(y, sr)
+            model = _current_model()
+            params = result_params(
+                profile=profile,
+                window=window,
+                model=model.version if model is not None else 'none',
+                version=ANALYSIS_VERSION
+            )
+            match, value = _fingerprints.find_result(hashes, offsets, params)
+    except Exception:
+        logger.exception('Erro ao consultar o índice de impressões digitais.')
+        return None, None, None
+    return {'hashes': hashes.tolist(), 'offsets': offsets.tolist()}, match, value
+
+
+def _run_analysis(load, token, batched=False, profile=DEFAULT_PROFILE, window=WINDOW_START):
+    timer = StageTimer()
+    with timer.stage('decode'):
+        y, sr, offset = load()
+    fingerprint, match, value = _match_fingerprint(y, sr, profile, window, timer)
+    if match is not None:
+        # Mesma gravação já analisada: reaproveita o resultado.
+        publish = _publisher(token)
+        if publish:
+            for name, item in value.items():
+                publish(name, item)
+        result = dict(value)
+        result['fingerprint_match'] = {key: match[key] for key in ('key', 'label', 'score', 'coverage', 'offset')}
+    elif batched:
+        result = extract_features(y, sr, on_feature=_publisher(token), timer=timer, start=offset)
+    else:
+        result = analyze_signal(y, sr, _current_model(), on_feature=_publisher(token), timer=timer,
+                                start=offset)
+    if fingerprint is not None and match is None:
+        result['fingerprint'] = fingerprint
+    result['audio_duration'] = len(y) / sr
+    result['timings'] = timer.timings
+    return result
+
+
+def _run_stream_analysis(source, profile, token):
+    timer = StageTimer()
+    result = analyze_stream(source, _current_model(), profile=profile,
+                            on_feature=_publisher(token), timer=timer)
+    result['audio_duration'] = result['duration']
+    result['timings'] = timer.timings
+    return result
+
+
+def analyze_file(path, profile=DEFAULT_PROFILE, window=WINDOW_START, token=None):
+    """
+    Job executado no processo de trabalho: carrega o áudio e o analisa.
+    Com `token`, cada característica é publicada assim que calculada.
+    O resultado inclui a duração de cada estágio em 'timings'.
+    """
+    return _run_analysis(lambda: load_audio(path, profile=profile, window=window), token,
+                         profile=profile, window=window)
+
+
+def analyze_bytes(data, suffix, profile=DEFAULT_PROFILE, window=WINDOW_START, token=None):
+    """
+    Job executado no processo de trabalho para áudio recebido em memória.
+    """
+    return _run_analysis(lambda: load_audio_bytes(data, suffix, profile=profile, window=window), token,
+                         profile=profile, window=window)
+
+
+def extract_file(path, profile=DEFAULT_PROFILE, window=WINDOW_START, token=None):
+    """
+    Variante de analyze_file para o micro-batching: devolve as características
+    por faixa e os vetores de croma e MFCC, sem tonalidade nem gênero.
+    """
+    return _run_analysis(lambda: load_audio(path, profile=profile, window=window), token, batched=True,
+                         profile=profile, window=window)
+
+
+def extract_bytes(data, suffix, profile=DEFAULT_PROFILE, window=WINDOW_START, token=None):
+    """
+    Variante de analyze_bytes para o micro-batching.
+    """
+    return _run_analysis(lambda: load_audio_bytes(data, suffix, profile=profile, window=window), token,
+                         batched=True, profile=profile, window=window)
+
+
+def analyze_full_file(path, profile=DEFAULT_PROFILE, token=None):
+    """
+    Job que analisa a faixa inteira em blocos, com memória constante.
+    """
+    return _run_stream_analysis(path, profile, token)
+
+
+def analyze_full_bytes(data, profile=DEFAULT_PROFILE, token=None):
+    """
+    Job que analisa em blocos a faixa inteira recebida em memória.
+    """
+    return _run_stream_analysis(io.BytesIO(data), profile, token)
+
+
+def fingerprint_bytes(data, suffix, profile=DEFAULT_PROFILE, window=WINDOW_START, token=None):
+    """
+    Job que só decodifica o áudio e calcula a impressão digital, para a
+    busca de gravações iguais (/similar).
+    """
+    y, sr, _ = load_audio_bytes(data, suffix, profile=profile, window=window)
+    hashes, offsets = compute_fingerprint(y, sr)
+    return {'hashes': hashes.tolist(), 'offsets': offsets.tolist()}
+
+
+# Jobs cuja etapa final (tonalidade e gênero) pode ser feita em lote.
+BATCHED_JOBS = {analyze_file: extract_file, analyze_bytes: extract_bytes}
+
+
+class PoolFullError(Exception):
+    """
+    Levantada quando a fila de análise atingiu a profundidade máxima.
+    """
+
+
+class JobAbandoned(Exception):
+    """
+    Levantada para um job que passou do tempo limite antes de começar.
+    """
+
+
+class AnalysisPool(object):
+    """
+    Pool de processos pré-criados para a análise de áudio, com fila limitada,
+    tempo limite por job e rejeição imediata quando a fila está cheia.
+
+    Um job em execução não pode ser interrompido no tempo limite: o processo
+    e a vaga ficam presos até ele terminar. Esses jobs são contados (e
+    informados a `on_stuck(presos)`); quando todos os processos estão
+    presos, o pool é reciclado. O processo de trabalho marca cada job ao
+    começá-lo, para distinguir os jobs em execução dos que aguardam na fila
+    do executor.
+    """
+
+    def __init__(self, model_path, workers=None, max_queue=None, timeout=120, warm_up=False,
+                 fingerprint_path=None, on_stuck=None):
+        self.workers = workers or os.cpu_count() or 1
+        # Jobs aceitos de uma vez (em execução + aguardando).
+        self.max_queue = max_queue or self.workers * 2
+        if self.max_queue > JOB_SLOTS:
+            raise ValueError(f'max_queue deve ser no máximo {JOB_SLOTS}.')
+        self.timeout = timeout
+        self.on_stuck = on_stuck
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._context = multiprocessing.get_context()
+        self._events = self._context.Queue()
+        self._listeners = {}
+        self._listeners_lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._job_states = self._context.Array('b', JOB_SLOTS)
+        self._job_pids = self._context.Array('i', JOB_SLOTS, lock=False)
+        self._initargs = (model_path, self._events, warm_up, fingerprint_path,
+                          self._job_states, self._job_pids)
+        # Jobs presos e o pid do processo que ocupam.
+        self._stuck = {}
+        self._executor_lock = threading.Lock()
+        self._executor = self._start_executor()
+        self._closed = False
+        threading.Thread(target=self._dispatch_events, daemon=True).start()
+        # Força a criação de todos os processos antes da primeira requisição.
+        pids = {f.result() for f in [self._executor.submit(_ping) for _ in range(self.workers)]}
+        logger.debug(f'Pool de análise iniciado com {len(pids)} processo(s).')
+
+    def _start_executor(self):
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=self._initargs
+        )
+
+    def submit(self, fn, *args, block=False):
+        """
+        Enfileira um job e retorna o Future; levanta PoolFullError se não há
+        vaga, ou aguarda uma vaga quando `block` é verdadeiro.
+        """
+        if not self._slots.acquire(blocking=block):
+            raise PoolFullError('Fila de análise cheia.')
+        job_id = next(self._job_ids)
+        with self._job_states.get_lock():
+            self._job_states[job_id % JOB_SLOTS] = JOB_QUEUED
+        try:
+            with self._executor_lock:
+                future = self._executor.submit(_run_job, job_id, fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.job_id = job_id
+        # A vaga só é liberada quando o processo termina o job, mesmo após
+        # um timeout, para que a fila reflita a carga real dos processos.
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def subscribe(self, token, callback):
+        """
+        Registra `callback(nome, valor)` para os eventos publicados com `token`.
+        """
+        with self._listeners_lock:
+            self._listeners[token] = callback
+
+    def unsubscribe(self, token):
+        with self._listeners_lock:
+            self._listeners.pop(token, None)
+
+    def _dispatch_events(self):
+        while not self._closed:
+            try:
+                token, name, value = self._events.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            with self._listeners_lock:
+                callback = self._listeners.get(token)
+            if callback:
+                try:
+                    callback(name, value)
+                except Exception:
+                    logger.exception('Erro ao repassar evento da análise.')
+
+    def run(self, fn, *args, timeout=None):
+        """
+        Executa um job e aguarda o resultado até o tempo limite.
+        """
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except concurrent.futures.TimeoutError:
+            self.abandon(future)
+            raise
+
+    @property
+    def stuck(self):
+        """
+        Jobs que passaram do tempo limite e ainda ocupam um processo.
+        """
+        with self._executor_lock:
+            return len(self._stuck)
+
+    def abandon(self, future):
+        """
+        Desiste de um job que passou do tempo limite. Ainda na fila, ele é
+        cancelado ou, se já foi entregue ao executor, descartado ao chegar ao
+        processo; em execução, passa a contar como preso até terminar.
+        Retorna True se o job ficou preso.
+        """
+        if future.cancel() or future.done():
+            return False
+        slot = future.job_id % JOB_SLOTS
+        with self._job_states.get_lock():
+            running = self._job_states[slot] == JOB_RUNNING
+            if not running:
+                self._job_states[slot] = JOB_ABANDONED
+            pid = self._job_pids[slot]
+        if not running:
+            logger.debug('Job da análise excedeu o tempo limite antes de começar; será descartado.')
+            return False
+        with self._executor_lock:
+            self._stuck[future] = pid
+            stuck = len(self._stuck)
+        future.add_done_callback(self._unstick)
+        logger.warning(f'Job da análise excedeu o tempo limite e continua em execução: '
+                       f'{stuck} de {self.workers} processo(s) preso(s).')
+        if self.on_stuck:
+            self.on_stuck(stuck)
+        if stuck >= self.workers:
+            self._recycle()
+        return True
+
+    def _unstick(self, future):
+        with self._executor_lock:
+            self._stuck.pop(future, None)
+
+    def _recycle(self):
+        """
+        Substitui o executor quando todos os processos estão presos: os
+        processos dos jobs presos (todos os do executor) são encerrados, o
+        que conclui esses jobs (e os que aguardavam na fila) com
+        BrokenProcessPool e devolve as vagas.
+        """
+        with self._executor_lock:
+            if self._closed or len(self._stuck) < self.workers:
+                return
+            old = self._executor
+            pids = set(self._stuck.values())
+            self._executor = self._start_executor()
+            self._stuck.clear()
+        logger.error(f'Todos os processos da análise presos; reciclando o pool ({len(pids)} processo(s)).')
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        old.shutdown(wait=False, cancel_futures=True)
+        # Cria os processos novos sem esperar o aquecimento.
+        with self._executor_lock:
+            for _ in range(self.workers):
+                self._executor.submit(_ping)
+
+    def shutdown(self, wait=True):
+        self._closed = True
+        with self._executor_lock:
+            executor = self._executor
+        executor.shutdown(wait=wait, cancel_futures=True)